@@ -0,0 +1,240 @@
+import asyncio
+import atexit
+import os
+import logging
+import time
+import uuid
+from dotenv import load_dotenv
+from chroma_client import ChromaDBClient
+from retrieval_cache import RetrievalCache
+from response_cache import ResponseCache
+from token_budget import TokenBudget
+from chat_roles import ChatRole
+from prompts import SYSTEM_MESSAGE, build_messages, format_context_message
+from azure_ai_chat import (ChatError, create_db_manager, openai_api_version, record_turn_usage, streaming_metrics,
+                           streaming_options, summarize_usage, traced_log)
+from telemetry import get_telemetry
+
+logger = logging.getLogger(__name__)
+
+# Message and usage inserts still running after their turn returned; drained by drain_background_tasks()
+_background_tasks = set()
+
+def initialize_async_clients():
+    """Initialize and return the async Azure OpenAI client plus the ChromaDB and Database clients."""
+    load_dotenv()
+    from openai import AsyncAzureOpenAI
+
+    openai_client = AsyncAzureOpenAI(
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        api_key=os.getenv("AZURE_OPENAI_KEY"),
+        api_version=openai_api_version()
+    )
+
+    # Near-duplicate matching needs a blocking embedding call, so only exact matches are cached here
+    chroma_client = ChromaDBClient(cache=RetrievalCache.from_env())
+    db_manager = create_db_manager()
+
+    return openai_client, chroma_client, db_manager
+
+async def async_get_context(chroma_client, query):
+    """Get relevant context from ChromaDB without blocking the event loop."""
+    documents = await chroma_client.search_async(query)
+    return chroma_client.format_context(documents)
+
+async def async_log_message(db_manager, message_content, chat_role, sequence, conversation_id=None, trace=None):
+    """Log a message on a worker thread so the event loop keeps serving other conversations."""
+    return await asyncio.to_thread(traced_log, trace, chat_role, db_manager.log_message, message_content, chat_role,
+                                   sequence, conversation_id=conversation_id)
+
+async def async_stream_completion(openai_client, on_token, **request):
+    """
+    Stream a chat completion from the async client and pass each delta to on_token.
+
+    Returns:
+        tuple: (assembled response text, metrics dict)
+    """
+    start = time.perf_counter()
+    first_token_at = None
+    usage = None
+    parts = []
+
+    stream = await openai_client.chat.completions.create(stream=True, **streaming_options(), **request)
+    async for chunk in stream:
+        # The final chunk carries usage, without choices, when stream_options asked for it
+        if getattr(chunk, "usage", None) is not None:
+            usage = chunk.usage
+        # Azure sends content-filter chunks without choices
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+        parts.append(delta)
+        on_token(delta)
+
+    metrics = streaming_metrics(start, first_token_at, time.perf_counter(), len(parts))
+    metrics["usage"] = summarize_usage(usage)
+    logger.info(f"Streaming metrics: {metrics}")
+    return "".join(parts), metrics
+
+async def async_chat_with_ai(openai_client, chroma_client, db_manager, user_input, conversation_history,
+                             conversation_id, on_token=None, response_cache=None, use_cache=True,
+                             token_budget=None, summary_message=None):
+    """
+    Async counterpart of azure_ai_chat.chat_with_ai.
+
+    Retrieval and message logging run concurrently, and the completion request
+    starts as soon as the context is available. Message and usage logging never
+    delays the reply: it finishes in the background after the turn returns, and
+    drain_background_tasks() waits for whatever is still running. Identical
+    requests are answered from response_cache unless use_cache is False. With a
+    token_budget, the oldest history is dropped until the request fits. Failures
+    are returned as a ChatError.
+    """
+    log_tasks = []
+    trace = get_telemetry().start_turn(conversation_id)
+    try:
+        system_message = SYSTEM_MESSAGE
+
+        # Allocation is in-memory; the number is resolved (and seeded if needed) by the insert
+        sequences = db_manager.sequences
+        system_sequence = sequences.allocate(conversation_id)
+
+        # Log a reference to the registered system prompt while ChromaDB is being queried
+        log_tasks.append(asyncio.create_task(
+            asyncio.to_thread(traced_log, trace, ChatRole.SYSTEM, db_manager.log_system_prompt, system_message,
+                              system_sequence, conversation_id)))
+
+        with trace.span("retrieval"):
+            context = await async_get_context(chroma_client, user_input)
+        logger.info(f"Retrieved context: {context}")
+
+        with trace.span("prompt_assembly"):
+            if token_budget is not None:
+                conversation_history = token_budget.fit_history(
+                    build_messages(system_message, context, [], user_input, summary_message), conversation_history)
+            messages = build_messages(system_message, context, conversation_history, user_input, summary_message)
+
+        context_message = format_context_message(context) if context else None
+        if context:
+            log_tasks.append(asyncio.create_task(
+                async_log_message(db_manager, context_message, ChatRole.SYSTEM,
+                                  sequences.allocate(conversation_id), conversation_id, trace)))
+
+        log_tasks.append(asyncio.create_task(
+            async_log_message(db_manager, user_input, ChatRole.USER, sequences.allocate(conversation_id),
+                              conversation_id, trace)))
+
+        request = {
+            "model": os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
+            "messages": messages,
+            "temperature": 0.7,
+            "max_tokens": 800,
+        }
+
+        cache = response_cache if use_cache else None
+        ai_response = None
+        if cache is not None:
+            with trace.span("response_cache") as attributes:
+                ai_response = await asyncio.to_thread(cache.get, request)
+                attributes["hit"] = ai_response is not None
+        if ai_response is not None:
+            logger.info("Response served from cache")
+            if on_token is not None:
+                on_token(ai_response)
+        else:
+            completion_start = time.perf_counter()
+            with trace.span("completion", streamed=on_token is not None) as attributes:
+                if on_token is not None:
+                    ai_response, metrics = await async_stream_completion(openai_client, on_token, **request)
+                    usage = metrics["usage"]
+                    if metrics["time_to_first_token"] is not None:
+                        attributes["time_to_first_token_ms"] = round(metrics["time_to_first_token"] * 1000, 3)
+                else:
+                    response = await openai_client.chat.completions.create(**request)
+                    ai_response = response.choices[0].message.content
+                    usage = summarize_usage(response.usage)
+                    logger.info(f"Token usage: {usage}")
+            log_tasks.append(asyncio.create_task(asyncio.to_thread(
+                record_turn_usage, db_manager, request["model"], usage, time.perf_counter() - completion_start,
+                messages, ai_response, conversation_id, trace.turn_id, context_message, token_budget)))
+            if cache is not None:
+                await asyncio.to_thread(cache.put, request, ai_response)
+
+        # Log AI response to database
+        log_tasks.append(asyncio.create_task(
+            async_log_message(db_manager, ai_response, ChatRole.ASSISTANT, sequences.allocate(conversation_id),
+                              conversation_id, trace)))
+
+        return ai_response
+    except Exception as e:
+        return ChatError(f"An error occurred: {str(e)}")
+    finally:
+        # The trace is finished once its log_message spans are in
+        task = asyncio.create_task(_finish_turn(log_tasks, trace))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+async def _finish_turn(log_tasks, trace):
+    if log_tasks:
+        await asyncio.gather(*log_tasks, return_exceptions=True)
+    trace.finish()
+
+async def drain_background_tasks():
+    """Wait for the logging of every finished turn to complete, e.g. before closing the database."""
+    while _background_tasks:
+        await asyncio.gather(*list(_background_tasks), return_exceptions=True)
+
+async def async_main():
+    """Run the chat REPL on the asyncio pipeline."""
+    logger.info("Initializing async Azure OpenAI Chat with ChromaDB and SQL Server integration...")
+    openai_client, chroma_client, db_manager = initialize_async_clients()
+    atexit.register(db_manager.close)
+
+    response_cache = ResponseCache.from_env()
+    token_budget = TokenBudget.from_env()
+
+    print("\nWelcome to Azure AI Chat!")
+    print("Type 'exit' to end the conversation.\n")
+    logger.info("Async application started successfully")
+
+    conversation_history = []
+    conversation_id = uuid.uuid4().hex
+
+    try:
+        while True:
+            user_input = (await asyncio.to_thread(input, "\nYou: ")).strip()
+
+            if user_input.lower() == 'exit':
+                print("\nGoodbye!")
+                logger.info("User ended the session")
+                break
+
+            if not user_input:
+                print("Please enter a message.")
+                continue
+
+            ai_response = await async_chat_with_ai(openai_client, chroma_client, db_manager, user_input,
+                                                   conversation_history, conversation_id,
+                                                   response_cache=response_cache, token_budget=token_budget)
+            print("\nAI:", ai_response)
+            logger.info(f"AI response: {ai_response}")
+
+            # Failed turns are left out so the model never sees error text
+            if isinstance(ai_response, ChatError):
+                continue
+            conversation_history.append({"role": "user", "content": user_input})
+            conversation_history.append({"role": "assistant", "content": ai_response})
+            conversation_history = token_budget.trim_history(conversation_history)
+    finally:
+        await drain_background_tasks()
+        await chroma_client.aclose()
+        await openai_client.close()
+        db_manager.close()
+        get_telemetry().close()
+
+if __name__ == "__main__":
+    asyncio.run(async_main())
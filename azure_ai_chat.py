@@ -1,14 +1,28 @@
 import os
+import atexit
 import logging
 import threading
 import time
-from openai import AzureOpenAI
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from urllib.parse import quote_plus
 from dotenv import load_dotenv
-from chroma_client import ChromaDBClient
-from models import ChatRole
-from db_manager import DatabaseManager
+from retrieval_cache import RetrievalCache
+from response_cache import ResponseCache
+from token_budget import TokenBudget
+from summarizer import ConversationSummarizer
+from session_store import create_session_store
+from chat_roles import ChatRole
+from lazy_client import LazyClient
+from prompts import SYSTEM_MESSAGE, build_messages, format_context_message
+from telemetry import get_telemetry
+from profiling import PROFILE_MODES, TurnProfiler
+
+# openai, requests and SQLAlchemy (via db_manager) are imported where the clients are
+# built, so importing this module and reaching the first prompt stays fast
 
 # Configure logging (file only, no console output)
+os.makedirs('logs', exist_ok=True)
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
@@ -18,125 +32,426 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Message inserts run here so they never sit on a chat turn's critical path
+_log_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("CHAT_LOG_WORKERS", "4")),
+    thread_name_prefix="chat-log"
+)
+
+# Oldest Azure OpenAI API version that accepts stream_options={"include_usage": True}
+_STREAM_USAGE_API_VERSION = "2024-09-01-preview"
+
+class ChatError(str):
+    """
+    Error text returned by chat_with_ai in place of a reply.
+    
+    It is still a str, so it can be printed or sent as is; callers check
+    isinstance() to keep it out of the conversation history.
+    """
+
 def initialize_clients():
     """Initialize and return the Azure OpenAI, ChromaDB, and Database clients."""
+    openai_client = create_openai_client()
+    chroma_client = create_chroma_client(openai_client)
+    chroma_client.connect()
+    db_manager = create_db_manager()
+    
+    return openai_client, chroma_client, db_manager
+
+def initialize_lazy_clients():
+    """
+    Return the Azure OpenAI, ChromaDB, and Database clients as LazyClients.
+    
+    Nothing is imported, connected or created until a client is first used.
+    """
+    openai_client = LazyClient(create_openai_client, "Azure OpenAI")
+    chroma_client = LazyClient(lambda: create_chroma_client(openai_client), "ChromaDB")
+    db_manager = LazyClient(create_db_manager, "database")
+    return openai_client, chroma_client, db_manager
+
+def create_openai_client():
+    """Create the Azure OpenAI client."""
     load_dotenv()
+    from openai import AzureOpenAI
     
-    openai_client = AzureOpenAI(
+    return AzureOpenAI(
         azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
         api_key=os.getenv("AZURE_OPENAI_KEY"),
-        api_version="2024-02-15-preview"
+        api_version=openai_api_version()
     )
+
+def openai_api_version():
+    """Return the Azure OpenAI API version from AZURE_OPENAI_API_VERSION."""
+    return os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview")
+
+def streaming_options():
+    """Return the extra streaming arguments the configured API version supports."""
+    # API versions are dates, optionally suffixed with -preview, so they sort as strings
+    if openai_api_version() >= _STREAM_USAGE_API_VERSION:
+        return {"stream_options": {"include_usage": True}}
+    return {}
+
+def create_chroma_client(openai_client):
+    """Create the ChromaDB client with its retrieval cache."""
+    from chroma_client import ChromaDBClient
     
-    chroma_client = ChromaDBClient()
-    chroma_client.connect()
+    return ChromaDBClient(cache=RetrievalCache.from_env(create_embed_func(openai_client)))
+
+def create_embed_func(openai_client):
+    """Return a function embedding text with the AZURE_OPENAI_EMBEDDING_DEPLOYMENT model, if one is configured."""
+    deployment = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT")
+    if not deployment:
+        return None
     
-    # Initialize database connection
-    connection_string = DatabaseManager.get_connection_string()
-    sqlalchemy_conn_string = f"mssql+pyodbc:///?odbc_connect={connection_string}"
+    def embed(text):
+        return openai_client.embeddings.create(model=deployment, input=text).data[0].embedding
+    
+    return embed
+
+def create_db_manager():
+    """
+    Create the DatabaseManager for the azure_ai_chat database.
+    
+    CHAT_DATABASE_URL overrides the SQL Server connection with any SQLAlchemy URL,
+    e.g. a local SQLite file. Write-behind logging starts here when DB_LOG_MODE
+    is "write_behind".
+    """
+    from db_manager import DatabaseManager
+    
+    sqlalchemy_conn_string = os.getenv("CHAT_DATABASE_URL")
+    if not sqlalchemy_conn_string:
+        connection_string = DatabaseManager.get_connection_string(database="azure_ai_chat")
+        sqlalchemy_conn_string = f"mssql+pyodbc:///?odbc_connect={quote_plus(connection_string)}"
     db_manager = DatabaseManager(sqlalchemy_conn_string, "Azure AI Chat")
     
-    return openai_client, chroma_client, db_manager
+    # Optionally move message inserts off the request path
+    if os.getenv("DB_LOG_MODE", "sync").lower() == "write_behind":
+        db_manager.start_write_behind()
+    return db_manager
 
-def cleanup_thread(db_manager):
-    """Background thread to periodically clean up old messages."""
-    while True:
-        try:
-            deleted = db_manager.cleanup_old_messages()
-            if deleted > 0:
-                logger.info(f"Cleanup thread removed {deleted} old messages")
-            time.sleep(86400)  # Run once per day
-        except Exception as e:
-            logger.error(f"Error in cleanup thread: {str(e)}")
-            time.sleep(3600)  # Wait an hour before retrying on error
+class StartupChecks:
+    """
+    Build the lazily created clients and check connectivity on a background thread.
+    
+    The prompt is shown immediately. By the time the first question is typed, the
+    clients are usually warm; if not, the turn waits for the client it needs. The
+    Azure OpenAI check lists the deployment's models, a cheap authenticated request
+    that catches a wrong endpoint or key before the first question and leaves a
+    warm connection in the client's pool. The maintenance scheduler is started once
+    the database schema has been verified as current.
+    """
+    
+    def __init__(self, openai_client, chroma_client, db_manager, token_budget=None):
+        self.openai_client = openai_client
+        self.chroma_client = chroma_client
+        self.db_manager = db_manager
+        self.token_budget = token_budget
+        self.results = {}
+        self.maintenance = None
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="startup-checks", daemon=True)
+    
+    def start(self):
+        """Start the checks in the background."""
+        self._thread.start()
+        return self
+    
+    def wait(self, timeout=None):
+        """Block until the checks have finished."""
+        self._thread.join(timeout)
+        return self.results
+    
+    def stop(self):
+        """Stop the maintenance scheduler, if it was started."""
+        self._stopped = True
+        if self.maintenance is not None:
+            self.maintenance.stop()
+            logger.info(f"Maintenance stats: {self.maintenance.stats()}")
+    
+    def _run(self):
+        checks = [
+            ("database", self._check_database),
+            ("chromadb", lambda: self.chroma_client.connect()),
+            ("openai", self._check_openai),
+        ]
+        if self.token_budget is not None:
+            checks.append(("tokenizer", lambda: self.token_budget.counter.count_text("warm up") > 0))
+        
+        for name, check in checks:
+            start = time.perf_counter()
+            try:
+                ok = bool(check())
+            except Exception as e:
+                logger.error(f"Startup check {name} failed: {str(e)}")
+                ok = False
+            self.results[name] = ok
+            logger.info(f"Startup check {name}: {'ok' if ok else 'failed'} ({(time.perf_counter() - start) * 1000:.0f} ms)")
+    
+    def _check_database(self):
+        from scheduler import create_maintenance_scheduler
+        
+        db_manager = self.db_manager.get()
+        # Raises on an outdated schema, so no job ever runs against an unmigrated database
+        db_manager.ensure_schema()
+        # Run the retention purge off-peak, on one instance at a time
+        if not self._stopped:
+            self.maintenance = create_maintenance_scheduler(db_manager).start()
+        return True
+    
+    def _check_openai(self):
+        # The copy made by with_options shares the client's connection pool
+        client = self.openai_client.get().with_options(timeout=10, max_retries=0)
+        client.models.list()
+        return True
+
+def log_in_background(db_manager, message_content, chat_role, sequence, conversation_id=None, trace=None):
+    """Submit a message insert to the logging pool and return its future."""
+    return _log_executor.submit(traced_log, trace, chat_role, db_manager.log_message, message_content, chat_role,
+                                sequence, conversation_id=conversation_id)
+
+def traced_log(trace, chat_role, log_func, *args, **kwargs):
+    """Call a message logging function, timed as a log_message span of the turn when trace is given."""
+    if trace is None:
+        return log_func(*args, **kwargs)
+    with trace.span("log_message", role=chat_role.value) as attributes:
+        result = log_func(*args, **kwargs)
+        attributes["ok"] = bool(result)
+        return result
 
 def get_context(chroma_client, query):
     """Get relevant context from ChromaDB."""
     documents = chroma_client.search(query)
     return chroma_client.format_context(documents)
 
-def chat_with_ai(openai_client, chroma_client, db_manager, user_input, conversation_history, message_sequence):
-    """Send a message to the AI and get its response."""
+def stream_completion(openai_client, on_token, **request):
+    """
+    Stream a chat completion and pass each content delta to on_token as it arrives.
+    
+    Args:
+        openai_client: Azure OpenAI client
+        on_token (callable): Called with every text delta
+        **request: Arguments for chat.completions.create
+        
+    Returns:
+        tuple: (assembled response text, metrics dict)
+    """
+    start = time.perf_counter()
+    first_token_at = None
+    usage = None
+    parts = []
+    
+    for chunk in openai_client.chat.completions.create(stream=True, **streaming_options(), **request):
+        # The final chunk carries usage, without choices, when stream_options asked for it
+        if getattr(chunk, "usage", None) is not None:
+            usage = chunk.usage
+        # Azure sends content-filter chunks without choices
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+        parts.append(delta)
+        on_token(delta)
+    
+    metrics = streaming_metrics(start, first_token_at, time.perf_counter(), len(parts))
+    metrics["usage"] = summarize_usage(usage)
+    logger.info(f"Streaming metrics: {metrics}")
+    return "".join(parts), metrics
+
+def streaming_metrics(start, first_token_at, end, tokens):
+    """Compute time-to-first-token and tokens/sec for a streamed completion."""
+    # Each streamed delta carries roughly one token
+    generation_time = end - first_token_at if first_token_at is not None else 0.0
+    return {
+        "time_to_first_token": (first_token_at - start) if first_token_at is not None else None,
+        "total_time": end - start,
+        "tokens": tokens,
+        "tokens_per_sec": tokens / generation_time if generation_time > 0 else None,
+    }
+
+def summarize_usage(usage):
+    """
+    Extract prompt, cached and completion token counts from a response's usage.
+    
+    Returns:
+        dict: Token counts, or an empty dict when the response carried no usage
+    """
+    if usage is None:
+        return {}
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = (getattr(details, "cached_tokens", None) or 0) if details is not None else 0
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "cached_tokens": cached_tokens,
+        "uncached_tokens": usage.prompt_tokens - cached_tokens,
+        "completion_tokens": usage.completion_tokens,
+    }
+
+def record_turn_usage(db_manager, model, usage, latency, messages, ai_response, conversation_id=None,
+                      turn_id=None, context_message=None, token_budget=None):
+    """
+    Store the token usage and latency of one completion in chat_turn_metrics.
+    
+    usage is the summarize_usage() dict of the response. Streamed responses carry no
+    usage on API versions without stream_options (see streaming_options()); their
+    prompt and completion are then counted with token_budget's tokenizer and stored
+    as estimated. The retrieved context is counted the same way, to show what share
+    of the prompt it takes. Meant to run off the critical path.
+    
+    Returns:
+        bool: True if the metrics were written
+    """
+    counter = token_budget.counter if token_budget is not None else None
+    context_tokens = None
+    if counter is not None and context_message:
+        context_tokens = counter.count_message({"role": "system", "content": context_message})
+    
+    estimated = not usage
+    if estimated:
+        if counter is None:
+            logger.debug("Turn usage not recorded: no usage in the response and no tokenizer")
+            return False
+        usage = {
+            "prompt_tokens": counter.count_messages(messages),
+            "cached_tokens": 0,
+            "completion_tokens": counter.count_text(ai_response),
+        }
+    return db_manager.log_turn_metrics(
+        model, usage["prompt_tokens"], usage["cached_tokens"], usage["completion_tokens"], latency,
+        conversation_id=conversation_id, turn_id=turn_id, context_tokens=context_tokens, estimated=estimated,
+    )
+
+def chat_with_ai(openai_client, chroma_client, db_manager, user_input, conversation_history, conversation_id,
+                 on_token=None, response_cache=None, use_cache=True, token_budget=None,
+                 summary_message=None):
+    """
+    Send a message to the AI and get its response.
+    
+    When on_token is given the completion is streamed and each text delta is passed
+    to it as it arrives; the assembled response is still logged and returned once.
+    Identical requests are answered from response_cache unless use_cache is False.
+    With a token_budget, the oldest history is dropped until the request fits.
+    summary_message carries the running summary of turns no longer in the history.
+    Every logged message takes the next sequence number of conversation_id.
+    Failures are returned as a ChatError, even after part of a stream was delivered.
+    """
+    trace = get_telemetry().start_turn(conversation_id)
     try:
-        # Get relevant context from ChromaDB
-        context = get_context(chroma_client, user_input)
-        logger.info(f"Retrieved context: {context}")
+        system_message = SYSTEM_MESSAGE
         
-        # Start with the system message and conversation history
-        system_message = """"###############   Context  ####################################################
-You are an AI assistant that provides commercial loan customers with pricing for loans available through the Federal Home Loan Bank of Indianapolis. 
-#################        Goal          ###############################################
-Your goal is to provide the customer a price based off the Advance products they ask about. 
-##################    Instructions    #############################################
-When you are asked about a price or a loan, you will look to your knowledge base to determine if you can determine how to calculate the loan product. 
-You only price loans for products you are aware of 
-If you cannot find the loan product in your knowledge base, you should politely describe to the customer what loans you are capable of pricing. 
-You can look to your internal knowledge base for a SOFR Rate and FHLB Cost of Funds
-If you cannot find details about the loan product type, do not elaborate. Just politely tell the user you do not know about that product.
-If you do know about the product, you should try to determine the information needed to calculate the loan price by asking the user about the maturity and amount of the loan.
-If you need more information to price the loan, you should ask the user for that information.
-You should not ask the customer about their credit score.
-Once you have everything you need to calculate the loan price, describe how the calculation works for that product. 
-Identify any unclear or ambiguous information in your response and rephrase it for clarity.
-Try to argue against your own output and see if you can find any flaws. If so, address them. Walk me through the process
-"""
+        # Log a reference to the registered system prompt without holding up retrieval
+        sequences = db_manager.sequences
+        _log_executor.submit(traced_log, trace, ChatRole.SYSTEM, db_manager.log_system_prompt, system_message,
+                             sequences.allocate(conversation_id), conversation_id)
+        print(f"Logged SYSTEM message: {system_message[:50]}...")
         
-        messages = [
-            {"role": "system", "content": system_message},
-        ]
+        # Get relevant context from ChromaDB; this is the only step the model call waits on
+        with trace.span("retrieval"):
+            context = get_context(chroma_client, user_input)
+        logger.info(f"Retrieved context: {context}")
         
-        # Log system message to database
-        db_manager.log_message(system_message, ChatRole.SYSTEM, message_sequence)
-        print(f"Logged SYSTEM message: {system_message[:50]}...")
-        message_sequence += 1
+        # Assemble system message, context, history and user input
+        with trace.span("prompt_assembly"):
+            if token_budget is not None:
+                conversation_history = token_budget.fit_history(
+                    build_messages(system_message, context, [], user_input, summary_message), conversation_history)
+            messages = build_messages(system_message, context, conversation_history, user_input, summary_message)
         
-        # Add context if available
+        # Log context and user message in the background
+        context_message = None
         if context:
-            context_message = f"Context: {context}"
-            messages.append({"role": "system", "content": context_message})
-            db_manager.log_message(context_message, ChatRole.SYSTEM, message_sequence)
+            context_message = format_context_message(context)
+            log_in_background(db_manager, context_message, ChatRole.SYSTEM,
+                              sequences.allocate(conversation_id), conversation_id, trace)
             print(f"Logged SYSTEM context message: {context_message[:50]}...")
-            message_sequence += 1
-        
-        # Add conversation history
-        messages.extend(conversation_history)
         
-        # Add current user input
-        messages.append({"role": "user", "content": user_input})
-        
-        # Log user message to database
-        db_manager.log_message(user_input, ChatRole.USER, message_sequence)
+        log_in_background(db_manager, user_input, ChatRole.USER, sequences.allocate(conversation_id), conversation_id, trace)
         print(f"Logged USER message: {user_input[:50]}...")
-        message_sequence += 1
         
-        response = openai_client.chat.completions.create(
-            model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
-            messages=messages,
-            temperature=0.7,
-            max_tokens=800,
-        )
+        request = {
+            "model": os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
+            "messages": messages,
+            "temperature": 0.7,
+            "max_tokens": 800,
+        }
         
-        ai_response = response.choices[0].message.content
+        cache = response_cache if use_cache else None
+        ai_response = None
+        if cache is not None:
+            with trace.span("response_cache") as attributes:
+                ai_response = cache.get(request)
+                attributes["hit"] = ai_response is not None
+        if ai_response is not None:
+            logger.info("Response served from cache")
+            if on_token is not None:
+                on_token(ai_response)
+        else:
+            completion_start = time.perf_counter()
+            with trace.span("completion", streamed=on_token is not None) as attributes:
+                if on_token is not None:
+                    ai_response, metrics = stream_completion(openai_client, on_token, **request)
+                    usage = metrics["usage"]
+                    if metrics["time_to_first_token"] is not None:
+                        attributes["time_to_first_token_ms"] = round(metrics["time_to_first_token"] * 1000, 3)
+                else:
+                    response = openai_client.chat.completions.create(**request)
+                    ai_response = response.choices[0].message.content
+                    usage = summarize_usage(response.usage)
+                    logger.info(f"Token usage: {usage}")
+            _log_executor.submit(record_turn_usage, db_manager, request["model"], usage,
+                                 time.perf_counter() - completion_start, messages, ai_response, conversation_id,
+                                 trace.turn_id, context_message, token_budget)
+            if cache is not None:
+                cache.put(request, ai_response)
         
         # Log AI response to database
-        db_manager.log_message(ai_response, ChatRole.ASSISTANT, message_sequence + 1)
+        log_in_background(db_manager, ai_response, ChatRole.ASSISTANT, sequences.allocate(conversation_id),
+                          conversation_id, trace)
         
         return ai_response
     except Exception as e:
-        return f"An error occurred: {str(e)}"
+        return ChatError(f"An error occurred: {str(e)}")
+    finally:
+        trace.finish()
 
-def main():
+def parse_args(argv=None):
+    """Parse the console app's command-line options."""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Azure AI Chat console")
+    parser.add_argument("--profile", nargs="?", const="cprofile", choices=PROFILE_MODES,
+                        help="Profile chat turns into logs/profiles (default mode: cprofile; overrides CHAT_PROFILE)")
+    parser.add_argument("--profile-turns", type=int,
+                        help="Number of turns to profile (overrides CHAT_PROFILE_MAX_TURNS)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
     """Main function to run the chat application."""
+    args = parse_args(argv)
     logger.info("Initializing Azure OpenAI Chat with ChromaDB and SQL Server integration...")
-    openai_client, chroma_client, db_manager = initialize_clients()
+    openai_client, chroma_client, db_manager = initialize_lazy_clients()
     
-    # Start cleanup thread
-    cleanup_thread_handle = threading.Thread(
-        target=cleanup_thread,
-        args=(db_manager,),
-        daemon=True
-    )
-    cleanup_thread_handle.start()
+    def close_database():
+        if db_manager.peek() is not None:
+            db_manager.peek().close()
+    atexit.register(close_database)
+    
+    # Optional exact-match cache for repeated questions
+    response_cache = ResponseCache.from_env()
+    token_budget = TokenBudget.from_env()
+    
+    # Compress older turns into a running summary instead of dropping them
+    summarizer = ConversationSummarizer.from_env(openai_client, token_budget.counter, db_manager)
+    
+    # Opt-in per-turn profiles (--profile or CHAT_PROFILE)
+    profiler = TurnProfiler.from_env(args.profile, args.profile_turns)
+    if profiler is not None:
+        logger.info(f"Profiling up to {profiler.max_turns} turns ({profiler.mode}) into {profiler.output_dir}")
+    
+    # Create the clients and check connectivity while the user reads the prompt
+    startup_checks = StartupChecks(openai_client, chroma_client, db_manager, token_budget).start()
     
     # Console output for user interaction
     print("\nWelcome to Azure AI Chat!")
@@ -145,9 +460,26 @@ def main():
     # Log the startup
     logger.info("Application started successfully")
     
-    # Initialize conversation history and message sequence
-    conversation_history = []
-    message_sequence = 0
+    # Print tokens as they arrive instead of waiting for the full completion
+    streaming = os.getenv("CHAT_STREAM", "").lower() in ("1", "true", "yes")
+    
+    # Resume the session named by CHAT_SESSION_ID, or start a new one
+    session_store = create_session_store()
+    session_id = os.getenv("CHAT_SESSION_ID")
+    session = session_store.get(session_id) if session_id else None
+    if session is None:
+        session = session_store.create()
+    print(f"Session: {session.session_id}")
+    logger.info(f"Using session {session.session_id}")
+    
+    # Initialize conversation history; the session ID doubles as the conversation ID
+    conversation_history = session.conversation_history
+    conversation_id = session.session_id
+    if summarizer is not None:
+        # Sessions saved before their summary finished only have it in chat_messages
+        if session_id == conversation_id and not session.summary:
+            session.summary = db_manager.get_latest_summary(conversation_id)
+        summarizer.restore(session.summary)
     
     while True:
         user_input = input("\nYou: ").strip()
@@ -155,21 +487,71 @@ def main():
         if user_input.lower() == 'exit':
             print("\nGoodbye!")
             logger.info("User ended the session")
+            startup_checks.stop()
+            _log_executor.shutdown(wait=True)
+            close_database()
+            if chroma_client.peek() is not None and chroma_client.cache is not None:
+                logger.info(f"Retrieval cache stats: {chroma_client.cache.stats()}")
+            if response_cache is not None:
+                logger.info(f"Response cache stats: {response_cache.stats()}")
+            if summarizer is not None:
+                summarizer.close()
+            get_telemetry().close()
             break
         
         if user_input:
-            ai_response = chat_with_ai(openai_client, chroma_client, db_manager, user_input, conversation_history, message_sequence)
-            message_sequence += 2  # Increment by 2 to account for both user and AI messages
-            print("\nAI:", ai_response)
+            if summarizer is not None:
+                conversation_history = summarizer.apply(conversation_history)
+            chat_options = {
+                "response_cache": response_cache,
+                "token_budget": token_budget,
+                "summary_message": summarizer.summary_message() if summarizer is not None else None,
+            }
+            
+            turn_profile = profiler.profile(conversation_id[:8]) if profiler is not None else nullcontext()
+            with turn_profile:
+                if streaming:
+                    streamed = []
+                    
+                    def print_token(token):
+                        # The prefix waits for the first token so the turn's log lines print above it
+                        if not streamed:
+                            print("\nAI: ", end="")
+                        streamed.append(token)
+                        print(token, end="", flush=True)
+                    
+                    ai_response = chat_with_ai(openai_client, chroma_client, db_manager, user_input, conversation_history, conversation_id,
+                                               on_token=print_token, **chat_options)
+                    # Errors are returned rather than streamed, possibly after part of the reply
+                    if not streamed:
+                        print("\nAI:", ai_response)
+                    elif isinstance(ai_response, ChatError):
+                        print(f"\n{ai_response}")
+                    else:
+                        print()
+                else:
+                    ai_response = chat_with_ai(openai_client, chroma_client, db_manager, user_input, conversation_history, conversation_id,
+                                               **chat_options)
+                    print("\nAI:", ai_response)
             logger.info(f"AI response: {ai_response}")
             
-            # Update conversation history
-            conversation_history.append({"role": "user", "content": user_input})
-            conversation_history.append({"role": "assistant", "content": ai_response})
+            # Update conversation history; failed turns are left out so the model never sees error text
+            if not isinstance(ai_response, ChatError):
+                conversation_history.append({"role": "user", "content": user_input})
+                conversation_history.append({"role": "assistant", "content": ai_response})
+            
+            # Summarize older turns in the background once the history grows large
+            if summarizer is not None:
+                summarizer.maybe_summarize(conversation_history, conversation_id)
+            
+            # Keep only as much history as could fit in the input token budget
+            conversation_history = token_budget.trim_history(conversation_history)
             
-            # Keep only the last 10 messages to prevent context window from getting too large
-            if len(conversation_history) > 20:
-                conversation_history = conversation_history[-20:]
+            # Persist the session so it can be resumed
+            session.conversation_history = conversation_history
+            if summarizer is not None:
+                session.summary = summarizer.summary
+            session_store.save(session)
         else:
             print("Please enter a message.")
             logger.info("Empty message received")
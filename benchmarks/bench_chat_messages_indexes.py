@@ -0,0 +1,142 @@
+"""
+Show query plans and timings for the chat_messages read paths before and after the covering indexes.
+
+Usage:
+    python benchmarks/bench_chat_messages_indexes.py [--rows N] [--repeat N]
+
+A temporary SQLite database is filled with --rows synthetic messages spread
+over 14 days, three applications and 20-message conversations. The queries
+used by get_recent_messages, get_transcript, get_latest_summary,
+get_message_count_by_role and cleanup_old_messages are timed and their plans
+printed, first with no secondary indexes and then after apply_migrations()
+has brought the schema to the latest version.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrations import apply_migrations  # noqa: E402
+
+APPLICATIONS = ["Azure AI Chat", "Loan Pricing API", "Batch Summaries"]
+ROLES = ["system", "user", "assistant", "user", "assistant", "summary"]
+MESSAGES_PER_CONVERSATION = 20
+
+
+def load_rows(engine, rows, batch_size=50000):
+    now = datetime.utcnow()
+    span = timedelta(days=14).total_seconds()
+    rng = random.Random(42)
+    inserted = 0
+    with engine.begin() as conn:
+        while inserted < rows:
+            batch = []
+            for n in range(inserted, min(rows, inserted + batch_size)):
+                conversation = n // MESSAGES_PER_CONVERSATION
+                batch.append({
+                    "application_name": APPLICATIONS[conversation % len(APPLICATIONS)],
+                    "chat_role": rng.choice(ROLES),
+                    "sequence": n % MESSAGES_PER_CONVERSATION,
+                    "timestamp": (now - timedelta(seconds=span * (1 - n / rows))).strftime("%Y-%m-%d %H:%M:%S.%f"),
+                    "message_content": f"Synthetic message {n} about a {rng.randint(1, 30)}-year advance",
+                    "conversation_id": f"{conversation:032x}",
+                })
+            conn.execute(text("""
+                INSERT INTO chat_messages
+                    (application_name, chat_role, sequence, timestamp, message_content, conversation_id)
+                VALUES
+                    (:application_name, :chat_role, :sequence, :timestamp, :message_content, :conversation_id)
+            """), batch)
+            inserted += len(batch)
+
+
+def build_queries(rows):
+    cutoff = (datetime.utcnow() - timedelta(days=7)).strftime("%Y-%m-%d %H:%M:%S.%f")
+    conversation_id = f"{(rows // MESSAGES_PER_CONVERSATION) // 2:032x}"
+    return [
+        ("recent messages",
+         "SELECT * FROM chat_messages ORDER BY timestamp DESC LIMIT 100", {}),
+        ("transcript",
+         "SELECT * FROM chat_messages WHERE conversation_id = :conversation_id ORDER BY sequence",
+         {"conversation_id": conversation_id}),
+        ("latest summary",
+         "SELECT * FROM chat_messages WHERE application_name = :application_name AND chat_role = 'summary' "
+         "ORDER BY id DESC LIMIT 1", {"application_name": APPLICATIONS[0]}),
+        # get_message_count_by_role counts every application's messages
+        ("count by role",
+         "SELECT chat_role, COUNT(id) FROM chat_messages GROUP BY chat_role", {}),
+        ("retention scan",
+         "SELECT COUNT(*) FROM chat_messages WHERE timestamp < :cutoff", {"cutoff": cutoff}),
+    ]
+
+
+def run_queries(engine, queries, repeat):
+    results = {}
+    with engine.connect() as conn:
+        for name, sql, params in queries:
+            plan = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params).fetchall()
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                conn.execute(text(sql), params).fetchall()
+                timings.append(time.perf_counter() - start)
+            results[name] = min(timings)
+            print(f"  {name}: {min(timings) * 1000:.2f} ms")
+            for row in plan:
+                print(f"      {row[-1]}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000000, help="Messages to generate")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per query; the fastest is reported")
+    args = parser.parse_args()
+
+    db_file = os.path.join(tempfile.mkdtemp(), "bench_chat_messages_indexes.db")
+    engine = create_engine(f"sqlite:///{db_file}")
+
+    # Version 3 is the last schema without the covering indexes; drop its transcript index too
+    apply_migrations(engine, target_version=3)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DROP INDEX ix_chat_messages_conversation_id_sequence")
+
+    start = time.perf_counter()
+    load_rows(engine, args.rows)
+    print(f"Loaded {args.rows} rows in {time.perf_counter() - start:.1f}s")
+    queries = build_queries(args.rows)
+
+    print("\nBefore (primary key only):")
+    before = run_queries(engine, queries, args.repeat)
+
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE UNIQUE INDEX ix_chat_messages_conversation_id_sequence "
+            "ON chat_messages (conversation_id, sequence) WHERE conversation_id IS NOT NULL"
+        )
+    version = apply_migrations(engine)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("ANALYZE")
+    print(f"\nBuilt indexes (schema version {version}) in {time.perf_counter() - start:.1f}s")
+
+    print("\nAfter:")
+    after = run_queries(engine, queries, args.repeat)
+
+    print("\nSpeedup:")
+    for name in before:
+        print(f"  {name}: {before[name] / after[name]:.1f}x")
+
+    engine.dispose()
+    os.remove(db_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark message logging throughput: connect-per-insert vs. pooled connections.
+
+Usage:
+    python benchmarks/bench_log_message.py [--url URL] [--messages N]
+
+Without --url a temporary SQLite database is used as a stand-in for SQL Server.
+To benchmark against the docker-compose SQL Server pass e.g.
+    --url "mssql+pyodbc:///?odbc_connect=<url-encoded ODBC string>"
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_manager import DatabaseManager  # noqa: E402
+from models import ChatRole  # noqa: E402
+
+INSERT_SQL = text("""
+    INSERT INTO chat_messages (application_name, chat_role, sequence, message_content)
+    VALUES (:application_name, :chat_role, :sequence, :message_content)
+""")
+
+
+def bench_connect_per_insert(url, count):
+    """Reproduce the old behaviour: open and close a connection for every message."""
+    engine = create_engine(url, poolclass=NullPool)
+    start = time.perf_counter()
+    for i in range(count):
+        with engine.begin() as conn:
+            conn.execute(INSERT_SQL, {
+                "application_name": "benchmark",
+                "chat_role": ChatRole.USER.value,
+                "sequence": i,
+                "message_content": f"unpooled message {i}",
+            })
+    elapsed = time.perf_counter() - start
+    engine.dispose()
+    return elapsed
+
+
+def bench_pooled(url, count):
+    """Log messages through DatabaseManager.log_message and its connection pool."""
+    db_manager = DatabaseManager(url, "benchmark")
+    start = time.perf_counter()
+    for i in range(count):
+        db_manager.log_message(f"pooled message {i}", ChatRole.USER, i)
+    elapsed = time.perf_counter() - start
+    print(f"Pool status: {db_manager.get_pool_status()}")
+    db_manager.dispose()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="SQLAlchemy database URL (defaults to a temporary SQLite file)")
+    parser.add_argument("--messages", type=int, default=2000, help="Number of inserts per run")
+    args = parser.parse_args()
+
+    url = args.url
+    if url is None:
+        db_file = os.path.join(tempfile.mkdtemp(), "bench_log_message.db")
+        url = f"sqlite:///{db_file}"
+
+    # Make sure the schema exists before timing the unpooled run
+    schema_manager = DatabaseManager(url, "benchmark")
+    schema_manager.migrate()
+    schema_manager.dispose()
+
+    before = bench_connect_per_insert(url, args.messages)
+    after = bench_pooled(url, args.messages)
+
+    print(f"Database: {url}")
+    print(f"Messages per run: {args.messages}")
+    print(f"Connect per insert: {args.messages / before:10.1f} inserts/sec ({before:.2f}s)")
+    print(f"Pooled connection:  {args.messages / after:10.1f} inserts/sec ({after:.2f}s)")
+    print(f"Speedup: {before / after:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+"""
+Replay conversations through chat_with_ai against local stand-ins and report latency per stage.
+
+Usage:
+    python benchmarks/bench_replay.py [--conversations N] [--turns N] [--concurrency N]
+        [--conversations-file FILE | --from-database URL] [--database-url URL]
+        [--llm-latency S] [--token-rate N] [--reply-tokens N] [--retrieval-latency S]
+        [--stream] [--output FILE]
+
+Every turn goes through the real pipeline: the AzureOpenAI client, the ChromaDB
+HTTP client (with its retrieval cache), the token budget and the database
+manager. Only the remote services are replaced:
+
+- a mock OpenAI-compatible server answers chat completions after --llm-latency
+  seconds and then produces --reply-tokens tokens at --token-rate tokens/sec,
+  as JSON or as server-sent events when the request streams
+- a stub ChromaDB server answers /query after --retrieval-latency seconds
+- messages are logged to a temporary SQLite file, or to --database-url (e.g. a
+  local SQL Server container)
+
+Conversations are synthetic by default. --conversations-file replays a JSON
+lines file with one conversation per line, either a list of user messages or
+{"turns": [...]}. --from-database replays the user messages recorded in an
+existing chat_messages table.
+
+The report shows throughput, p50/p95/p99 turn latency and the same percentiles
+per pipeline stage, taken from the spans written by telemetry.py. --output saves
+it as JSON so runs can be compared.
+"""
+import argparse
+import contextlib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+DEPLOYMENT = "bench-replay"
+
+SYNTHETIC_QUESTIONS = [
+    "What is the current rate on a {n}-year fixed advance?",
+    "How is prepayment calculated on a {n}-year amortizing advance?",
+    "Which collateral types are eligible for a {n}-month advance?",
+    "Compare a {n}-year callable advance with a bullet advance.",
+    "What documents do I need to apply for a {n}-year advance?",
+]
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    """OpenAI-compatible /chat/completions endpoint with configurable latency and token rate."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])) or b"{}")
+        settings = self.server.settings
+        # Roughly four characters per token, like the tokenizer fallback
+        prompt_tokens = sum(len(message.get("content") or "") for message in request.get("messages", [])) // 4 + 1
+        tokens = [f"tok{index} " for index in range(settings["reply_tokens"])]
+        time.sleep(settings["llm_latency"])
+
+        if request.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            for token in tokens:
+                time.sleep(1 / settings["token_rate"])
+                self._send_event(self._chunk({"content": token}))
+            self._send_event(self._chunk({}, finish_reason="stop"))
+            if (request.get("stream_options") or {}).get("include_usage"):
+                self._send_event(dict(self._chunk({}), choices=[], usage=self._usage(prompt_tokens, len(tokens))))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            return
+
+        time.sleep(len(tokens) / settings["token_rate"])
+        self._send_json({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": DEPLOYMENT,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)},
+                         "finish_reason": "stop"}],
+            "usage": self._usage(prompt_tokens, len(tokens)),
+        })
+
+    @staticmethod
+    def _usage(prompt_tokens, completion_tokens):
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens}
+
+    def _chunk(self, delta, finish_reason=None):
+        return {
+            "id": "chatcmpl-stream",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": DEPLOYMENT,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+
+    def _send_event(self, payload):
+        self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _send_json(self, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubChromaHandler(BaseHTTPRequestHandler):
+    """ChromaDB service stand-in: /collections and /query with canned documents."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._send_json([{"name": "loandocuments"}])
+
+    def do_POST(self):
+        time.sleep(self.server.settings["retrieval_latency"])
+        params = parse_qs(urlparse(self.path).query)
+        query = params.get("query_text", [""])[0]
+        n_results = int(params.get("n_results", ["3"])[0])
+        self._send_json([{"content": f"Document {index + 1} about: {query}"} for index in range(n_results)])
+
+    def _send_json(self, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(handler, settings):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    server.settings = settings
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def synthetic_conversations(count, turns):
+    # Every question is distinct, so the retrieval cache only helps recorded replays that repeat themselves
+    return [
+        [SYNTHETIC_QUESTIONS[(conversation + turn) % len(SYNTHETIC_QUESTIONS)].format(n=conversation * turns + turn + 1)
+         for turn in range(turns)]
+        for conversation in range(count)
+    ]
+
+
+def load_conversations_file(path, limit):
+    conversations = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            conversations.append(record["turns"] if isinstance(record, dict) else record)
+    return conversations[:limit] if limit else conversations
+
+
+def load_recorded_conversations(url, limit):
+    """Read the user messages of up to limit recorded conversations, in sequence order."""
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(url)
+    conversations = {}
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT conversation_id, message_content FROM chat_messages
+            WHERE chat_role = 'user' AND conversation_id IS NOT NULL
+            ORDER BY conversation_id, sequence
+        """))
+        for conversation_id, content in rows:
+            if conversation_id not in conversations and limit and len(conversations) >= limit:
+                continue
+            conversations.setdefault(conversation_id, []).append(content)
+    engine.dispose()
+    return list(conversations.values())
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def latency_stats(seconds):
+    return {
+        "count": len(seconds),
+        "mean_ms": round(statistics.mean(seconds) * 1000, 2),
+        "p50_ms": round(percentile(seconds, 50) * 1000, 2),
+        "p95_ms": round(percentile(seconds, 95) * 1000, 2),
+        "p99_ms": round(percentile(seconds, 99) * 1000, 2),
+    }
+
+
+def replay(conversation, clients, token_budget, stream, latencies, failures):
+    from azure_ai_chat import ChatError, chat_with_ai
+
+    openai_client, chroma_client, db_manager = clients
+    history = []
+    conversation_id = uuid.uuid4().hex
+    on_token = (lambda delta: None) if stream else None
+    for user_input in conversation:
+        start = time.perf_counter()
+        ai_response = chat_with_ai(openai_client, chroma_client, db_manager, user_input, history, conversation_id,
+                                   on_token=on_token, use_cache=False, token_budget=token_budget)
+        latencies.append(time.perf_counter() - start)
+        if isinstance(ai_response, ChatError):
+            failures.append(ai_response)
+            continue
+        history.append({"role": "user", "content": user_input})
+        history.append({"role": "assistant", "content": ai_response})
+        history = token_budget.trim_history(history)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=20, help="Conversations to replay (0 = all recorded)")
+    parser.add_argument("--turns", type=int, default=5, help="Turns per synthetic conversation")
+    parser.add_argument("--concurrency", type=int, default=4, help="Conversations replayed at the same time")
+    parser.add_argument("--conversations-file", help="JSON lines file of conversations to replay")
+    parser.add_argument("--from-database", help="SQLAlchemy URL of a database whose conversations are replayed")
+    parser.add_argument("--database-url", help="SQLAlchemy URL to log to (default: a temporary SQLite file)")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Mock completion time to first token in seconds")
+    parser.add_argument("--token-rate", type=float, default=200, help="Mock completion tokens per second")
+    parser.add_argument("--reply-tokens", type=int, default=40, help="Tokens per mock completion")
+    parser.add_argument("--retrieval-latency", type=float, default=0.02, help="Stub ChromaDB latency in seconds")
+    parser.add_argument("--stream", action="store_true", help="Stream completions as the console app does with CHAT_STREAM=1")
+    parser.add_argument("--output", help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    if args.conversations_file:
+        conversations = load_conversations_file(args.conversations_file, args.conversations)
+    elif args.from_database:
+        conversations = load_recorded_conversations(args.from_database, args.conversations)
+    else:
+        conversations = synthetic_conversations(args.conversations, args.turns)
+    if not conversations:
+        parser.error("No conversations to replay")
+
+    openai_server = start_server(MockOpenAIHandler, {
+        "llm_latency": args.llm_latency, "token_rate": args.token_rate, "reply_tokens": args.reply_tokens})
+    chroma_server = start_server(StubChromaHandler, {"retrieval_latency": args.retrieval_latency})
+    workdir = tempfile.mkdtemp()
+    spans_path = os.path.join(workdir, "spans.jsonl")
+    os.environ.update({
+        "AZURE_OPENAI_ENDPOINT": f"http://127.0.0.1:{openai_server.server_address[1]}",
+        "AZURE_OPENAI_KEY": "bench-replay",
+        "AZURE_OPENAI_DEPLOYMENT_NAME": DEPLOYMENT,
+        "AZURE_OPENAI_EMBEDDING_DEPLOYMENT": "",
+        "CHROMA_SERVICE_HOST": "http://127.0.0.1",
+        "CHROMA_SERVICE_PORT": str(chroma_server.server_address[1]),
+        "CHAT_DATABASE_URL": args.database_url or f"sqlite:///{os.path.join(workdir, 'bench_replay.db')}",
+        "CHAT_SPANS_FILE": spans_path,
+        "CHAT_METRICS_FILE": os.path.join(workdir, "metrics.prom"),
+        "CHAT_METRICS_INTERVAL": "1",
+    })
+
+    # Imported after the environment is set so the clients and telemetry pick it up
+    import azure_ai_chat
+    from telemetry import get_telemetry
+    from token_budget import TokenBudget
+
+    openai_client = azure_ai_chat.create_openai_client()
+    chroma_client = azure_ai_chat.create_chroma_client(openai_client)
+    db_manager = azure_ai_chat.create_db_manager()
+    db_manager.migrate()
+    token_budget = TokenBudget.from_env()
+    clients = (openai_client, chroma_client, db_manager)
+
+    latencies = []
+    failures = []
+    start = time.perf_counter()
+    # chat_with_ai prints every logged message
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), \
+            ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for future in [pool.submit(replay, conversation, clients, token_budget, args.stream, latencies, failures)
+                       for conversation in conversations]:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    # Let the background inserts finish so their spans are included
+    azure_ai_chat._log_executor.shutdown(wait=True)
+    get_telemetry().close()
+    stages = {}
+    with open(spans_path, encoding="utf-8") as f:
+        for line in f:
+            span = json.loads(line)
+            stages.setdefault(span["stage"], []).append(span["duration_ms"] / 1000)
+
+    report = {
+        "conversations": len(conversations),
+        "turns": len(latencies),
+        "failed_turns": len(failures),
+        "concurrency": args.concurrency,
+        "streamed": args.stream,
+        "elapsed_s": round(elapsed, 3),
+        "turns_per_sec": round(len(latencies) / elapsed, 2),
+        "turn_latency": latency_stats(latencies),
+        "stages": {stage: latency_stats(seconds) for stage, seconds in sorted(stages.items())},
+        "messages_logged": db_manager.get_message_count(),
+        "settings": {"llm_latency": args.llm_latency, "token_rate": args.token_rate,
+                     "reply_tokens": args.reply_tokens, "retrieval_latency": args.retrieval_latency},
+    }
+    db_manager.close()
+    chroma_client.close()
+    openai_server.shutdown()
+    chroma_server.shutdown()
+
+    print(f"Conversations: {report['conversations']}, turns: {report['turns']} ({report['failed_turns']} failed), "
+          f"concurrency: {args.concurrency}, streamed: {args.stream}")
+    print(f"Throughput: {report['turns_per_sec']} turns/sec over {report['elapsed_s']}s")
+    print(f"Messages logged: {report['messages_logged']}")
+    print(f"\n{'stage':<18}{'count':>7}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}  (ms)")
+    for name, stats in [("turn (caller)", report["turn_latency"])] + list(report["stages"].items()):
+        print(f"{name:<18}{stats['count']:>7}{stats['mean_ms']:>10.1f}{stats['p50_ms']:>10.1f}"
+              f"{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+    if failures:
+        print(f"\nFirst failure: {failures[0]}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Measure cold-start cost of the console chat: import time and time to the first prompt.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs N] [--chroma-latency S]
+
+Every measurement runs in a fresh Python process. Three numbers are reported:
+
+- import: `import azure_ai_chat`
+- eager init: import plus initialize_clients(), which builds every client and
+  contacts ChromaDB before returning (the old startup path)
+- first prompt: `python azure_ai_chat.py` until "You:" is printed, with clients
+  created lazily and checked in the background
+
+ChromaDB is a local stand-in that answers /collections after --chroma-latency
+seconds, and the database is a temporary SQLite file (CHAT_DATABASE_URL).
+Against a real SQL Server the eager path also pays a login and catalog queries.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_chroma_stand_in(latency):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            body = json.dumps([{"name": "loandocuments"}]).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_python(code, env, cwd):
+    """Run code in a fresh interpreter and return the float it prints."""
+    output = subprocess.run([sys.executable, "-c", code], env=env, cwd=cwd, capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def time_to_first_prompt(env, cwd):
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-u", os.path.join(REPO, "azure_ai_chat.py")], env=env, cwd=cwd,
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    seen = ""
+    while "You:" not in seen:
+        char = process.stdout.read(1)
+        if not char:
+            raise RuntimeError(f"azure_ai_chat.py exited before the first prompt: {seen!r}")
+        seen += char
+    elapsed = time.perf_counter() - start
+    process.communicate("exit\n", timeout=60)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes per measurement")
+    parser.add_argument("--chroma-latency", type=float, default=0.05, help="Stand-in ChromaDB latency in seconds")
+    args = parser.parse_args()
+
+    server = start_chroma_stand_in(args.chroma_latency)
+    workdir = tempfile.mkdtemp()
+    env = dict(
+        os.environ,
+        PYTHONPATH=REPO,
+        AZURE_OPENAI_ENDPOINT="https://stand-in.openai.azure.com",
+        AZURE_OPENAI_KEY="stand-in",
+        AZURE_OPENAI_DEPLOYMENT_NAME="stand-in",
+        CHROMA_SERVICE_HOST="http://127.0.0.1",
+        CHROMA_SERVICE_PORT=str(server.server_address[1]),
+        CHAT_DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench_startup.db')}",
+        DB_AUTO_MIGRATE="1",
+    )
+
+    timer = "import time; start = time.perf_counter(); import azure_ai_chat; {extra}print(time.perf_counter() - start)"
+    measurements = {
+        "import": lambda: run_python(timer.format(extra=""), env, workdir),
+        "eager init": lambda: run_python(timer.format(extra="azure_ai_chat.initialize_clients(); "), env, workdir),
+        "first prompt": lambda: time_to_first_prompt(env, workdir),
+    }
+
+    print(f"Runs per measurement: {args.runs}, stand-in ChromaDB latency: {args.chroma_latency}s")
+    for name, measure in measurements.items():
+        timings = [measure() for _ in range(args.runs)]
+        print(f"{name:>12}: median {statistics.median(timings) * 1000:7.1f} ms, "
+              f"min {min(timings) * 1000:7.1f} ms")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
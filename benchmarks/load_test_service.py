@@ -0,0 +1,119 @@
+"""
+Load test the multi-session chat service with in-process stand-ins for the LLM and ChromaDB.
+
+Usage:
+    python benchmarks/load_test_service.py [--sessions N] [--turns N] [--llm-latency S]
+
+Requests go through the real ASGI application (routing, session store, shared
+clients) via httpx's ASGI transport. The completion and retrieval calls are
+replaced by stand-ins that sleep for a configurable latency. Messages are
+logged to a temporary SQLite database.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_service import ChatService  # noqa: E402
+from db_manager import DatabaseManager  # noqa: E402
+from session_store import InMemorySessionStore  # noqa: E402
+from token_budget import TokenBudget, TokenCounter  # noqa: E402
+
+
+class StandInCompletions:
+    """Answers chat completion requests after a fixed delay."""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def create(self, **request):
+        await asyncio.sleep(self.latency)
+        usage = SimpleNamespace(prompt_tokens=500, completion_tokens=50, prompt_tokens_details=None)
+        message = SimpleNamespace(content=f"Stand-in reply to: {request['messages'][-1]['content']}")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+
+class StandInChroma:
+    """Returns canned documents after a fixed delay."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.cache = None
+
+    async def search_async(self, query, n_results=3):
+        await asyncio.sleep(self.latency)
+        return [f"Document about {query}"]
+
+    def format_context(self, documents):
+        return "Based on internal knowledge:\n\n" + "\n\n".join(documents)
+
+    async def aclose(self):
+        pass
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run_session(client, turns, latencies):
+    response = await client.post("/sessions")
+    session_id = response.json()["session_id"]
+    for turn in range(turns):
+        start = time.perf_counter()
+        response = await client.post(f"/sessions/{session_id}/messages", json={"message": f"price a {turn + 1}-year advance"})
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=50, help="Concurrent sessions")
+    parser.add_argument("--turns", type=int, default=10, help="Turns per session")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Stand-in completion latency in seconds")
+    parser.add_argument("--retrieval-latency", type=float, default=0.02, help="Stand-in ChromaDB latency in seconds")
+    args = parser.parse_args()
+
+    db_file = os.path.join(tempfile.mkdtemp(), "load_test_service.db")
+    db_manager = DatabaseManager(f"sqlite:///{db_file}", "load-test")
+    db_manager.migrate()
+    db_manager.start_write_behind()
+
+    service = ChatService(
+        openai_client=SimpleNamespace(chat=SimpleNamespace(completions=StandInCompletions(args.llm_latency))),
+        chroma_client=StandInChroma(args.retrieval_latency),
+        db_manager=db_manager,
+        session_store=InMemorySessionStore(),
+        token_budget=TokenBudget(counter=TokenCounter()),
+    )
+    await service.startup()
+
+    latencies = []
+    transport = httpx.ASGITransport(app=service)
+    async with httpx.AsyncClient(transport=transport, base_url="http://chat-service", timeout=60) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(run_session(client, args.turns, latencies) for _ in range(args.sessions)))
+        elapsed = time.perf_counter() - start
+
+    await service.shutdown()
+    db_manager.close()
+
+    print(f"Sessions: {args.sessions}, turns per session: {args.turns}, stand-in LLM latency: {args.llm_latency}s")
+    print(f"Requests: {len(latencies)} in {elapsed:.2f}s -> {len(latencies) / elapsed:.1f} requests/sec")
+    print(f"Latency p50: {percentile(latencies, 50) * 1000:.1f} ms")
+    print(f"Latency p99: {percentile(latencies, 99) * 1000:.1f} ms")
+    print(f"Latency mean: {statistics.mean(latencies) * 1000:.1f} ms")
+    print(f"Messages logged: {db_manager.get_message_count()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
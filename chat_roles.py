@@ -0,0 +1,8 @@
+import enum
+
+# Kept free of SQLAlchemy so the chat pipeline can use it without loading the ORM
+class ChatRole(enum.Enum):
+    SYSTEM = "system"
+    USER = "user"
+    ASSISTANT = "assistant"
+    SUMMARY = "summary"
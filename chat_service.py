@@ -0,0 +1,248 @@
+import asyncio
+import json
+import os
+import re
+import weakref
+import logging
+from async_chat import async_chat_with_ai, drain_background_tasks, initialize_async_clients
+from azure_ai_chat import ChatError
+from response_cache import ResponseCache
+from scheduler import create_maintenance_scheduler
+from session_store import create_session_store
+from telemetry import get_telemetry
+from token_budget import TokenBudget
+
+logger = logging.getLogger(__name__)
+
+_MESSAGES_PATH = re.compile(r"^/sessions/(?P<session_id>[0-9A-Za-z_-]+)/messages(?P<stream>/stream)?$")
+
+
+class ChatService:
+    """
+    ASGI application hosting many concurrent chat sessions in one process.
+
+    The OpenAI, ChromaDB and database clients are shared by all sessions, while
+    each session's history lives in the session store and its session ID is the
+    conversation ID in chat_messages. Turns for the same session are serialized;
+    different sessions run concurrently.
+
+    Routes:
+        GET  /health                          Liveness check
+        GET  /metrics                         Pipeline stage latency histograms in Prometheus text format
+        POST /sessions                        Create a session
+        POST /sessions/{id}/messages          Send a message, returns the full reply
+        POST /sessions/{id}/messages/stream   Send a message, streams the reply as server-sent events
+    """
+
+    def __init__(self, openai_client=None, chroma_client=None, db_manager=None, session_store=None,
+                 response_cache=None, token_budget=None):
+        """Clients that are not passed in are created from the environment at startup."""
+        self.openai_client = openai_client
+        self.chroma_client = chroma_client
+        self.db_manager = db_manager
+        self.session_store = session_store if session_store is not None else create_session_store()
+        self.response_cache = response_cache
+        self.token_budget = token_budget
+        self._session_locks = weakref.WeakValueDictionary()
+        self.maintenance = None
+        self._owns_clients = False
+        self._purge_task = None
+
+    async def startup(self):
+        """Create any shared clients that were not injected."""
+        if self.openai_client is None or self.chroma_client is None or self.db_manager is None:
+            self.openai_client, self.chroma_client, self.db_manager = initialize_async_clients()
+            self._owns_clients = True
+            self.response_cache = self.response_cache or ResponseCache.from_env()
+            self.maintenance = create_maintenance_scheduler(self.db_manager).start()
+        self.token_budget = self.token_budget or TokenBudget.from_env()
+        # Sequence counters of evicted sessions are re-seeded from the database if they come back
+        self.session_store.on_evict = self.db_manager.sequences.forget
+        # Persistent stores keep sessions on disk until purged
+        if hasattr(self.session_store, "purge_expired"):
+            interval = float(os.getenv("CHAT_SESSION_PURGE_INTERVAL", "3600"))
+            self._purge_task = asyncio.create_task(self._purge_sessions(interval))
+        logger.info("Chat service started")
+
+    async def shutdown(self):
+        """Wait for background message logging, then close the shared clients created at startup."""
+        if self._purge_task is not None:
+            self._purge_task.cancel()
+        await drain_background_tasks()
+        if self._owns_clients:
+            self.maintenance.stop()
+            await self.chroma_client.aclose()
+            await self.openai_client.close()
+            self.db_manager.close()
+        get_telemetry().close()
+        logger.info("Chat service stopped")
+
+    async def create_session(self):
+        """Create a new chat session and return its ID."""
+        session = await asyncio.to_thread(self.session_store.create)
+        return session.session_id
+
+    async def chat(self, session_id, message, on_token=None):
+        """
+        Run one chat turn for a session.
+
+        Returns:
+            str: The assistant's reply, a ChatError that is not added to the history,
+                or None if the session does not exist
+        """
+        lock = self._session_locks.get(session_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._session_locks[session_id] = lock
+
+        async with lock:
+            session = await asyncio.to_thread(self.session_store.get, session_id)
+            if session is None:
+                return None
+
+            ai_response = await async_chat_with_ai(
+                self.openai_client, self.chroma_client, self.db_manager, message,
+                session.conversation_history, session.session_id,
+                on_token=on_token, response_cache=self.response_cache, token_budget=self.token_budget,
+            )
+            if isinstance(ai_response, ChatError):
+                return ai_response
+            session.conversation_history.append({"role": "user", "content": message})
+            session.conversation_history.append({"role": "assistant", "content": ai_response})
+            session.conversation_history = self.token_budget.trim_history(session.conversation_history)
+            await asyncio.to_thread(self.session_store.save, session)
+            return ai_response
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        method = scope["method"]
+        path = scope["path"]
+
+        if path == "/health" and method == "GET":
+            await self._send_json(send, 200, {"status": "ok", "sessions": len(self.session_store)})
+            return
+
+        if path == "/metrics" and method == "GET":
+            body = get_telemetry().render_prometheus().encode("utf-8")
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"text/plain; version=0.0.4"), (b"content-length", str(len(body)).encode())],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        if path == "/sessions":
+            if method != "POST":
+                await self._send_json(send, 405, {"error": "Method not allowed"})
+                return
+            await self._send_json(send, 201, {"session_id": await self.create_session()})
+            return
+
+        match = _MESSAGES_PATH.match(path)
+        if match is None:
+            await self._send_json(send, 404, {"error": "Not found"})
+            return
+        if method != "POST":
+            await self._send_json(send, 405, {"error": "Method not allowed"})
+            return
+
+        try:
+            body = json.loads(await self._read_body(receive) or b"{}")
+            message = body.get("message", "").strip()
+        except (ValueError, AttributeError):
+            await self._send_json(send, 400, {"error": "Body must be a JSON object"})
+            return
+        if not message:
+            await self._send_json(send, 400, {"error": "Please enter a message."})
+            return
+
+        session_id = match.group("session_id")
+        if await asyncio.to_thread(self.session_store.get, session_id) is None:
+            await self._send_json(send, 404, {"error": f"Unknown session {session_id}"})
+            return
+
+        if match.group("stream"):
+            await self._stream_reply(send, session_id, message)
+            return
+
+        ai_response = await self.chat(session_id, message)
+        await self._send_json(send, 200, {"session_id": session_id, "response": ai_response})
+
+    async def _stream_reply(self, send, session_id, message):
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")],
+        })
+
+        tokens = asyncio.Queue()
+        turn = asyncio.create_task(self.chat(session_id, message, on_token=tokens.put_nowait))
+        turn.add_done_callback(lambda _: tokens.put_nowait(None))
+
+        while True:
+            token = await tokens.get()
+            if token is None:
+                break
+            await send({"type": "http.response.body", "body": self._event({"token": token}), "more_body": True})
+
+        ai_response = await turn
+        await send({"type": "http.response.body", "body": self._event({"response": ai_response}, "done")})
+
+    async def _purge_sessions(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                purged = await asyncio.to_thread(self.session_store.purge_expired)
+                if purged:
+                    logger.info(f"Purged {purged} expired sessions from the session store")
+            except Exception as e:
+                logger.error(f"Error purging expired sessions: {str(e)}")
+
+    async def _lifespan(self, receive, send):
+        while True:
+            event = await receive()
+            if event["type"] == "lifespan.startup":
+                await self.startup()
+                await send({"type": "lifespan.startup.complete"})
+            elif event["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    @staticmethod
+    async def _read_body(receive):
+        body = b""
+        while True:
+            event = await receive()
+            body += event.get("body", b"")
+            if not event.get("more_body"):
+                return body
+
+    @staticmethod
+    async def _send_json(send, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    @staticmethod
+    def _event(payload, event=None):
+        prefix = f"event: {event}\n" if event else ""
+        return f"{prefix}data: {json.dumps(payload)}\n\n".encode("utf-8")
+
+
+app = ChatService()
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host=os.getenv("CHAT_SERVICE_HOST", "127.0.0.1"), port=int(os.getenv("CHAT_SERVICE_PORT", "8080")))
@@ -1,18 +1,63 @@
+import json
 import os
+import threading
+import time
 import requests
 import logging
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Get the logger configured in azure_ai_chat.py
 logger = logging.getLogger(__name__)
 
 class ChromaDBClient:
-    def __init__(self):
-        """Initialize ChromaDB client with connection details from environment variables."""
+    collection_name = "loandocuments"
+
+    def __init__(self, pool_size=None, connect_timeout=None, read_timeout=None, max_retries=None,
+                 backoff_factor=None, cache=None):
+        """
+        Initialize ChromaDB client with connection details from environment variables.
+        
+        Requests share one keep-alive session. Pool size, timeouts and retries fall back to
+        CHROMA_POOL_SIZE, CHROMA_CONNECT_TIMEOUT, CHROMA_READ_TIMEOUT, CHROMA_MAX_RETRIES
+        and CHROMA_BACKOFF_FACTOR. An optional RetrievalCache answers repeated queries
+        without a round trip to ChromaDB. While it is in use, the collection's entry in
+        /collections is re-read every CHROMA_CACHE_CHECK_INTERVAL seconds on a background
+        thread, and the cache is cleared when the entry changes, e.g. because the
+        collection was re-created by a re-ingest.
+        """
         load_dotenv()
         self.host = os.getenv("CHROMA_SERVICE_HOST", "http://localhost")
         self.port = int(os.getenv("CHROMA_SERVICE_PORT", "8000"))
         self.base_url = f"{self.host}:{self.port}"
+        
+        self.pool_size = pool_size or int(os.getenv("CHROMA_POOL_SIZE", "10"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("CHROMA_MAX_RETRIES", "3"))
+        self.timeout = (
+            connect_timeout or float(os.getenv("CHROMA_CONNECT_TIMEOUT", "3.05")),
+            read_timeout or float(os.getenv("CHROMA_READ_TIMEOUT", "30")),
+        )
+        backoff_factor = backoff_factor if backoff_factor is not None else float(os.getenv("CHROMA_BACKOFF_FACTOR", "0.5"))
+        
+        # /query only reads, so POST is safe to retry as well
+        retry = Retry(
+            total=self.max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"GET", "POST"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._async_client = None
+        self.cache = cache
+        self.cache_check_interval = float(os.getenv("CHROMA_CACHE_CHECK_INTERVAL", "60"))
+        self._collection_fingerprint = None
+        self._next_collection_check = 0.0
+        self._collection_lock = threading.Lock()
 
     def connect(self):
         """Test connection to ChromaDB instance."""
@@ -20,11 +65,11 @@ class ChromaDBClient:
             logger.debug(f"Attempting to connect to ChromaDB at {self.base_url}")
             
             # Get collections to test connection
-            response = requests.get(f"{self.base_url}/collections")
+            response = self.session.get(f"{self.base_url}/collections", timeout=self.timeout)
             if response.status_code == 200:
                 logger.debug("ChromaDB connection successful")
-                collections = response.json()
-                logger.debug(f"Available ChromaDB collections: {collections}")
+                logger.debug(f"ChromaDB reports {len(response.json())} collections")
+                self._note_collections(response.json())
                 return True
             else:
                 logger.error(f"Failed to connect to ChromaDB: {response.status_code} - {response.text}")
@@ -44,37 +89,163 @@ class ChromaDBClient:
         Returns:
             list: List of relevant documents
         """
+        cached = self._get_cached(query, n_results)
+        if cached is not None:
+            return cached
+        
         try:
             params = {
-                "collection_name": "loandocuments",
+                "collection_name": self.collection_name,
                 "query_text": query,
                 "n_results": n_results
             }
             
             logger.debug(f"Sending query to ChromaDB: {params}")
-            response = requests.post(f"{self.base_url}/query", params=params)
+            response = self.session.post(f"{self.base_url}/query", params=params, timeout=self.timeout)
             logger.debug(f"ChromaDB response status: {response.status_code}")
             
-            if response.status_code == 200:
-                results = response.json()
-                logger.debug(f"Raw ChromaDB results: {results}")
+            return self._cache_documents(query, n_results, self._parse_response(response))
                 
-                if isinstance(results, list) and results:
-                    documents = [doc.get("content", "") for doc in results]
-                    logger.debug(f"Extracted documents: {documents}")
-                    return documents
-                else:
-                    logger.debug("No documents found in results")
-                    return []
-            else:
-                logger.error(f"Error searching ChromaDB: {response.status_code}")
-                logger.error(f"Response text: {response.text}")
-                return []
+        except Exception as e:
+            logger.error(f"Error searching ChromaDB: {str(e)}")
+            return []
+
+    async def search_async(self, query, n_results=3):
+        """
+        Search documents without blocking the event loop.
+        
+        Args:
+            query (str): The search query
+            n_results (int): Number of results to return
+            
+        Returns:
+            list: List of relevant documents
+        """
+        cached = self._get_cached(query, n_results)
+        if cached is not None:
+            return cached
+        
+        try:
+            params = {
+                "collection_name": self.collection_name,
+                "query_text": query,
+                "n_results": n_results
+            }
+            
+            if self._async_client is None:
+                # Imported here so sync-only callers never load httpx
+                import httpx
                 
+                self._async_client = httpx.AsyncClient(
+                    base_url=self.base_url,
+                    timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]),
+                    limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+                    # httpx only retries failed connection attempts
+                    transport=httpx.AsyncHTTPTransport(retries=self.max_retries),
+                )
+            
+            logger.debug(f"Sending async query to ChromaDB: {params}")
+            response = await self._async_client.post("/query", params=params)
+            logger.debug(f"ChromaDB response status: {response.status_code}")
+            return self._cache_documents(query, n_results, self._parse_response(response))
+        
         except Exception as e:
             logger.error(f"Error searching ChromaDB: {str(e)}")
             return []
 
+    def invalidate_cache(self, collection_name=None):
+        """
+        Drop cached search results, e.g. after the collection has been re-ingested.
+        
+        Args:
+            collection_name (str): Collection to invalidate; defaults to the loan documents collection
+        """
+        if self.cache is not None:
+            self.cache.invalidate(collection_name or self.collection_name)
+
+    def check_collection(self):
+        """
+        Re-read the collection's entry and drop cached results if it changed since the last check.
+        
+        Returns:
+            bool: True if the entry could be read
+        """
+        try:
+            response = self.session.get(f"{self.base_url}/collections", timeout=self.timeout)
+            if response.status_code != 200:
+                logger.error(f"Error checking ChromaDB collection: {response.status_code}")
+                return False
+            self._note_collections(response.json())
+            return True
+        except Exception as e:
+            logger.error(f"Error checking ChromaDB collection: {str(e)}")
+            return False
+
+    def _note_collections(self, collections):
+        entry = next((item for item in collections
+                      if item == self.collection_name
+                      or (isinstance(item, dict) and item.get("name") == self.collection_name)), None)
+        # id, metadata and any count all change when the collection is re-created or re-ingested
+        fingerprint = json.dumps(entry, sort_keys=True, default=str)
+        with self._collection_lock:
+            changed = self._collection_fingerprint is not None and fingerprint != self._collection_fingerprint
+            self._collection_fingerprint = fingerprint
+            self._next_collection_check = time.monotonic() + self.cache_check_interval
+        if changed:
+            logger.info(f"ChromaDB collection {self.collection_name} changed; dropping cached search results")
+            self.invalidate_cache()
+
+    def _schedule_collection_check(self):
+        with self._collection_lock:
+            if time.monotonic() < self._next_collection_check:
+                return
+            # Pushed out now so only one check runs at a time
+            self._next_collection_check = time.monotonic() + self.cache_check_interval
+        threading.Thread(target=self.check_collection, name="chroma-collection-check", daemon=True).start()
+
+    def _get_cached(self, query, n_results):
+        if self.cache is None:
+            return None
+        self._schedule_collection_check()
+        documents = self.cache.get(self.collection_name, query, n_results)
+        if documents is not None:
+            logger.debug(f"Retrieval cache hit for query: {query}")
+        return documents
+
+    def _cache_documents(self, query, n_results, documents):
+        # Empty results are not cached since they may come from a failed request
+        if self.cache is not None and documents:
+            self.cache.put(self.collection_name, query, n_results, documents)
+        return documents
+
+    def close(self):
+        """Close the pooled HTTP session."""
+        self.session.close()
+
+    async def aclose(self):
+        """Close the async HTTP client."""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    def _parse_response(self, response):
+        """Extract document contents from a /query response."""
+        if response.status_code == 200:
+            results = response.json()
+            logger.debug(f"Raw ChromaDB results: {results}")
+            
+            if isinstance(results, list) and results:
+                documents = [doc.get("content", "") for doc in results]
+                logger.debug(f"Extracted documents: {documents}")
+                return documents
+            else:
+                logger.debug("No documents found in results")
+                return []
+        else:
+            logger.error(f"Error searching ChromaDB: {response.status_code}")
+            logger.error(f"Response text: {response.text}")
+            return []
+
     def format_context(self, documents):
         """
         Format the retrieved documents into a context string.
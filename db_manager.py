@@ -1,97 +1,556 @@
+import hashlib
+import os
+import threading
+import time
 from datetime import datetime, timedelta
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import Date, DateTime, bindparam, create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, sessionmaker
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.sql import func
 import logging
-import pyodbc
-from models import ChatMessage, ChatRole, Base
+from models import ChatMessage, ChatRole, ChatUsageDaily
+from migrations import LATEST_VERSION, apply_migrations, get_schema_version
+from partitions import PartitionManager
+from pricing import TokenPricing
+from message_writer import WriteBehindWriter
+from sequence_allocator import SequenceAllocator
 
 logger = logging.getLogger(__name__)
 
+# Databases whose schema version was already verified by this process
+_checked_schemas = set()
+
+# Times a message whose sequence number is already taken is re-sequenced before it is given up
+_SEQUENCE_RETRIES = 3
+
 class DatabaseManager:
-    def __init__(self, connection_string, application_name):
-        """Initialize database manager with connection string and application name."""
-        self.engine = create_engine(connection_string)
+    def __init__(self, connection_string, application_name, pool_size=None, max_overflow=None,
+                 pool_timeout=None, pool_recycle=None, storage_layout=None, auto_migrate=None):
+        """
+        Initialize database manager with connection string and application name.
+
+        Construction does not touch the database. The schema version is checked
+        once per process, on first use; an outdated schema is an error unless
+        auto_migrate (DB_AUTO_MIGRATE) is set, in which case it is upgraded in place.
+        Run migrate() (or init_db.py) as the explicit upgrade step.
+
+        Message logging runs over the engine's connection pool, so every insert
+        reuses a warm connection instead of performing a fresh login. Pool settings
+        fall back to the DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT and
+        DB_POOL_RECYCLE environment variables.
+
+        storage_layout (CHAT_STORAGE_LAYOUT) is "table" for a single chat_messages
+        table or "partitioned" to keep it partitioned by day (see partitions.py).
+        """
+        url = make_url(connection_string)
+        engine_options = {}
+        if url.get_backend_name() == "mssql":
+            # Send batched inserts as a single parameter array
+            engine_options["fast_executemany"] = True
+        # In-memory SQLite gets a SingletonThreadPool, which rejects the queue settings
+        if issubclass(url.get_dialect().get_pool_class(url), QueuePool):
+            engine_options.update(
+                pool_size=pool_size if pool_size is not None else int(os.getenv("DB_POOL_SIZE", "5")),
+                max_overflow=max_overflow if max_overflow is not None else int(os.getenv("DB_MAX_OVERFLOW", "10")),
+                pool_timeout=pool_timeout if pool_timeout is not None else float(os.getenv("DB_POOL_TIMEOUT", "30")),
+            )
+        self.engine = create_engine(
+            connection_string,
+            pool_pre_ping=True,
+            pool_recycle=pool_recycle if pool_recycle is not None else int(os.getenv("DB_POOL_RECYCLE", "1800")),
+            **engine_options,
+        )
         self.Session = sessionmaker(bind=self.engine)
         self.application_name = application_name
-        
-        # Use the same connection string that worked in test_connection.py
-        conn_str = (
-            "DRIVER={SQL Server};"
-            "SERVER=localhost,1433;"
-            "DATABASE=azure_ai_chat;"
-            "UID=sa;"
-            "PWD=YourStrong@Passw0rd;"
-            "TrustServerCertificate=yes"
-        )
-        
-        # Create tables using raw SQL to avoid SQLAlchemy's type casting issues
-        conn = pyodbc.connect(conn_str)
-        cursor = conn.cursor()
-        
-        try:
-            # Create table if it doesn't exist
-            cursor.execute("""
-            IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'chat_messages')
-            BEGIN
-                CREATE TABLE chat_messages (
-                    id INT IDENTITY(1,1) PRIMARY KEY,
-                    application_name NVARCHAR(100) NOT NULL,
-                    chat_role NVARCHAR(20) NOT NULL,
-                    sequence INT NOT NULL,
-                    timestamp DATETIME NOT NULL DEFAULT GETDATE(),
-                    message_content NVARCHAR(4000) NOT NULL
-                )
-            END
-            """)
-            conn.commit()
-            logger.info("Database initialized successfully")
-        finally:
-            cursor.close()
-            conn.close()
+        self.writer = None
+        self._prompt_ids = {}
+        self.sequences = SequenceAllocator(self.get_next_sequence)
+        if auto_migrate is None:
+            auto_migrate = os.getenv("DB_AUTO_MIGRATE", "0").lower() in ("1", "true", "yes")
+        self.auto_migrate = auto_migrate
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
 
-    def log_message(self, message_content, chat_role, sequence):
-        """Log a chat message to the database."""
-        try:
-            conn = pyodbc.connect(self.get_connection_string(database="azure_ai_chat"))
-            cursor = conn.cursor()
-            
-            # Convert ChatRole enum to string
-            chat_role_str = chat_role.value if isinstance(chat_role, ChatRole) else str(chat_role)
-            
-            cursor.execute("""
-                INSERT INTO chat_messages (application_name, chat_role, sequence, message_content)
-                VALUES (?, ?, ?, ?)
-            """, (self.application_name, chat_role_str, sequence, message_content))
-            
-            conn.commit()
+        self.partitions = None
+        self.storage_layout = (storage_layout or os.getenv("CHAT_STORAGE_LAYOUT", "table")).lower()
+        if self.storage_layout == "partitioned":
+            self.partitions = PartitionManager(
+                self.engine, days_ahead=int(os.getenv("CHAT_PARTITION_DAYS_AHEAD", "3")))
+        elif self.storage_layout != "table":
+            raise ValueError(f"Unknown CHAT_STORAGE_LAYOUT: {self.storage_layout}")
+
+    def migrate(self):
+        """
+        Create or upgrade the schema, including the partitioned layout if configured.
+
+        Returns:
+            int: The schema version after the upgrade
+        """
+        # Raw SQL per dialect avoids SQLAlchemy's type casting issues
+        version = apply_migrations(self.engine)
+        if self.partitions is not None:
+            self.partitions.setup(float(os.getenv("CHAT_RETENTION_DAYS", "7")))
+        _checked_schemas.add(self._schema_key())
+        self._schema_ready = True
+        logger.info(f"Database initialized successfully (schema version {version}, {self.storage_layout} layout)")
+        return version
+
+    def _schema_key(self):
+        return (str(self.engine.url), self.storage_layout)
+
+    def ensure_schema(self):
+        """
+        Verify the schema is current before the first write.
+
+        The check runs once per database per process; afterwards this is a flag test.
+
+        Raises:
+            RuntimeError: If the schema is outdated and auto-migration is off
+        """
+        if self._schema_ready:
+            return
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            if self._schema_key() not in _checked_schemas:
+                version = get_schema_version(self.engine)
+                problem = None
+                if version < LATEST_VERSION:
+                    problem = f"Database schema is at version {version}, expected {LATEST_VERSION}"
+                elif self.partitions is not None and not self.partitions.is_partitioned():
+                    problem = "chat_messages has not been converted to the partitioned layout"
+                if problem and not self.auto_migrate:
+                    raise RuntimeError(f"{problem}; run python init_db.py (which migrates CHAT_DATABASE_URL if set) "
+                                       f"or python migrations.py <url>, or set DB_AUTO_MIGRATE=1")
+                if problem:
+                    self.migrate()
+                _checked_schemas.add(self._schema_key())
+            self._schema_ready = True
+
+    def log_message(self, message_content, chat_role, sequence, prompt_id=None, conversation_id=None):
+        """
+        Log a chat message to the database using a pooled connection.
+
+        In write-behind mode the message is queued and inserted later in a batch.
+        Rows that reference a registered prompt via prompt_id carry an empty
+        message_content; the text lives once in chat_prompts. Sequence numbers for
+        a conversation should come from self.sequences.allocate(conversation_id);
+        they are resolved when the row is written, so database problems only cost
+        the row, never the caller.
+        """
+        # Convert ChatRole enum to string
+        chat_role_str = chat_role.value if isinstance(chat_role, ChatRole) else str(chat_role)
+        row = {
+            "application_name": self.application_name,
+            "chat_role": chat_role_str,
+            "sequence": sequence,
+            "message_content": message_content,
+            "prompt_id": prompt_id,
+            "conversation_id": conversation_id,
+        }
+
+        if self.writer is not None:
+            return self.writer.submit(row)
+
+        if self.log_messages([row]):
             logger.debug(f"Message logged successfully: {message_content[:50]}...")
             return True
+        return False
+
+    def log_messages(self, rows):
+        """
+        Insert a batch of message rows in one round trip.
+
+        Pending sequence numbers from self.sequences are resolved here, on the
+        writing thread. A single row whose sequence is already taken (another
+        process wrote to the same conversation) is re-sequenced and retried; a
+        failed batch is left for the caller to retry row by row.
+
+        Args:
+            rows (list): Dicts with application_name, chat_role, sequence, message_content,
+                prompt_id and conversation_id
+
+        Returns:
+            bool: True if the batch was written
+        """
+        insert_sql = text("""
+            INSERT INTO chat_messages
+                (application_name, chat_role, sequence, message_content, prompt_id, conversation_id)
+            VALUES
+                (:application_name, :chat_role, :sequence, :message_content, :prompt_id, :conversation_id)
+        """)
+        try:
+            self.ensure_schema()
+            params = [dict(row, sequence=int(row["sequence"])) for row in rows]
+            for attempt in range(_SEQUENCE_RETRIES + 1):
+                try:
+                    with self.engine.begin() as conn:
+                        conn.execute(insert_sql, params)
+                    return True
+                except IntegrityError:
+                    row = params[0]
+                    if len(params) > 1 or row["conversation_id"] is None or attempt == _SEQUENCE_RETRIES:
+                        raise
+                    row["sequence"] = self.sequences.reseed(row["conversation_id"], row["sequence"])
         except Exception as e:
-            logger.error(f"Error logging message: {str(e)}")
+            logger.error(f"Error logging {len(rows)} message(s): {str(e)}")
             return False
-        finally:
-            cursor.close()
-            conn.close()
 
-    def cleanup_old_messages(self):
-        """Delete messages older than 7 days."""
+    def register_prompt(self, content):
+        """
+        Store a system prompt once and return its ID.
+
+        Prompts are keyed by the SHA-256 of their content, and IDs are cached per
+        process, so only the first call for a prompt touches the database.
+        """
+        content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        prompt_id = self._prompt_ids.get(content_hash)
+        if prompt_id is not None:
+            return prompt_id
+
+        self.ensure_schema()
+        select_sql = text("SELECT id FROM chat_prompts WHERE content_hash = :content_hash")
+        with self.engine.begin() as conn:
+            prompt_id = conn.execute(select_sql, {"content_hash": content_hash}).scalar()
+        if prompt_id is None:
+            try:
+                with self.engine.begin() as conn:
+                    conn.execute(text(
+                        "INSERT INTO chat_prompts (content_hash, content) VALUES (:content_hash, :content)"
+                    ), {"content_hash": content_hash, "content": content})
+            except IntegrityError:
+                # Another process registered the same prompt first
+                pass
+            with self.engine.begin() as conn:
+                prompt_id = conn.execute(select_sql, {"content_hash": content_hash}).scalar()
+            logger.info(f"Registered prompt {prompt_id} ({content_hash[:12]})")
+
+        self._prompt_ids[content_hash] = prompt_id
+        return prompt_id
+
+    def log_system_prompt(self, prompt_content, sequence, conversation_id=None):
+        """Log a system-prompt turn as a reference to the prompt registry instead of the full text."""
+        try:
+            prompt_id = self.register_prompt(prompt_content)
+        except Exception as e:
+            logger.error(f"Error registering prompt: {str(e)}")
+            return False
+        return self.log_message("", ChatRole.SYSTEM, sequence, prompt_id=prompt_id, conversation_id=conversation_id)
+
+    def get_next_sequence(self, conversation_id):
+        """Return the next unused sequence number for a conversation, as stored in the database."""
+        self.ensure_schema()
+        with self.engine.begin() as conn:
+            last = conn.execute(text(
+                "SELECT MAX(sequence) FROM chat_messages WHERE conversation_id = :conversation_id"
+            ), {"conversation_id": conversation_id}).scalar()
+        return 0 if last is None else last + 1
+
+    def log_turn_metrics(self, model, prompt_tokens, cached_tokens, completion_tokens, latency,
+                         conversation_id=None, turn_id=None, context_tokens=None, estimated=False):
+        """
+        Record the token usage and latency of one completion.
+
+        The row goes into chat_turn_metrics, and the same transaction adds it to
+        the chat_usage_daily rollup for its application, UTC day and model, so
+        usage summaries never scan the per-turn rows.
+
+        Args:
+            model (str): Deployment that served the completion
+            prompt_tokens (int): Prompt tokens, cached ones included
+            cached_tokens (int): Prompt tokens served from the prompt cache
+            completion_tokens (int): Generated tokens
+            latency (float): Seconds the completion took
+            conversation_id (str): Conversation the turn belongs to
+            turn_id (str): Telemetry turn ID, to match the row with its spans
+            context_tokens (int): Tokens of retrieved context in the prompt, if counted
+            estimated (bool): True if the counts were estimated locally
+
+        Returns:
+            bool: True if the metrics were written
+        """
+        now = datetime.utcnow()
+        row = {
+            "application_name": self.application_name,
+            "conversation_id": conversation_id,
+            "turn_id": turn_id,
+            "timestamp": now,
+            "usage_date": now.date(),
+            "model": model or "unknown",
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "completion_tokens": completion_tokens,
+            "context_tokens": context_tokens,
+            "latency_ms": int(latency * 1000),
+            "estimated": estimated,
+        }
+        insert_turn = text("""
+            INSERT INTO chat_turn_metrics
+                (application_name, conversation_id, turn_id, timestamp, model, prompt_tokens, cached_tokens,
+                 completion_tokens, context_tokens, latency_ms, estimated)
+            VALUES
+                (:application_name, :conversation_id, :turn_id, :timestamp, :model, :prompt_tokens, :cached_tokens,
+                 :completion_tokens, :context_tokens, :latency_ms, :estimated)
+        """).bindparams(bindparam("timestamp", type_=DateTime()))
+        update_rollup = text("""
+            UPDATE chat_usage_daily
+            SET completions = completions + 1,
+                prompt_tokens = prompt_tokens + :prompt_tokens,
+                cached_tokens = cached_tokens + :cached_tokens,
+                completion_tokens = completion_tokens + :completion_tokens,
+                context_tokens = context_tokens + COALESCE(:context_tokens, 0),
+                latency_ms = latency_ms + :latency_ms
+            WHERE application_name = :application_name AND usage_date = :usage_date AND model = :model
+        """).bindparams(bindparam("usage_date", type_=Date()))
+        insert_rollup = text("""
+            INSERT INTO chat_usage_daily
+                (application_name, usage_date, model, completions, prompt_tokens, cached_tokens,
+                 completion_tokens, context_tokens, latency_ms)
+            VALUES
+                (:application_name, :usage_date, :model, 1, :prompt_tokens, :cached_tokens,
+                 :completion_tokens, COALESCE(:context_tokens, 0), :latency_ms)
+        """).bindparams(bindparam("usage_date", type_=Date()))
+
+        try:
+            self.ensure_schema()
+            for attempt in range(2):
+                try:
+                    with self.engine.begin() as conn:
+                        conn.execute(insert_turn, row)
+                        if not conn.execute(update_rollup, row).rowcount:
+                            conn.execute(insert_rollup, row)
+                    return True
+                except IntegrityError:
+                    # Another process created the day's rollup row first; the retry updates it
+                    if attempt:
+                        raise
+        except Exception as e:
+            logger.error(f"Error logging turn metrics: {str(e)}")
+            return False
+
+    def get_usage_summary(self, start_date=None, end_date=None, application_name=None, pricing=None):
+        """
+        Get token usage and cost per UTC day and application from the daily rollup.
+
+        Args:
+            start_date (date): First day included (default 30 days before end_date)
+            end_date (date): Last day included (default today, UTC)
+            application_name (str): Only this application; None includes every application
+            pricing (TokenPricing): Prices for the cost column (default from the environment)
+
+        Returns:
+            list: One dict per day and application, oldest first
+        """
+        end_date = end_date or datetime.utcnow().date()
+        start_date = start_date or end_date - timedelta(days=30)
+        pricing = pricing or TokenPricing.from_env()
         try:
             session = self.Session()
-            cutoff_date = datetime.utcnow() - timedelta(days=7)
-            deleted = session.query(ChatMessage).filter(
-                ChatMessage.timestamp < cutoff_date
-            ).delete()
-            session.commit()
-            logger.info(f"Deleted {deleted} messages older than 7 days")
-            return deleted
+            query = session.query(
+                ChatUsageDaily.usage_date,
+                ChatUsageDaily.application_name,
+                func.sum(ChatUsageDaily.completions),
+                func.sum(ChatUsageDaily.prompt_tokens),
+                func.sum(ChatUsageDaily.cached_tokens),
+                func.sum(ChatUsageDaily.completion_tokens),
+                func.sum(ChatUsageDaily.context_tokens),
+                func.sum(ChatUsageDaily.latency_ms),
+            ).filter(ChatUsageDaily.usage_date.between(start_date, end_date))
+            if application_name is not None:
+                query = query.filter(ChatUsageDaily.application_name == application_name)
+            rows = query.group_by(ChatUsageDaily.usage_date, ChatUsageDaily.application_name)\
+                .order_by(ChatUsageDaily.usage_date, ChatUsageDaily.application_name)\
+                .all()
         except Exception as e:
-            logger.error(f"Error cleaning up old messages: {str(e)}")
-            session.rollback()
-            return 0
+            logger.error(f"Error getting usage summary: {str(e)}")
+            return []
         finally:
             session.close()
 
+        summary = []
+        for usage_date, app, completions, prompt, cached, completion, context, latency_ms in rows:
+            summary.append({
+                "date": usage_date,
+                "application_name": app,
+                "completions": completions,
+                "prompt_tokens": prompt,
+                "cached_tokens": cached,
+                "completion_tokens": completion,
+                "context_tokens": context,
+                "average_latency_ms": round(latency_ms / completions, 1) if completions else None,
+                "cost": round(pricing.cost(prompt, cached, completion), 6),
+            })
+        return summary
+
+    def start_write_behind(self, flush_size=None, flush_interval=None, max_queue_size=None, enqueue_timeout=None):
+        """
+        Switch log_message to write-behind mode.
+
+        Settings fall back to the DB_LOG_FLUSH_SIZE, DB_LOG_FLUSH_INTERVAL,
+        DB_LOG_QUEUE_SIZE and DB_LOG_ENQUEUE_TIMEOUT environment variables.
+        """
+        if self.writer is not None:
+            return self.writer
+        self.writer = WriteBehindWriter(
+            self.log_messages,
+            flush_size=flush_size or int(os.getenv("DB_LOG_FLUSH_SIZE", "50")),
+            flush_interval=flush_interval or float(os.getenv("DB_LOG_FLUSH_INTERVAL", "1.0")),
+            max_queue_size=max_queue_size or int(os.getenv("DB_LOG_QUEUE_SIZE", "1000")),
+            enqueue_timeout=enqueue_timeout or float(os.getenv("DB_LOG_ENQUEUE_TIMEOUT", "5.0")),
+            name="chat-message-writer",
+        )
+        logger.info("Write-behind message logging enabled")
+        return self.writer
+
+    def close(self):
+        """Flush any buffered messages and release pooled connections."""
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        self.dispose()
+
+    def get_pool_status(self):
+        """Return a short description of the connection pool state."""
+        return self.engine.pool.status()
+
+    def dispose(self):
+        """Close all pooled connections."""
+        self.engine.dispose()
+
+    def cleanup_old_messages(self, retention_days=None, batch_size=None, pause=None, max_batches=None,
+                             stop_event=None, progress=None):
+        """
+        Delete messages older than the retention window in bounded batches.
+
+        With the partitioned storage layout this rolls the daily partitions over
+        instead: partitions for the coming days are created and whole expired
+        days are dropped, and the batching arguments are not used.
+
+        Each batch deletes at most batch_size of the oldest expired rows by primary
+        key in its own short transaction, so locks stay at row/page level and
+        concurrent inserts are only blocked briefly. Because every batch is committed
+        as it goes, an interrupted purge loses nothing and simply picks up the
+        remaining rows on the next run. Settings fall back to the CHAT_RETENTION_DAYS,
+        CHAT_PURGE_BATCH_SIZE and CHAT_PURGE_PAUSE environment variables.
+
+        Args:
+            retention_days (float): Age after which messages are deleted (default 7)
+            batch_size (int): Maximum rows deleted per batch (default 4000, below SQL Server's lock escalation threshold)
+            pause (float): Seconds to sleep between batches (default 0.5)
+            max_batches (int): Stop after this many batches; None runs until nothing is left
+            stop_event (threading.Event): Checked between batches to stop early
+            progress (callable): Called as progress(deleted_so_far, batches) after every batch
+
+        Returns:
+            int: Number of messages deleted
+        """
+        if retention_days is None:
+            retention_days = float(os.getenv("CHAT_RETENTION_DAYS", "7"))
+        batch_size = batch_size or int(os.getenv("CHAT_PURGE_BATCH_SIZE", "4000"))
+        if pause is None:
+            pause = float(os.getenv("CHAT_PURGE_PAUSE", "0.5"))
+
+        try:
+            self.ensure_schema()
+        except Exception as e:
+            logger.error(f"Error cleaning up old messages: {str(e)}")
+            return 0
+
+        if self.partitions is not None:
+            try:
+                return self.partitions.rollover(retention_days)
+            except Exception as e:
+                logger.error(f"Error rolling over partitions: {str(e)}")
+                return 0
+
+        # Fix the cutoff up front so rows that age out mid-purge wait for the next run
+        cutoff_date = datetime.utcnow() - timedelta(days=retention_days)
+        return self._delete_in_batches("chat_messages", cutoff_date, batch_size, pause, max_batches,
+                                       stop_event, progress)
+
+    def cleanup_turn_metrics(self, retention_days=None, batch_size=None, pause=None, max_batches=None,
+                             stop_event=None, progress=None):
+        """
+        Delete per-turn usage rows older than the retention window in bounded batches.
+
+        The chat_usage_daily rollup is kept, so usage summaries still cover the
+        purged days. Arguments work as in cleanup_old_messages; retention_days
+        falls back to CHAT_USAGE_RETENTION_DAYS (default 90).
+
+        Returns:
+            int: Number of rows deleted
+        """
+        if retention_days is None:
+            retention_days = float(os.getenv("CHAT_USAGE_RETENTION_DAYS", "90"))
+        batch_size = batch_size or int(os.getenv("CHAT_PURGE_BATCH_SIZE", "4000"))
+        if pause is None:
+            pause = float(os.getenv("CHAT_PURGE_PAUSE", "0.5"))
+
+        try:
+            self.ensure_schema()
+        except Exception as e:
+            logger.error(f"Error cleaning up turn metrics: {str(e)}")
+            return 0
+
+        cutoff_date = datetime.utcnow() - timedelta(days=retention_days)
+        return self._delete_in_batches("chat_turn_metrics", cutoff_date, batch_size, pause, max_batches,
+                                       stop_event, progress)
+
+    def _delete_in_batches(self, table, cutoff_date, batch_size, pause, max_batches, stop_event, progress):
+        """Delete rows of table with timestamp before cutoff_date, oldest ids first, one batch per transaction."""
+        if self.engine.dialect.name == "mssql":
+            delete_sql = text(f"""
+                WITH batch AS (
+                    SELECT TOP (:batch_size) id FROM {table}
+                    WHERE timestamp < :cutoff
+                    ORDER BY id
+                )
+                DELETE FROM batch
+            """)
+        else:
+            delete_sql = text(f"""
+                DELETE FROM {table} WHERE id IN (
+                    SELECT id FROM {table}
+                    WHERE timestamp < :cutoff
+                    ORDER BY id
+                    LIMIT :batch_size
+                )
+            """)
+        delete_sql = delete_sql.bindparams(bindparam("cutoff", type_=DateTime()))
+
+        deleted = 0
+        batches = 0
+        start = time.monotonic()
+        while True:
+            if stop_event is not None and stop_event.is_set():
+                logger.info(f"Purge of {table} stopped after {batches} batches; remaining rows are deleted on the next run")
+                break
+            try:
+                with self.engine.begin() as conn:
+                    count = conn.execute(delete_sql, {"batch_size": batch_size, "cutoff": cutoff_date}).rowcount
+            except Exception as e:
+                logger.error(f"Error purging {table} after {deleted} rows: {str(e)}")
+                break
+
+            deleted += count
+            batches += 1
+            if progress is not None:
+                progress(deleted, batches)
+            logger.debug(f"Purge batch {batches}: deleted {count} rows from {table} ({deleted} total)")
+
+            if count < batch_size or (max_batches is not None and batches >= max_batches):
+                break
+            if stop_event is not None:
+                stop_event.wait(pause)
+            else:
+                time.sleep(pause)
+
+        logger.info(f"Deleted {deleted} rows older than {cutoff_date:%Y-%m-%d %H:%M} from {table} in {batches} batches "
+                    f"({time.monotonic() - start:.1f}s)")
+        return deleted
+
     def get_message_count(self):
         """Get the total number of messages in the database."""
         try:
@@ -105,10 +564,16 @@ class DatabaseManager:
             session.close()
 
     def get_recent_messages(self, limit=100):
-        """Get the most recent messages from the database."""
+        """
+        Get the most recent messages from the database.
+
+        Registered prompts are loaded with the messages, so full_content gives the
+        complete text of every row.
+        """
         try:
             session = self.Session()
             messages = session.query(ChatMessage)\
+                .options(joinedload(ChatMessage.prompt))\
                 .order_by(ChatMessage.timestamp.desc())\
                 .limit(limit)\
                 .all()
@@ -119,6 +584,43 @@ class DatabaseManager:
         finally:
             session.close()
 
+    def get_transcript(self, conversation_id):
+        """
+        Get every message of a conversation in sequence order.
+
+        Served by the (conversation_id, sequence) index, with registered prompts
+        loaded so full_content gives the complete text.
+        """
+        try:
+            session = self.Session()
+            return session.query(ChatMessage)\
+                .options(joinedload(ChatMessage.prompt))\
+                .filter(ChatMessage.conversation_id == conversation_id)\
+                .order_by(ChatMessage.sequence)\
+                .all()
+        except Exception as e:
+            logger.error(f"Error getting transcript: {str(e)}")
+            return []
+        finally:
+            session.close()
+
+    def get_latest_summary(self, conversation_id=None):
+        """Get the most recent conversation summary, or an empty string if there is none."""
+        try:
+            session = self.Session()
+            query = session.query(ChatMessage)\
+                .filter(ChatMessage.application_name == self.application_name)\
+                .filter(ChatMessage.chat_role == ChatRole.SUMMARY.value)
+            if conversation_id is not None:
+                query = query.filter(ChatMessage.conversation_id == conversation_id)
+            message = query.order_by(ChatMessage.id.desc()).first()
+            return message.message_content if message else ""
+        except Exception as e:
+            logger.error(f"Error getting latest summary: {str(e)}")
+            return ""
+        finally:
+            session.close()
+
     def get_message_count_by_role(self):
         """Get the count of messages for each role."""
         try:
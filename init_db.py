@@ -1,7 +1,18 @@
-import pyodbc
+import os
+from urllib.parse import quote_plus
+from dotenv import load_dotenv
 from db_manager import DatabaseManager
 
 def init_database():
+    # CHAT_DATABASE_URL points the app at any SQLAlchemy database; migrate that one instead
+    load_dotenv()
+    database_url = os.getenv("CHAT_DATABASE_URL")
+    if database_url:
+        migrate(database_url)
+        return
+    
+    import pyodbc
+    
     # Get the connection string
     conn_str = DatabaseManager.get_connection_string()
     
@@ -18,30 +29,6 @@ def init_database():
         END
         """)
         conn.commit()
-        
-        # Switch to azure_ai_chat database
-        conn.close()
-        conn_str = conn_str.replace("DATABASE=master;", "DATABASE=azure_ai_chat;")
-        conn = pyodbc.connect(conn_str)
-        cursor = conn.cursor()
-        
-        # Create chat_messages table if it doesn't exist
-        cursor.execute("""
-        IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'chat_messages')
-        BEGIN
-            CREATE TABLE chat_messages (
-                id INT IDENTITY(1,1) PRIMARY KEY,
-                application_name NVARCHAR(100) NOT NULL,
-                chat_role NVARCHAR(20) NOT NULL,
-                sequence INT NOT NULL,
-                timestamp DATETIME NOT NULL DEFAULT GETDATE(),
-                message_content NVARCHAR(4000) NOT NULL
-            )
-        END
-        """)
-        conn.commit()
-        print("Database and tables created successfully!")
-        
     except Exception as e:
         print(f"Error: {str(e)}")
         raise
@@ -49,5 +36,21 @@ def init_database():
         cursor.close()
         conn.close()
 
+    # Create or upgrade the chat tables in azure_ai_chat
+    conn_str = conn_str.replace("DATABASE=master;", "DATABASE=azure_ai_chat;")
+    migrate(f"mssql+pyodbc:///?odbc_connect={quote_plus(conn_str)}")
+
+def migrate(database_url):
+    """Create or upgrade the chat tables in the database at database_url."""
+    db_manager = DatabaseManager(database_url, "Azure AI Chat")
+    try:
+        version = db_manager.migrate()
+        print(f"Database and tables created successfully! (schema version {version})")
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        raise
+    finally:
+        db_manager.dispose()
+
 if __name__ == "__main__":
     init_database()
@@ -0,0 +1,48 @@
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LazyClient:
+    """
+    Stand-in for a client that is only built the first time it is used.
+
+    Attribute access is forwarded to the real client, so a LazyClient can be
+    passed anywhere the client itself is expected. Construction is thread-safe:
+    concurrent first uses wait for a single factory call.
+    """
+
+    def __init__(self, factory, name):
+        """
+        Args:
+            factory (callable): Builds and returns the real client
+            name (str): Used in log messages
+        """
+        self._factory = factory
+        self._name = name
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return the real client, building it on first use."""
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    logger.info(f"Initializing {self._name} client")
+                    self._instance = self._factory()
+                instance = self._instance
+        return instance
+
+    def peek(self):
+        """Return the real client if it has been built, otherwise None."""
+        return self._instance
+
+    def __getattr__(self, name):
+        # Only called for attributes not found on the LazyClient itself
+        return getattr(self.get(), name)
+
+    def __repr__(self):
+        state = "initialized" if self._instance is not None else "not initialized"
+        return f"<LazyClient({self._name}, {state})>"
@@ -0,0 +1,137 @@
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class WriteBehindWriter:
+    """
+    Buffer rows in a bounded queue and flush them in batches from a background thread.
+
+    Producers call submit() and return immediately. The worker flushes whenever
+    flush_size rows are waiting or flush_interval seconds have passed since the
+    first buffered row. When the queue is full, submit() blocks for up to
+    enqueue_timeout seconds and then writes the row synchronously, so rows are
+    never dropped. When a batch fails, its rows are retried one at a time, so a
+    single bad row costs only itself; rows that still fail are logged and counted
+    as failed. close() drains everything that is still queued.
+    """
+
+    def __init__(self, flush_func, flush_size=50, flush_interval=1.0, max_queue_size=1000,
+                 enqueue_timeout=5.0, name="write-behind"):
+        """
+        Args:
+            flush_func (callable): Writes a list of rows; returns True on success
+            flush_size (int): Maximum rows per batch
+            flush_interval (float): Maximum seconds a row waits before being flushed
+            max_queue_size (int): Queue capacity before producers are slowed down
+            enqueue_timeout (float): Seconds submit() blocks on a full queue
+            name (str): Name of the worker thread
+        """
+        self.flush_func = flush_func
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.stats = {"submitted": 0, "flushed": 0, "batches": 0, "failed": 0, "sync_fallbacks": 0,
+                      "split_batches": 0}
+        self._stats_lock = threading.Lock()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    def submit(self, row):
+        """Queue a row for writing. Returns False only if the writer is closed and the direct write fails."""
+        if self._closed:
+            return self._flush([row])
+        try:
+            self.queue.put(row, timeout=self.enqueue_timeout)
+        except queue.Full:
+            logger.warning("Write-behind queue full; writing row synchronously")
+            self._count("sync_fallbacks")
+            return self._flush([row])
+        self._count("submitted")
+        return True
+
+    def close(self, timeout=None):
+        """Stop accepting rows, flush everything queued and wait for the worker to exit."""
+        if self._closed:
+            return
+        self._closed = True
+        self.queue.put(_STOP)
+        self._worker.join(timeout)
+        logger.info(f"Write-behind writer closed: {self.stats}")
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def _write(self, rows):
+        try:
+            return self.flush_func(rows)
+        except Exception as e:
+            logger.error(f"Error flushing {len(rows)} buffered rows: {str(e)}")
+            return False
+
+    def _flush(self, rows):
+        if self._write(rows):
+            self._count("flushed", len(rows))
+            self._count("batches")
+            return True
+        if len(rows) == 1:
+            logger.error(f"Lost buffered row: {str(rows[0])[:200]}")
+            self._count("failed")
+            return False
+
+        logger.warning(f"Batch of {len(rows)} rows failed; retrying row by row")
+        self._count("split_batches")
+        lost = 0
+        for row in rows:
+            if self._write([row]):
+                self._count("flushed")
+            else:
+                logger.error(f"Lost buffered row: {str(row)[:200]}")
+                lost += 1
+        self._count("failed", lost)
+        if lost:
+            logger.error(f"{lost} of {len(rows)} rows of a failed batch could not be written")
+        return lost == 0
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            stopping = item is _STOP
+            if item is not None and not stopping:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            if batch and (stopping or len(batch) >= self.flush_size or time.monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+                deadline = None
+
+            if stopping:
+                # Drain anything that raced in ahead of the close() call
+                remaining = []
+                while True:
+                    try:
+                        item = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not _STOP:
+                        remaining.append(item)
+                for start in range(0, len(remaining), self.flush_size):
+                    self._flush(remaining[start:start + self.flush_size])
+                return
@@ -0,0 +1,371 @@
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import IntegrityError
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Migration:
+    """
+    One versioned schema change.
+
+    Statements are kept per dialect ("mssql" and "sqlite"). Each statement is
+    either a SQL string or a callable taking the open connection. Every statement
+    is idempotent, so databases created before versioning existed (which already
+    have part of the schema) can be brought up to date by replaying the full list.
+    """
+
+    def __init__(self, version, description, mssql, sqlite):
+        self.version = version
+        self.description = description
+        self.statements = {"mssql": mssql, "sqlite": sqlite}
+
+    def __repr__(self):
+        return f"<Migration(version={self.version}, description={self.description!r})>"
+
+
+def _sqlite_add_column(table, column, definition):
+    """SQLite has no ADD COLUMN IF NOT EXISTS, so check the table first."""
+    def add_column(conn):
+        columns = [row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")]
+        if column not in columns:
+            conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return add_column
+
+
+MIGRATIONS = [
+    Migration(
+        1, "Create chat_messages",
+        mssql=[
+            """
+            IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'chat_messages')
+            BEGIN
+                CREATE TABLE chat_messages (
+                    id INT IDENTITY(1,1) PRIMARY KEY,
+                    application_name NVARCHAR(100) NOT NULL,
+                    chat_role NVARCHAR(20) NOT NULL,
+                    sequence INT NOT NULL,
+                    timestamp DATETIME NOT NULL DEFAULT GETDATE(),
+                    message_content NVARCHAR(4000) NOT NULL
+                )
+            END
+            """,
+        ],
+        sqlite=[
+            """
+            CREATE TABLE IF NOT EXISTS chat_messages (
+                id INTEGER PRIMARY KEY,
+                application_name VARCHAR(100) NOT NULL,
+                chat_role VARCHAR(20) NOT NULL,
+                sequence INTEGER NOT NULL,
+                timestamp DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                message_content VARCHAR(4000) NOT NULL
+            )
+            """,
+        ],
+    ),
+    Migration(
+        2, "Add the chat_prompts registry",
+        mssql=[
+            """
+            IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'chat_prompts')
+            BEGIN
+                CREATE TABLE chat_prompts (
+                    id INT IDENTITY(1,1) PRIMARY KEY,
+                    content_hash CHAR(64) NOT NULL CONSTRAINT uq_chat_prompts_content_hash UNIQUE,
+                    content NVARCHAR(MAX) NOT NULL,
+                    created_at DATETIME NOT NULL DEFAULT GETDATE()
+                )
+            END
+            """,
+            """
+            IF COL_LENGTH('chat_messages', 'prompt_id') IS NULL
+            BEGIN
+                ALTER TABLE chat_messages ADD prompt_id INT NULL
+                    CONSTRAINT fk_chat_messages_prompt_id_chat_prompts REFERENCES chat_prompts (id)
+            END
+            """,
+        ],
+        sqlite=[
+            """
+            CREATE TABLE IF NOT EXISTS chat_prompts (
+                id INTEGER PRIMARY KEY,
+                content_hash VARCHAR(64) NOT NULL CONSTRAINT uq_chat_prompts_content_hash UNIQUE,
+                content TEXT NOT NULL,
+                created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            _sqlite_add_column("chat_messages", "prompt_id", "INTEGER REFERENCES chat_prompts (id)"),
+        ],
+    ),
+    Migration(
+        3, "Add conversation_id",
+        mssql=[
+            """
+            IF COL_LENGTH('chat_messages', 'conversation_id') IS NULL
+            BEGIN
+                ALTER TABLE chat_messages ADD conversation_id NVARCHAR(32) NULL
+            END
+            """,
+            """
+            IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'ix_chat_messages_conversation_id_sequence')
+            BEGIN
+                CREATE UNIQUE INDEX ix_chat_messages_conversation_id_sequence
+                    ON chat_messages (conversation_id, sequence)
+                    WHERE conversation_id IS NOT NULL
+            END
+            """,
+        ],
+        sqlite=[
+            _sqlite_add_column("chat_messages", "conversation_id", "VARCHAR(32)"),
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS ix_chat_messages_conversation_id_sequence
+                ON chat_messages (conversation_id, sequence)
+                WHERE conversation_id IS NOT NULL
+            """,
+        ],
+    ),
+    Migration(
+        4, "Index chat_messages for recent-message, retention and per-role queries",
+        mssql=[
+            """
+            IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'ix_chat_messages_timestamp')
+            BEGIN
+                CREATE INDEX ix_chat_messages_timestamp ON chat_messages (timestamp)
+            END
+            """,
+            """
+            IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'ix_chat_messages_application_name_chat_role')
+            BEGIN
+                CREATE INDEX ix_chat_messages_application_name_chat_role
+                    ON chat_messages (application_name, chat_role)
+            END
+            """,
+        ],
+        sqlite=[
+            "CREATE INDEX IF NOT EXISTS ix_chat_messages_timestamp ON chat_messages (timestamp)",
+            """
+            CREATE INDEX IF NOT EXISTS ix_chat_messages_application_name_chat_role
+                ON chat_messages (application_name, chat_role)
+            """,
+        ],
+    ),
+    Migration(
+        5, "Add maintenance_leases for scheduled jobs",
+        mssql=[
+            """
+            IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'maintenance_leases')
+            BEGIN
+                CREATE TABLE maintenance_leases (
+                    job_name NVARCHAR(100) PRIMARY KEY,
+                    owner NVARCHAR(200) NOT NULL,
+                    expires_at DATETIME NOT NULL,
+                    last_run_at DATETIME NULL,
+                    last_status NVARCHAR(20) NULL,
+                    last_duration_ms INT NULL
+                )
+            END
+            """,
+        ],
+        sqlite=[
+            """
+            CREATE TABLE IF NOT EXISTS maintenance_leases (
+                job_name VARCHAR(100) PRIMARY KEY,
+                owner VARCHAR(200) NOT NULL,
+                expires_at DATETIME NOT NULL,
+                last_run_at DATETIME,
+                last_status VARCHAR(20),
+                last_duration_ms INTEGER
+            )
+            """,
+        ],
+    ),
+    Migration(
+        6, "Add per-turn token usage and its daily rollup",
+        mssql=[
+            """
+            IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'chat_turn_metrics')
+            BEGIN
+                CREATE TABLE chat_turn_metrics (
+                    id INT IDENTITY(1,1) PRIMARY KEY,
+                    application_name NVARCHAR(100) NOT NULL,
+                    conversation_id NVARCHAR(32) NULL,
+                    turn_id NVARCHAR(32) NULL,
+                    timestamp DATETIME NOT NULL DEFAULT GETUTCDATE(),
+                    model NVARCHAR(100) NOT NULL,
+                    prompt_tokens INT NOT NULL,
+                    cached_tokens INT NOT NULL,
+                    completion_tokens INT NOT NULL,
+                    context_tokens INT NULL,
+                    latency_ms INT NOT NULL,
+                    estimated BIT NOT NULL DEFAULT 0
+                )
+            END
+            """,
+            """
+            IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'ix_chat_turn_metrics_conversation_id')
+            BEGIN
+                CREATE INDEX ix_chat_turn_metrics_conversation_id ON chat_turn_metrics (conversation_id)
+            END
+            """,
+            """
+            IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'ix_chat_turn_metrics_timestamp')
+            BEGIN
+                CREATE INDEX ix_chat_turn_metrics_timestamp ON chat_turn_metrics (timestamp)
+            END
+            """,
+            """
+            IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'chat_usage_daily')
+            BEGIN
+                CREATE TABLE chat_usage_daily (
+                    application_name NVARCHAR(100) NOT NULL,
+                    usage_date DATE NOT NULL,
+                    model NVARCHAR(100) NOT NULL,
+                    completions INT NOT NULL,
+                    prompt_tokens BIGINT NOT NULL,
+                    cached_tokens BIGINT NOT NULL,
+                    completion_tokens BIGINT NOT NULL,
+                    context_tokens BIGINT NOT NULL,
+                    latency_ms BIGINT NOT NULL,
+                    CONSTRAINT pk_chat_usage_daily PRIMARY KEY (application_name, usage_date, model)
+                )
+            END
+            """,
+            """
+            IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'ix_chat_usage_daily_usage_date')
+            BEGIN
+                CREATE INDEX ix_chat_usage_daily_usage_date ON chat_usage_daily (usage_date)
+            END
+            """,
+        ],
+        sqlite=[
+            """
+            CREATE TABLE IF NOT EXISTS chat_turn_metrics (
+                id INTEGER PRIMARY KEY,
+                application_name VARCHAR(100) NOT NULL,
+                conversation_id VARCHAR(32),
+                turn_id VARCHAR(32),
+                timestamp DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                model VARCHAR(100) NOT NULL,
+                prompt_tokens INTEGER NOT NULL,
+                cached_tokens INTEGER NOT NULL,
+                completion_tokens INTEGER NOT NULL,
+                context_tokens INTEGER,
+                latency_ms INTEGER NOT NULL,
+                estimated BOOLEAN NOT NULL DEFAULT 0
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS ix_chat_turn_metrics_conversation_id ON chat_turn_metrics (conversation_id)",
+            "CREATE INDEX IF NOT EXISTS ix_chat_turn_metrics_timestamp ON chat_turn_metrics (timestamp)",
+            """
+            CREATE TABLE IF NOT EXISTS chat_usage_daily (
+                application_name VARCHAR(100) NOT NULL,
+                usage_date DATE NOT NULL,
+                model VARCHAR(100) NOT NULL,
+                completions INTEGER NOT NULL,
+                prompt_tokens INTEGER NOT NULL,
+                cached_tokens INTEGER NOT NULL,
+                completion_tokens INTEGER NOT NULL,
+                context_tokens INTEGER NOT NULL,
+                latency_ms INTEGER NOT NULL,
+                CONSTRAINT pk_chat_usage_daily PRIMARY KEY (application_name, usage_date, model)
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS ix_chat_usage_daily_usage_date ON chat_usage_daily (usage_date)",
+        ],
+    ),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+_VERSION_TABLE = {
+    "mssql": """
+        IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'schema_migrations')
+        BEGIN
+            CREATE TABLE schema_migrations (
+                version INT PRIMARY KEY,
+                description NVARCHAR(200) NOT NULL,
+                applied_at DATETIME NOT NULL DEFAULT GETDATE()
+            )
+        END
+    """,
+    "sqlite": """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description VARCHAR(200) NOT NULL,
+            applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+}
+
+
+def _dialect(engine):
+    name = engine.dialect.name
+    if name not in _VERSION_TABLE:
+        raise ValueError(f"No migrations defined for the {name} dialect")
+    return name
+
+
+def get_schema_version(engine):
+    """
+    Return the highest applied migration version, or 0 for an unversioned database.
+
+    Read-only: a catalog lookup and one SELECT, without any DDL.
+    """
+    with engine.connect() as conn:
+        if not engine.dialect.has_table(conn, "schema_migrations"):
+            return 0
+        return conn.execute(text("SELECT MAX(version) FROM schema_migrations")).scalar() or 0
+
+
+def apply_migrations(engine, target_version=None):
+    """
+    Bring the chat schema up to target_version (the latest by default).
+
+    Each migration runs in its own transaction together with its schema_migrations
+    row, so an interrupted upgrade resumes at the first missing version.
+
+    Args:
+        engine: SQLAlchemy engine for a SQL Server or SQLite database
+        target_version (int): Stop after this version; None applies everything
+
+    Returns:
+        int: The schema version after the upgrade
+    """
+    dialect = _dialect(engine)
+    target = LATEST_VERSION if target_version is None else target_version
+    with engine.begin() as conn:
+        conn.exec_driver_sql(_VERSION_TABLE[dialect])
+    current = get_schema_version(engine)
+
+    for migration in MIGRATIONS:
+        if migration.version <= current or migration.version > target:
+            continue
+        try:
+            with engine.begin() as conn:
+                for statement in migration.statements[dialect]:
+                    if callable(statement):
+                        statement(conn)
+                    else:
+                        conn.exec_driver_sql(statement)
+                conn.execute(text(
+                    "INSERT INTO schema_migrations (version, description) VALUES (:version, :description)"
+                ), {"version": migration.version, "description": migration.description})
+        except IntegrityError:
+            # Another process applied this version first
+            logger.info(f"Schema migration {migration.version} was applied concurrently")
+            continue
+        current = migration.version
+        logger.info(f"Applied schema migration {migration.version}: {migration.description}")
+
+    return max(current, get_schema_version(engine))
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 2:
+        print("Usage: python migrations.py <sqlalchemy-url>")
+        sys.exit(1)
+    logging.basicConfig(level=logging.INFO)
+    print(f"Schema version: {apply_migrations(create_engine(sys.argv[1]))}")
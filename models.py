@@ -1,9 +1,11 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, Enum, create_engine, MetaData
+from sqlalchemy import (BigInteger, Boolean, Column, Date, Integer, String, DateTime, Enum, ForeignKey, Index,
+                        create_engine, MetaData)
 from sqlalchemy.dialects.mssql import NVARCHAR
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-import enum
+from chat_roles import ChatRole  # noqa: F401  (re-exported for existing imports)
 
 # Configure the MetaData with naming convention
 naming_convention = {
@@ -17,10 +19,16 @@ naming_convention = {
 metadata = MetaData(naming_convention=naming_convention)
 Base = declarative_base(metadata=metadata)
 
-class ChatRole(enum.Enum):
-    SYSTEM = "system"
-    USER = "user"
-    ASSISTANT = "assistant"
+class ChatPrompt(Base):
+    __tablename__ = 'chat_prompts'
+
+    id = Column(Integer, primary_key=True)
+    content_hash = Column(String(64), nullable=False, unique=True)
+    content = Column(NVARCHAR(None), nullable=False)
+    created_at = Column(DateTime(timezone=False), server_default=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<ChatPrompt(id={self.id}, hash={self.content_hash[:12]})>"
 
 class ChatMessage(Base):
     __tablename__ = 'chat_messages'
@@ -31,10 +39,83 @@ class ChatMessage(Base):
     sequence = Column(Integer, nullable=False)
     timestamp = Column(DateTime(timezone=False), server_default=func.now(), nullable=False)
     message_content = Column(NVARCHAR(4000), nullable=False)
+    prompt_id = Column(Integer, ForeignKey('chat_prompts.id'), nullable=True)
+    conversation_id = Column(NVARCHAR(32), nullable=True)
+
+    prompt = relationship(ChatPrompt)
+
+    __table_args__ = (
+        # Transcripts are read back with one seek; rows logged before conversations existed are excluded
+        Index(
+            'ix_chat_messages_conversation_id_sequence', 'conversation_id', 'sequence',
+            unique=True,
+            mssql_where=conversation_id.isnot(None),
+            sqlite_where=conversation_id.isnot(None),
+        ),
+        # Recent-message listing and the retention purge range-scan on timestamp
+        Index('ix_chat_messages_timestamp', 'timestamp'),
+        # Per-application, per-role lookups (latest summary) skip the base table
+        Index('ix_chat_messages_application_name_chat_role', 'application_name', 'chat_role'),
+    )
+
+    @property
+    def full_content(self):
+        """Message text, resolving rows that reference a registered prompt."""
+        if self.prompt_id is not None and self.prompt is not None:
+            return self.prompt.content
+        return self.message_content
 
     def __repr__(self):
         return f"<ChatMessage(id={self.id}, role={self.chat_role}, sequence={self.sequence})>"
 
+class ChatTurnMetric(Base):
+    __tablename__ = 'chat_turn_metrics'
+
+    id = Column(Integer, primary_key=True)
+    application_name = Column(NVARCHAR(100), nullable=False)
+    conversation_id = Column(NVARCHAR(32), nullable=True)
+    turn_id = Column(NVARCHAR(32), nullable=True)
+    timestamp = Column(DateTime(timezone=False), server_default=func.now(), nullable=False)
+    model = Column(NVARCHAR(100), nullable=False)
+    prompt_tokens = Column(Integer, nullable=False)
+    cached_tokens = Column(Integer, nullable=False)
+    completion_tokens = Column(Integer, nullable=False)
+    # Tokens of the retrieved context within prompt_tokens, when a tokenizer was available
+    context_tokens = Column(Integer, nullable=True)
+    latency_ms = Column(Integer, nullable=False)
+    # Counted locally because the response carried no usage (streamed completions)
+    estimated = Column(Boolean, nullable=False, default=False)
+
+    __table_args__ = (
+        Index('ix_chat_turn_metrics_conversation_id', 'conversation_id'),
+        # Retention purge
+        Index('ix_chat_turn_metrics_timestamp', 'timestamp'),
+    )
+
+    def __repr__(self):
+        return f"<ChatTurnMetric(id={self.id}, model={self.model}, prompt={self.prompt_tokens}, completion={self.completion_tokens})>"
+
+class ChatUsageDaily(Base):
+    """Token usage per application, UTC day and model, maintained as each turn is recorded."""
+    __tablename__ = 'chat_usage_daily'
+
+    application_name = Column(NVARCHAR(100), primary_key=True)
+    usage_date = Column(Date, primary_key=True)
+    model = Column(NVARCHAR(100), primary_key=True)
+    completions = Column(Integer, nullable=False)
+    prompt_tokens = Column(BigInteger, nullable=False)
+    cached_tokens = Column(BigInteger, nullable=False)
+    completion_tokens = Column(BigInteger, nullable=False)
+    context_tokens = Column(BigInteger, nullable=False)
+    latency_ms = Column(BigInteger, nullable=False)
+
+    __table_args__ = (
+        Index('ix_chat_usage_daily_usage_date', 'usage_date'),
+    )
+
+    def __repr__(self):
+        return f"<ChatUsageDaily({self.application_name}, {self.usage_date}, {self.model}, completions={self.completions})>"
+
 def init_db(connection_string):
     """Initialize the database and create tables."""
     engine = create_engine(connection_string)
@@ -0,0 +1,387 @@
+from datetime import date, datetime, timedelta
+from sqlalchemy import text
+import logging
+
+logger = logging.getLogger(__name__)
+
+PARTITION_FUNCTION = "pf_chat_messages_day"
+PARTITION_SCHEME = "ps_chat_messages_day"
+SEQUENCE_TABLE = "chat_message_sequences"
+
+# Raised on a (conversation_id, sequence) clash, worded like SQLite's own unique index error
+_SEQUENCE_CLASH = "UNIQUE constraint failed: chat_messages.conversation_id, chat_messages.sequence"
+
+# Column list shared by the SQLite daily tables, the view and the insert trigger
+_COLUMNS = ["id", "application_name", "chat_role", "sequence", "timestamp", "message_content", "prompt_id",
+            "conversation_id"]
+
+
+class PartitionManager:
+    """
+    Keep chat_messages partitioned by day so expiring data is a metadata operation.
+
+    On SQL Server the table is clustered on (timestamp, id) over a RANGE RIGHT
+    partition function with one boundary per day. Rollover splits in empty
+    partitions ahead of time, and expired days are removed with
+    TRUNCATE ... WITH (PARTITIONS) followed by a MERGE of the emptied boundary.
+
+    On the SQLite stand-in every day is its own chat_messages_YYYYMMDD table,
+    chat_messages becomes a UNION ALL view over them, and an INSTEAD OF INSERT
+    trigger routes new rows to the table for their day. Expired days are dropped.
+
+    In both layouts the (conversation_id, sequence) index is no longer unique
+    across the table, since unique indexes must contain the partitioning column.
+    Uniqueness is enforced elsewhere, so a clash between two writers still fails
+    the insert and DatabaseManager.log_messages re-sequences the row: on SQL
+    Server an insert trigger copies every key into the unpartitioned
+    chat_message_sequences table, whose primary key rejects duplicates, and on
+    SQLite the insert trigger checks the view and aborts.
+    """
+
+    def __init__(self, engine, days_ahead=3):
+        """
+        Args:
+            engine: SQLAlchemy engine for the chat database
+            days_ahead (int): Number of future days that always have a partition ready
+        """
+        self.engine = engine
+        self.days_ahead = days_ahead
+        self.dialect = engine.dialect.name
+        if self.dialect not in ("mssql", "sqlite"):
+            raise ValueError(f"Partitioned storage is not supported for the {self.dialect} dialect")
+
+    def is_partitioned(self):
+        """Return True if chat_messages already uses the daily layout."""
+        with self.engine.begin() as conn:
+            if self.dialect == "mssql":
+                return conn.execute(text("""
+                    SELECT COUNT(*) FROM sys.indexes i
+                    JOIN sys.partition_schemes ps ON ps.data_space_id = i.data_space_id
+                    WHERE i.object_id = OBJECT_ID('chat_messages') AND i.index_id <= 1
+                """)).scalar() > 0
+            return conn.execute(text(
+                "SELECT type FROM sqlite_master WHERE name = 'chat_messages'"
+            )).scalar() == "view"
+
+    def setup(self, retention_days):
+        """
+        Convert chat_messages to the daily layout if needed, then roll partitions over.
+
+        The conversion rewrites the whole table once, so on a large SQL Server
+        table run it during a maintenance window (e.g. via init_db.py).
+
+        Returns:
+            int: Rows removed by the initial rollover
+        """
+        if not self.is_partitioned():
+            if self.dialect == "mssql":
+                self._convert_mssql(retention_days)
+            else:
+                self._convert_sqlite()
+            logger.info("chat_messages converted to daily partitions")
+        if self.dialect == "mssql":
+            # Databases converted before the sequence table existed get it here
+            self._create_sequence_guard_mssql()
+        return self.rollover(retention_days)
+
+    def rollover(self, retention_days):
+        """
+        Create partitions for the coming days and remove days older than the retention window.
+
+        Whole days are dropped once they are entirely older than the cutoff, so
+        rows are kept for up to one day longer than retention_days.
+
+        Returns:
+            int: Number of expired rows removed
+        """
+        cutoff_day = (datetime.utcnow() - timedelta(days=retention_days)).date()
+        last_day = datetime.utcnow().date() + timedelta(days=self.days_ahead)
+        if self.dialect == "mssql":
+            self._split_mssql(last_day)
+            removed = self._expire_mssql(cutoff_day)
+        else:
+            removed = self._rollover_sqlite(cutoff_day, last_day)
+        logger.info(f"Partition rollover removed {removed} messages older than {cutoff_day.isoformat()}")
+        return removed
+
+    def list_partitions(self):
+        """
+        Return the current daily partitions.
+
+        Returns:
+            list: (first_day, row_count) tuples in day order; first_day is None for the
+                SQL Server partition below the lowest boundary
+        """
+        if self.dialect == "mssql":
+            with self.engine.begin() as conn:
+                rows = conn.execute(text(f"""
+                    SELECT p.partition_number, CAST(rv.value AS DATETIME), p.rows
+                    FROM sys.partitions p
+                    LEFT JOIN sys.partition_range_values rv
+                        ON rv.function_id = (SELECT function_id FROM sys.partition_functions
+                                             WHERE name = '{PARTITION_FUNCTION}')
+                        AND rv.boundary_id = p.partition_number - 1
+                    WHERE p.object_id = OBJECT_ID('chat_messages') AND p.index_id <= 1
+                    ORDER BY p.partition_number
+                """)).fetchall()
+            return [(value.date() if value is not None else None, count) for _, value, count in rows]
+
+        with self.engine.begin() as conn:
+            return [(day, conn.execute(text(f"SELECT COUNT(*) FROM {self._table(day)}")).scalar())
+                    for day in self._sqlite_days(conn)]
+
+    # SQL Server
+
+    def _boundaries(self, conn):
+        rows = conn.execute(text(f"""
+            SELECT CAST(rv.value AS DATETIME) FROM sys.partition_range_values rv
+            JOIN sys.partition_functions pf ON pf.function_id = rv.function_id
+            WHERE pf.name = '{PARTITION_FUNCTION}'
+            ORDER BY rv.boundary_id
+        """)).scalars().all()
+        return [value.date() for value in rows]
+
+    def _convert_mssql(self, retention_days):
+        first_day = (datetime.utcnow() - timedelta(days=retention_days)).date()
+        last_day = datetime.utcnow().date() + timedelta(days=self.days_ahead)
+        boundaries = ", ".join(f"'{day.isoformat()}'" for day in _days(first_day, last_day))
+
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql(f"""
+                IF NOT EXISTS (SELECT * FROM sys.partition_functions WHERE name = '{PARTITION_FUNCTION}')
+                BEGIN
+                    CREATE PARTITION FUNCTION {PARTITION_FUNCTION} (DATETIME) AS RANGE RIGHT FOR VALUES ({boundaries})
+                END
+            """)
+            conn.exec_driver_sql(f"""
+                IF NOT EXISTS (SELECT * FROM sys.partition_schemes WHERE name = '{PARTITION_SCHEME}')
+                BEGIN
+                    CREATE PARTITION SCHEME {PARTITION_SCHEME} AS PARTITION {PARTITION_FUNCTION} ALL TO ([PRIMARY])
+                END
+            """)
+            # Every index must be aligned with the scheme for partition truncation to work
+            for index in ("ix_chat_messages_timestamp", "ix_chat_messages_conversation_id_sequence",
+                          "ix_chat_messages_application_name_chat_role"):
+                conn.exec_driver_sql(f"""
+                    IF EXISTS (SELECT * FROM sys.indexes WHERE name = '{index}')
+                    BEGIN
+                        DROP INDEX {index} ON chat_messages
+                    END
+                """)
+            conn.exec_driver_sql("""
+                DECLARE @pk SYSNAME = (SELECT name FROM sys.key_constraints
+                                       WHERE parent_object_id = OBJECT_ID('chat_messages') AND type = 'PK')
+                IF @pk IS NOT NULL
+                BEGIN
+                    EXEC('ALTER TABLE chat_messages DROP CONSTRAINT ' + @pk)
+                END
+            """)
+            # The clustered key leads with timestamp, so it also replaces ix_chat_messages_timestamp
+            conn.exec_driver_sql(f"""
+                ALTER TABLE chat_messages ADD CONSTRAINT pk_chat_messages
+                    PRIMARY KEY CLUSTERED (timestamp, id) ON {PARTITION_SCHEME} (timestamp)
+            """)
+            conn.exec_driver_sql(f"""
+                CREATE INDEX ix_chat_messages_conversation_id_sequence
+                    ON chat_messages (conversation_id, sequence)
+                    WHERE conversation_id IS NOT NULL
+                    ON {PARTITION_SCHEME} (timestamp)
+            """)
+            conn.exec_driver_sql(f"""
+                CREATE INDEX ix_chat_messages_application_name_chat_role
+                    ON chat_messages (application_name, chat_role)
+                    ON {PARTITION_SCHEME} (timestamp)
+            """)
+
+    def _create_sequence_guard_mssql(self):
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql(f"""
+                IF OBJECT_ID('{SEQUENCE_TABLE}') IS NULL
+                BEGIN
+                    CREATE TABLE {SEQUENCE_TABLE} (
+                        conversation_id NVARCHAR(32) NOT NULL,
+                        sequence INT NOT NULL,
+                        timestamp DATETIME NOT NULL,
+                        CONSTRAINT pk_{SEQUENCE_TABLE} PRIMARY KEY (conversation_id, sequence)
+                    )
+                    CREATE INDEX ix_{SEQUENCE_TABLE}_timestamp ON {SEQUENCE_TABLE} (timestamp)
+                    INSERT INTO {SEQUENCE_TABLE} (conversation_id, sequence, timestamp)
+                        SELECT conversation_id, sequence, timestamp FROM chat_messages
+                        WHERE conversation_id IS NOT NULL
+                END
+            """)
+            # A duplicate key here fails the whole insert with error 2627, i.e. an IntegrityError
+            conn.exec_driver_sql(f"""
+                CREATE OR ALTER TRIGGER chat_messages_sequence_guard ON chat_messages AFTER INSERT AS
+                BEGIN
+                    SET NOCOUNT ON
+                    INSERT INTO {SEQUENCE_TABLE} (conversation_id, sequence, timestamp)
+                        SELECT conversation_id, sequence, timestamp FROM inserted
+                        WHERE conversation_id IS NOT NULL
+                END
+            """)
+
+    def _split_mssql(self, last_day):
+        with self.engine.begin() as conn:
+            boundaries = self._boundaries(conn)
+            first_day = boundaries[-1] + timedelta(days=1) if boundaries else datetime.utcnow().date()
+            for day in _days(first_day, last_day):
+                # Splitting the empty partition past the last boundary only touches metadata
+                conn.exec_driver_sql(f"ALTER PARTITION SCHEME {PARTITION_SCHEME} NEXT USED [PRIMARY]")
+                conn.exec_driver_sql(f"ALTER PARTITION FUNCTION {PARTITION_FUNCTION}() SPLIT RANGE ('{day.isoformat()}')")
+                logger.info(f"Created chat_messages partition for {day.isoformat()}")
+
+    def _expire_mssql(self, cutoff_day):
+        removed = 0
+        with self.engine.begin() as conn:
+            boundaries = self._boundaries(conn)
+        # Partition 1 holds everything below the lowest boundary. Once that boundary is on or
+        # before the cutoff day, the partition has fully expired: empty it, then merge it away.
+        for boundary in boundaries[:-1]:
+            if boundary > cutoff_day:
+                break
+            with self.engine.begin() as conn:
+                removed += conn.execute(text("""
+                    SELECT rows FROM sys.partitions
+                    WHERE object_id = OBJECT_ID('chat_messages') AND index_id <= 1 AND partition_number = 1
+                """)).scalar() or 0
+                conn.exec_driver_sql("TRUNCATE TABLE chat_messages WITH (PARTITIONS (1))")
+                conn.exec_driver_sql(f"ALTER PARTITION FUNCTION {PARTITION_FUNCTION}() MERGE RANGE ('{boundary.isoformat()}')")
+            logger.info(f"Dropped chat_messages partitions before {boundary.isoformat()}")
+            self._expire_sequences_mssql(boundary)
+        return removed
+
+    def _expire_sequences_mssql(self, boundary):
+        # The sequence table is not partitioned; delete its expired keys in small batches
+        while True:
+            with self.engine.begin() as conn:
+                count = conn.execute(text(
+                    f"DELETE TOP (4000) FROM {SEQUENCE_TABLE} WHERE timestamp < :boundary"
+                ), {"boundary": boundary.isoformat()}).rowcount
+            if count < 4000:
+                return
+
+    # SQLite
+
+    @staticmethod
+    def _table(day):
+        return f"chat_messages_{day.strftime('%Y%m%d')}"
+
+    def _sqlite_days(self, conn):
+        names = conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB 'chat_messages_[0-9]*'"
+        )).scalars().all()
+        return sorted(datetime.strptime(name.rsplit("_", 1)[1], "%Y%m%d").date() for name in names)
+
+    @staticmethod
+    def _begin_sqlite(conn):
+        # pysqlite only opens a transaction before DML; start one so the DDL below is atomic
+        # and concurrent writers never see chat_messages missing
+        conn.exec_driver_sql("UPDATE chat_messages_id_seq SET value = value")
+
+    def _create_sqlite_day(self, conn, day):
+        table = self._table(day)
+        conn.exec_driver_sql(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                id INTEGER PRIMARY KEY,
+                application_name VARCHAR(100) NOT NULL,
+                chat_role VARCHAR(20) NOT NULL,
+                sequence INTEGER NOT NULL,
+                timestamp DATETIME NOT NULL,
+                message_content VARCHAR(4000) NOT NULL,
+                prompt_id INTEGER REFERENCES chat_prompts (id),
+                conversation_id VARCHAR(32)
+            )
+        """)
+        conn.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS ix_{table}_timestamp ON {table} (timestamp)")
+        conn.exec_driver_sql(f"""
+            CREATE INDEX IF NOT EXISTS ix_{table}_conversation_id_sequence
+                ON {table} (conversation_id, sequence) WHERE conversation_id IS NOT NULL
+        """)
+        conn.exec_driver_sql(f"""
+            CREATE INDEX IF NOT EXISTS ix_{table}_application_name_chat_role
+                ON {table} (application_name, chat_role)
+        """)
+
+    def _convert_sqlite(self):
+        columns = ", ".join(_COLUMNS)
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql("CREATE TABLE IF NOT EXISTS chat_messages_id_seq (value INTEGER NOT NULL)")
+            conn.exec_driver_sql(
+                "INSERT INTO chat_messages_id_seq (value) "
+                "SELECT COALESCE(MAX(id), 0) FROM chat_messages WHERE NOT EXISTS (SELECT * FROM chat_messages_id_seq)"
+            )
+            conn.exec_driver_sql("ALTER TABLE chat_messages RENAME TO chat_messages_unpartitioned")
+            days = conn.execute(text(
+                "SELECT DISTINCT date(timestamp) FROM chat_messages_unpartitioned"
+            )).scalars().all()
+            for day in sorted(date.fromisoformat(value) for value in days):
+                self._create_sqlite_day(conn, day)
+                conn.exec_driver_sql(
+                    f"INSERT INTO {self._table(day)} ({columns}) SELECT {columns} FROM chat_messages_unpartitioned "
+                    f"WHERE date(timestamp) = '{day.isoformat()}'"
+                )
+            self._create_sqlite_day(conn, datetime.utcnow().date())
+            conn.exec_driver_sql("DROP TABLE chat_messages_unpartitioned")
+            self._rebuild_sqlite_view(conn)
+
+    def _rollover_sqlite(self, cutoff_day, last_day):
+        removed = 0
+        with self.engine.begin() as conn:
+            self._begin_sqlite(conn)
+            existing = self._sqlite_days(conn)
+            for day in _days(datetime.utcnow().date(), last_day):
+                if day not in existing:
+                    self._create_sqlite_day(conn, day)
+                    logger.info(f"Created {self._table(day)}")
+            days = self._sqlite_days(conn)
+            # Always keep the newest table; it receives rows past the last day
+            for day in days[:-1]:
+                if day >= cutoff_day:
+                    break
+                table = self._table(day)
+                removed += conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+                conn.exec_driver_sql(f"DROP TABLE {table}")
+                logger.info(f"Dropped {table}")
+            self._rebuild_sqlite_view(conn)
+        return removed
+
+    def _rebuild_sqlite_view(self, conn):
+        days = self._sqlite_days(conn)
+        columns = ", ".join(_COLUMNS)
+        conn.exec_driver_sql("DROP VIEW IF EXISTS chat_messages")
+        conn.exec_driver_sql("CREATE VIEW chat_messages AS " + " UNION ALL ".join(
+            f"SELECT {columns} FROM {self._table(day)}" for day in days))
+
+        # Route each row by day; rows before the first or after the last table go to that table
+        values = ", ".join(
+            "(SELECT value FROM chat_messages_id_seq)" if column == "id"
+            else "COALESCE(NEW.timestamp, CURRENT_TIMESTAMP)" if column == "timestamp"
+            else f"NEW.{column}"
+            for column in _COLUMNS
+        )
+        inserts = []
+        for index, day in enumerate(days):
+            conditions = []
+            if index > 0:
+                conditions.append(f"COALESCE(NEW.timestamp, CURRENT_TIMESTAMP) >= '{day.isoformat()}'")
+            if index < len(days) - 1:
+                conditions.append(f"COALESCE(NEW.timestamp, CURRENT_TIMESTAMP) < '{days[index + 1].isoformat()}'")
+            where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+            inserts.append(f"INSERT INTO {self._table(day)} ({columns}) SELECT {values}{where};")
+        conn.exec_driver_sql("DROP TRIGGER IF EXISTS chat_messages_insert")
+        # Without a unique index across the day tables, reject sequence clashes here
+        check = (f"SELECT RAISE(ABORT, '{_SEQUENCE_CLASH}') WHERE NEW.conversation_id IS NOT NULL AND EXISTS "
+                 f"(SELECT 1 FROM chat_messages WHERE conversation_id = NEW.conversation_id AND sequence = NEW.sequence);")
+        conn.exec_driver_sql(
+            "CREATE TRIGGER chat_messages_insert INSTEAD OF INSERT ON chat_messages BEGIN "
+            f"{check} UPDATE chat_messages_id_seq SET value = value + 1; " + " ".join(inserts) + " END"
+        )
+
+
+def _days(first_day, last_day):
+    """Every day from first_day through last_day."""
+    day = first_day
+    while day <= last_day:
+        yield day
+        day += timedelta(days=1)
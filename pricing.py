@@ -0,0 +1,46 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TokenPricing:
+    """Prices per 1,000 tokens, used to put a cost on recorded token usage."""
+
+    def __init__(self, prompt_per_1k=0.0, completion_per_1k=0.0, cached_per_1k=None):
+        """
+        Args:
+            prompt_per_1k (float): Price of 1,000 uncached prompt tokens
+            completion_per_1k (float): Price of 1,000 completion tokens
+            cached_per_1k (float): Price of 1,000 cached prompt tokens; defaults to the prompt price
+        """
+        self.prompt_per_1k = prompt_per_1k
+        self.completion_per_1k = completion_per_1k
+        self.cached_per_1k = prompt_per_1k if cached_per_1k is None else cached_per_1k
+
+    @classmethod
+    def from_env(cls):
+        """Build pricing from CHAT_PRICE_PROMPT_PER_1K, CHAT_PRICE_COMPLETION_PER_1K and CHAT_PRICE_CACHED_PER_1K."""
+        cached = os.getenv("CHAT_PRICE_CACHED_PER_1K")
+        return cls(
+            prompt_per_1k=float(os.getenv("CHAT_PRICE_PROMPT_PER_1K", "0")),
+            completion_per_1k=float(os.getenv("CHAT_PRICE_COMPLETION_PER_1K", "0")),
+            cached_per_1k=float(cached) if cached else None,
+        )
+
+    def cost(self, prompt_tokens, cached_tokens, completion_tokens):
+        """
+        Return the cost of a request, or of a sum of requests.
+
+        Args:
+            prompt_tokens (int): All prompt tokens, cached ones included
+            cached_tokens (int): Prompt tokens served from the prompt cache
+            completion_tokens (int): Generated tokens
+        """
+        return ((prompt_tokens - cached_tokens) * self.prompt_per_1k
+                + cached_tokens * self.cached_per_1k
+                + completion_tokens * self.completion_per_1k) / 1000
+
+    def __repr__(self):
+        return (f"<TokenPricing(prompt={self.prompt_per_1k}, cached={self.cached_per_1k}, "
+                f"completion={self.completion_per_1k})>")
@@ -0,0 +1,173 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import thread as futures_thread
+from contextlib import contextmanager
+import logging
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ("cprofile", "stacks")
+
+# Frame of an idle ThreadPoolExecutor worker waiting for work
+_IDLE_WORKER_CODE = futures_thread._worker.__code__
+
+
+class StackSampler:
+    """
+    Wall-clock sampling profiler producing collapsed stacks.
+
+    A background thread samples the stacks of the watched threads every interval
+    seconds. Unlike cProfile this also sees the worker threads (e.g. the
+    background message inserts) and time spent waiting on the network.
+    """
+
+    def __init__(self, interval=0.005, thread_prefixes=("chat-log",)):
+        """
+        Args:
+            interval (float): Seconds between samples
+            thread_prefixes (tuple): Names of other threads to sample besides the one calling start()
+        """
+        self.interval = interval
+        self.thread_prefixes = thread_prefixes
+        self.samples = Counter()
+        self._target = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start sampling the calling thread and the matching worker threads."""
+        self._target = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling."""
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self):
+        """Return the samples as collapsed stacks ("root;...;leaf count" per line), for flamegraph.pl or speedscope."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                name = names.get(ident, str(ident))
+                if ident != self._target and not name.startswith(self.thread_prefixes):
+                    continue
+                if frame.f_code is _IDLE_WORKER_CODE:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(name)
+                self.samples[";".join(reversed(stack))] += 1
+
+
+class TurnProfiler:
+    """
+    Opt-in profiling of chat turns, written to one file per turn.
+
+    mode "cprofile" profiles the calling thread with cProfile and writes .pstats
+    files (python -m pstats, snakeviz, or flameprof/gprof2dot for flame graphs).
+    mode "stacks" samples the calling thread and the message logging workers and
+    writes .collapsed files that flamegraph.pl and speedscope read directly. Only
+    the first max_turns turns are profiled, so leaving it on costs nothing later.
+    File names carry the profiler's start time and process ID, so a resumed
+    session never overwrites the profiles of an earlier run.
+    """
+
+    def __init__(self, mode="cprofile", output_dir="logs/profiles", max_turns=20, interval=0.005):
+        """
+        Args:
+            mode (str): "cprofile" or "stacks"
+            output_dir (str): Directory for the profile files
+            max_turns (int): Turns to profile before switching off
+            interval (float): Sampling interval in seconds for "stacks"
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profiling mode: {mode} (expected one of {', '.join(PROFILE_MODES)})")
+        self.mode = mode
+        self.output_dir = output_dir
+        self.max_turns = max_turns
+        self.interval = interval
+        self.turns = 0
+        self.run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+
+    @classmethod
+    def from_env(cls, mode=None, max_turns=None):
+        """
+        Build a profiler from CHAT_PROFILE, CHAT_PROFILE_DIR, CHAT_PROFILE_MAX_TURNS and CHAT_PROFILE_INTERVAL.
+
+        CHAT_PROFILE is "cprofile", "stacks", or "1" for cprofile. Arguments take
+        precedence over the environment (e.g. from command-line flags).
+
+        Returns:
+            TurnProfiler: The profiler, or None when profiling is off
+        """
+        mode = (mode or os.getenv("CHAT_PROFILE", "")).lower()
+        if mode in ("", "0", "false", "no", "off"):
+            return None
+        if mode in ("1", "true", "yes", "on"):
+            mode = "cprofile"
+        return cls(
+            mode=mode,
+            output_dir=os.getenv("CHAT_PROFILE_DIR", "logs/profiles"),
+            max_turns=max_turns if max_turns is not None else int(os.getenv("CHAT_PROFILE_MAX_TURNS", "20")),
+            interval=float(os.getenv("CHAT_PROFILE_INTERVAL", "0.005")),
+        )
+
+    @contextmanager
+    def profile(self, label):
+        """
+        Profile the enclosed turn unless max_turns turns have been profiled already.
+
+        Args:
+            label (str): Included in the file name, e.g. the conversation ID
+        """
+        if self.turns >= self.max_turns:
+            yield
+            return
+        self.turns += 1
+        path = os.path.join(self.output_dir, f"turn-{label}-{self.run_id}-{self.turns:03d}")
+        if self.mode == "cprofile":
+            import cProfile
+
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                self._write(path + ".pstats", profiler.dump_stats)
+        else:
+            sampler = StackSampler(self.interval)
+            sampler.start()
+            try:
+                yield
+            finally:
+                sampler.stop()
+                self._write(path + ".collapsed", lambda file_path: self._write_text(file_path, sampler.collapsed()))
+        if self.turns == self.max_turns:
+            logger.info(f"Profiled {self.turns} turns; profiling is off for the rest of the session")
+
+    def _write(self, path, writer):
+        start = time.perf_counter()
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            writer(path)
+            logger.info(f"Turn profile written to {path} ({(time.perf_counter() - start) * 1000:.0f} ms)")
+        except OSError as e:
+            logger.error(f"Error writing turn profile {path}: {str(e)}")
+
+    @staticmethod
+    def _write_text(path, content):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
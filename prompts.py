@@ -0,0 +1,88 @@
+import functools
+import os
+
+# Static instructions sent as the first message of every chat request
+SYSTEM_MESSAGE = """"###############   Context  ####################################################
+You are an AI assistant that provides commercial loan customers with pricing for loans available through the Federal Home Loan Bank of Indianapolis. 
+#################        Goal          ###############################################
+Your goal is to provide the customer a price based off the Advance products they ask about. 
+##################    Instructions    #############################################
+When you are asked about a price or a loan, you will look to your knowledge base to determine if you can determine how to calculate the loan product. 
+You only price loans for products you are aware of 
+If you cannot find the loan product in your knowledge base, you should politely describe to the customer what loans you are capable of pricing. 
+You can look to your internal knowledge base for a SOFR Rate and FHLB Cost of Funds
+If you cannot find details about the loan product type, do not elaborate. Just politely tell the user you do not know about that product.
+If you do know about the product, you should try to determine the information needed to calculate the loan price by asking the user about the maturity and amount of the loan.
+If you need more information to price the loan, you should ask the user for that information.
+You should not ask the customer about their credit score.
+Once you have everything you need to calculate the loan price, describe how the calculation works for that product. 
+Identify any unclear or ambiguous information in your response and rephrase it for clarity.
+Try to argue against your own output and see if you can find any flaws. If so, address them. Walk me through the process
+"""
+
+
+# Message orderings supported by build_messages
+LAYOUT_DEFAULT = "default"
+LAYOUT_CACHE_FRIENDLY = "cache_friendly"
+
+def get_prompt_layout():
+    """Return the message layout selected by CHAT_PROMPT_LAYOUT."""
+    return os.getenv("CHAT_PROMPT_LAYOUT", LAYOUT_DEFAULT).lower()
+
+@functools.lru_cache(maxsize=None)
+def _read_pinned_context(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read().strip()
+
+def get_pinned_context():
+    """Return the static reference text (e.g. rate tables) named by CHAT_PINNED_CONTEXT_FILE, if any."""
+    path = os.getenv("CHAT_PINNED_CONTEXT_FILE")
+    return _read_pinned_context(path) if path else ""
+
+def build_messages(system_message, context, conversation_history, user_input, summary_message=None, layout=None):
+    """
+    Assemble the message list for a chat completion request.
+    
+    The default layout is system, pinned context, retrieved context, summary,
+    history, user. The cache_friendly layout moves the retrieved context after the
+    history so the static instructions, pinned context, summary and earlier turns
+    form a prefix that stays identical from turn to turn and can be served from
+    the provider's prompt cache.
+    
+    Args:
+        system_message (str): Static system instructions
+        context (str): Retrieved context, may be empty
+        conversation_history (list): Prior user/assistant messages
+        user_input (str): The current user message
+        summary_message (dict): Running summary of older turns, if any
+        layout (str): LAYOUT_DEFAULT or LAYOUT_CACHE_FRIENDLY; defaults to CHAT_PROMPT_LAYOUT
+        
+    Returns:
+        list: Messages ready for chat.completions.create
+    """
+    layout = layout or get_prompt_layout()
+    messages = [{"role": "system", "content": system_message}]
+    pinned_context = get_pinned_context()
+    if pinned_context:
+        messages.append({"role": "system", "content": f"Reference data: {pinned_context}"})
+    context_message = {"role": "system", "content": format_context_message(context)} if context else None
+    
+    if layout == LAYOUT_CACHE_FRIENDLY:
+        if summary_message:
+            messages.append(summary_message)
+        messages.extend(conversation_history)
+        if context_message:
+            messages.append(context_message)
+    else:
+        if context_message:
+            messages.append(context_message)
+        if summary_message:
+            messages.append(summary_message)
+        messages.extend(conversation_history)
+    
+    messages.append({"role": "user", "content": user_input})
+    return messages
+
+def format_context_message(context):
+    """Format retrieved context as the content of a system message."""
+    return f"Context: {context}"
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(request):
+    """
+    Hash a completion request into a cache key.
+
+    The key covers the full message list, the model deployment and every
+    sampling parameter, so any change to them produces a different key.
+    """
+    payload = json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class InMemoryResponseBackend:
+    """Process-local LRU store for cached responses."""
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            response, expires_at = item
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return response
+
+    def set(self, key, response, expires_at):
+        with self._lock:
+            self._entries[key] = (response, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteResponseBackend:
+    """
+    SQLite-backed store shared by every process that points at the same file.
+
+    Each thread keeps its own connection. Once max_entries is exceeded, the
+    least recently used rows are deleted.
+    """
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_response_cache_last_used ON response_cache (last_used)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT response, expires_at FROM response_cache WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                conn.execute("DELETE FROM response_cache WHERE cache_key = ?", (key,))
+                return None
+            conn.execute("UPDATE response_cache SET last_used = ? WHERE cache_key = ?", (now, key))
+            return row[0]
+
+    def set(self, key, response, expires_at):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO response_cache (cache_key, response, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, response, expires_at, now),
+            )
+            conn.execute("DELETE FROM response_cache WHERE expires_at <= ?", (now,))
+            conn.execute("""
+                DELETE FROM response_cache WHERE cache_key IN (
+                    SELECT cache_key FROM response_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM response_cache")
+
+
+class ResponseCache:
+    """Exact-match cache of completion responses in front of the Azure OpenAI call."""
+
+    def __init__(self, backend, ttl_seconds=3600):
+        """
+        Args:
+            backend: InMemoryResponseBackend, SQLiteResponseBackend or any object with get/set/clear
+            ttl_seconds (float): Seconds a cached response stays valid
+        """
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.counters = {"hits": 0, "misses": 0, "errors": 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """
+        Build a cache from CHAT_RESPONSE_CACHE_* environment variables.
+
+        CHAT_RESPONSE_CACHE selects the backend: "memory", "sqlite" or "off" (the default).
+        """
+        backend_name = os.getenv("CHAT_RESPONSE_CACHE", "off").lower()
+        if backend_name in ("", "off", "0", "false", "no"):
+            return None
+        max_entries = int(os.getenv("CHAT_RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+        if backend_name == "sqlite":
+            backend = SQLiteResponseBackend(
+                os.getenv("CHAT_RESPONSE_CACHE_PATH", "response_cache.db"), max_entries=max_entries)
+        elif backend_name == "memory":
+            backend = InMemoryResponseBackend(max_entries=max_entries)
+        else:
+            raise ValueError(f"Unknown CHAT_RESPONSE_CACHE backend: {backend_name}")
+        return cls(backend, ttl_seconds=float(os.getenv("CHAT_RESPONSE_CACHE_TTL", "3600")))
+
+    def get(self, request):
+        """Return the cached response text for a completion request, or None."""
+        try:
+            response = self.backend.get(make_cache_key(request))
+        except Exception as e:
+            logger.error(f"Error reading response cache: {str(e)}")
+            self._count("errors")
+            return None
+        self._count("hits" if response is not None else "misses")
+        return response
+
+    def put(self, request, response):
+        """Store the response text for a completion request."""
+        try:
+            self.backend.set(make_cache_key(request), response, time.time() + self.ttl_seconds)
+        except Exception as e:
+            logger.error(f"Error writing response cache: {str(e)}")
+            self._count("errors")
+
+    def clear(self):
+        """Remove every cached response."""
+        self.backend.clear()
+
+    def stats(self):
+        """Return hit/miss counters."""
+        with self._lock:
+            return dict(self.counters)
+
+    def _count(self, key):
+        with self._lock:
+            self.counters[key] += 1
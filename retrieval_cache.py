@@ -0,0 +1,220 @@
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import logging
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query):
+    """Normalize query text so trivially different phrasings share a cache entry."""
+    return _WHITESPACE.sub(" ", query.strip().lower()).rstrip("?!. ")
+
+
+def _cosine_similarity(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class _Entry:
+    __slots__ = ("documents", "size", "expires_at", "embedding")
+
+    def __init__(self, documents, size, expires_at, embedding):
+        self.documents = documents
+        self.size = size
+        self.expires_at = expires_at
+        self.embedding = embedding
+
+
+class RetrievalCache:
+    """
+    LRU/TTL cache for ChromaDB search results keyed on normalized query text.
+
+    Entries are evicted when they expire, when max_entries is exceeded or when the
+    approximate size of the cached documents goes over max_bytes. When embed_func
+    and similarity_threshold are given, a query with no exact match can also be
+    served from a cached query whose embedding is at least that similar. Queries
+    are embedded on a worker thread, and a miss waits at most similarity_timeout
+    seconds for the embedding before falling through to the real search; the
+    embedding is still stored with the entry once it arrives.
+
+    ChromaDBClient clears the cache when it sees the collection change (see
+    ChromaDBClient.check_collection); ttl_seconds bounds staleness for changes
+    that leave the collection's entry as it was.
+    """
+
+    def __init__(self, max_entries=256, ttl_seconds=600, max_bytes=16 * 1024 * 1024,
+                 embed_func=None, similarity_threshold=None, similarity_timeout=0.1):
+        """
+        Args:
+            max_entries (int): Maximum number of cached queries
+            ttl_seconds (float): Seconds an entry stays valid
+            max_bytes (int): Upper bound on the cached document text, in bytes
+            embed_func (callable): Optional function returning an embedding vector for a text
+            similarity_threshold (float): Cosine similarity needed for a near-duplicate hit
+            similarity_timeout (float): Seconds a miss waits for its query embedding
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.embed_func = embed_func
+        self.similarity_threshold = similarity_threshold
+        self.similarity_timeout = similarity_timeout
+        self._executor = None
+        self._entries = OrderedDict()
+        self._pending_embeddings = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {
+            "hits": 0,
+            "similar_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+            "similarity_timeouts": 0,
+        }
+
+    @classmethod
+    def from_env(cls, embed_func=None):
+        """
+        Build a cache from CHROMA_CACHE_* environment variables.
+
+        Returns None when CHROMA_CACHE_ENABLED is turned off.
+        """
+        if os.getenv("CHROMA_CACHE_ENABLED", "1").lower() in ("0", "false", "no"):
+            return None
+        threshold = os.getenv("CHROMA_CACHE_SIMILARITY")
+        return cls(
+            max_entries=int(os.getenv("CHROMA_CACHE_MAX_ENTRIES", "256")),
+            ttl_seconds=float(os.getenv("CHROMA_CACHE_TTL", "600")),
+            max_bytes=int(os.getenv("CHROMA_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+            embed_func=embed_func if threshold else None,
+            similarity_threshold=float(threshold) if threshold else None,
+            similarity_timeout=float(os.getenv("CHROMA_CACHE_SIMILARITY_TIMEOUT", "0.1")),
+        )
+
+    def get(self, collection, query, n_results):
+        """Return cached documents for the query, or None on a miss."""
+        key = (collection, n_results, normalize_query(query))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.counters["hits"] += 1
+                    return entry.documents
+                self._remove(key)
+                self.counters["expirations"] += 1
+
+        if self.embed_func is not None and self.similarity_threshold is not None:
+            documents = self._get_similar(key, now)
+            if documents is not None:
+                return documents
+
+        with self._lock:
+            self.counters["misses"] += 1
+        return None
+
+    def put(self, collection, query, n_results, documents):
+        """Cache the documents returned for a query."""
+        key = (collection, n_results, normalize_query(query))
+        size = sum(len(doc.encode("utf-8")) for doc in documents) + len(key[2].encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            pending = self._pending_embeddings.pop(key, None)
+        if pending is None and self.embed_func is not None and self.similarity_threshold is not None:
+            pending = self._submit_embedding(key[2])
+
+        entry = _Entry(documents, size, time.monotonic() + self.ttl_seconds, None)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.counters["evictions"] += 1
+        if pending is not None:
+            # Attached when ready, so put() never waits on the embeddings API
+            pending.add_done_callback(lambda future: self._attach_embedding(entry, future))
+
+    def invalidate(self, collection=None):
+        """Drop cached results for one collection, or for all collections when none is given."""
+        with self._lock:
+            keys = [key for key in self._entries if collection is None or key[0] == collection]
+            for key in keys:
+                self._remove(key)
+            self._pending_embeddings.clear()
+            self.counters["invalidations"] += 1
+        logger.info(f"Invalidated {len(keys)} cached retrieval result(s) for {collection or 'all collections'}")
+
+    def stats(self):
+        """Return hit/miss counters along with the current size of the cache."""
+        with self._lock:
+            return dict(self.counters, entries=len(self._entries), bytes=self._bytes)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def _embed(self, text):
+        try:
+            return self.embed_func(text)
+        except Exception as e:
+            logger.error(f"Error embedding query for retrieval cache: {str(e)}")
+            return None
+
+    def _submit_embedding(self, text):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="retrieval-embed")
+        return self._executor.submit(self._embed, text)
+
+    def _attach_embedding(self, entry, future):
+        embedding = future.result()
+        if embedding is not None:
+            with self._lock:
+                entry.embedding = embedding
+
+    def _get_similar(self, key, now):
+        pending = self._submit_embedding(key[2])
+        with self._lock:
+            # put() picks the embedding up from here instead of requesting it again
+            self._pending_embeddings[key] = pending
+            while len(self._pending_embeddings) > self.max_entries:
+                self._pending_embeddings.popitem(last=False)
+        try:
+            embedding = pending.result(timeout=self.similarity_timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self.counters["similarity_timeouts"] += 1
+            return None
+        if embedding is None:
+            return None
+
+        best_key, best_score = None, self.similarity_threshold
+        with self._lock:
+            for candidate_key, entry in self._entries.items():
+                if candidate_key[:2] != key[:2] or entry.embedding is None or entry.expires_at <= now:
+                    continue
+                score = _cosine_similarity(embedding, entry.embedding)
+                if score >= best_score:
+                    best_key, best_score = candidate_key, score
+
+            if best_key is None:
+                return None
+            self._entries.move_to_end(best_key)
+            self.counters["similar_hits"] += 1
+            logger.debug(f"Retrieval cache similarity hit ({best_score:.3f}) for '{key[2]}' via '{best_key[2]}'")
+            return self._entries[best_key].documents
@@ -0,0 +1,340 @@
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from sqlalchemy import DateTime, bindparam, text
+from sqlalchemy.exc import IntegrityError
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (minimum, maximum) for minute, hour, day of month, month and day of week (0 = Sunday)
+_CRON_FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 6)]
+
+# Later than any recorded run, so a lease without a slot is never refused; within SQL Server's DATETIME range
+_FAR_FUTURE = datetime(9999, 12, 31)
+
+
+class CronSchedule:
+    """
+    Five-field cron expression ("minute hour day-of-month month day-of-week").
+
+    Each field accepts *, single values, ranges (a-b), lists (a,b) and steps
+    (*/n, a-b/n). Day of week runs 0-6 from Sunday, and 7 is accepted for Sunday.
+    As in cron, when both day fields are restricted a day matching either one
+    qualifies. Times are the host's local time.
+    """
+
+    def __init__(self, expression):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            self._parse_field(part, low, high) for part, (low, high) in zip(parts, _CRON_FIELDS)
+        )
+        self.weekdays = {0 if day == 7 else day for day in self.weekdays}
+        self._any_day = parts[2] == "*"
+        self._any_weekday = parts[4] == "*"
+
+    @staticmethod
+    def _parse_field(field, low, high):
+        values = set()
+        for item in field.split(","):
+            spec, _, step = item.partition("/")
+            if spec == "*":
+                start, end = low, high
+            elif "-" in spec:
+                start, end = (int(value) for value in spec.split("-", 1))
+            else:
+                start = end = int(spec)
+                if step:
+                    # "a/n" means every n-th value from a upward
+                    end = high
+            # Sunday may be written as 7
+            top = 7 if high == 6 else high
+            if start < low or end > top or start > end:
+                raise ValueError(f"Cron field {field!r} is outside {low}-{high}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def _day_matches(self, moment):
+        in_month = moment.day in self.days
+        # Python counts Monday as 0; cron counts Sunday as 0
+        in_week = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._any_day:
+            return in_week
+        if self._any_weekday:
+            return in_month
+        return in_month or in_week
+
+    def next_after(self, moment):
+        """Return the first matching minute strictly after moment."""
+        moment = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Cron expression never matches: {self.expression!r}")
+
+    def __repr__(self):
+        return f"<CronSchedule({self.expression!r})>"
+
+
+class LeaseManager:
+    """
+    Database-backed leases that let one instance at a time run each maintenance job.
+
+    A lease is a maintenance_leases row owned by one process until expires_at.
+    Expired leases can be taken over, so a crashed owner blocks a job for at
+    most one lease period. The row also records how the job's last run went.
+    """
+
+    def __init__(self, engine, owner=None):
+        """
+        Args:
+            engine: SQLAlchemy engine for the chat database
+            owner (str): Identity of this process; defaults to host:pid:random
+        """
+        self.engine = engine
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def acquire(self, job_name, ttl, slot=None):
+        """
+        Take the lease for a job for ttl seconds.
+
+        Args:
+            job_name (str): Job to lease
+            ttl (float): Seconds until the lease expires
+            slot (datetime): Scheduled run time in UTC; the lease is refused if any
+                instance already ran the job at or after it
+
+        Returns:
+            bool: True if this process now holds the lease
+        """
+        now = datetime.utcnow()
+        params = {"job_name": job_name, "owner": self.owner, "now": now, "expires_at": now + timedelta(seconds=ttl),
+                  "slot": slot or _FAR_FUTURE}
+        take_over = text("""
+            UPDATE maintenance_leases SET owner = :owner, expires_at = :expires_at
+            WHERE job_name = :job_name AND (expires_at < :now OR owner = :owner)
+                AND (last_run_at IS NULL OR last_run_at < :slot)
+        """).bindparams(*(bindparam(name, type_=DateTime()) for name in ("now", "expires_at", "slot")))
+        try:
+            with self.engine.begin() as conn:
+                if conn.execute(take_over, params).rowcount:
+                    return True
+            with self.engine.begin() as conn:
+                conn.execute(text(
+                    "INSERT INTO maintenance_leases (job_name, owner, expires_at) VALUES (:job_name, :owner, :expires_at)"
+                ).bindparams(bindparam("expires_at", type_=DateTime())), params)
+            return True
+        except IntegrityError:
+            # The lease is held by another instance, or this slot has already run
+            return False
+        except Exception as e:
+            logger.error(f"Error acquiring lease for {job_name}: {str(e)}")
+            return False
+
+    def release(self, job_name, status, duration):
+        """Give the lease up and record the outcome of the run, stamped with the current UTC time."""
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(text("""
+                    UPDATE maintenance_leases
+                    SET expires_at = :now, last_run_at = :now, last_status = :status, last_duration_ms = :duration_ms
+                    WHERE job_name = :job_name AND owner = :owner
+                """).bindparams(bindparam("now", type_=DateTime())), {
+                    "job_name": job_name,
+                    "owner": self.owner,
+                    "now": datetime.utcnow(),
+                    "status": status,
+                    "duration_ms": int(duration * 1000),
+                })
+        except Exception as e:
+            logger.error(f"Error releasing lease for {job_name}: {str(e)}")
+
+
+class MaintenanceJob:
+    """A named maintenance function with its schedule and run metrics."""
+
+    def __init__(self, name, func, schedule, jitter=0, lease_ttl=3600):
+        """
+        Args:
+            name (str): Job name, also the lease key
+            func (callable): Work to run; its return value is logged
+            schedule (CronSchedule): When the job runs
+            jitter (float): Random delay of up to this many seconds added to every run
+            lease_ttl (float): Seconds the lease is held; should exceed the longest run
+        """
+        self.name = name
+        self.func = func
+        self.schedule = schedule
+        self.jitter = jitter
+        self.lease_ttl = lease_ttl
+        self.slot = None
+        self.next_run = None
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.total_duration = 0.0
+        self.last_duration = None
+        self.last_result = None
+        self.last_run_at = None
+
+    def plan_next(self, now):
+        """Pick the next run time: the next cron match (the slot) plus jitter."""
+        self.slot = self.schedule.next_after(now)
+        self.next_run = self.slot + timedelta(seconds=random.uniform(0, self.jitter))
+        return self.next_run
+
+    def stats(self):
+        """Return the job's run metrics."""
+        return {
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "last_duration": round(self.last_duration, 3) if self.last_duration is not None else None,
+            "average_duration": round(self.total_duration / self.runs, 3) if self.runs else None,
+            "last_result": self.last_result,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+            "next_run": self.next_run.isoformat() if self.next_run else None,
+        }
+
+
+class MaintenanceScheduler:
+    """
+    Run maintenance jobs on cron schedules from a single background thread.
+
+    Every instance of the application runs a scheduler, and a database lease makes
+    sure each job runs on only one of them per slot. Jitter spreads the instances'
+    attempts so they do not all hit the database at the same second.
+    """
+
+    def __init__(self, leases):
+        """
+        Args:
+            leases (LeaseManager): Lease store shared by all instances
+        """
+        self.leases = leases
+        self.jobs = {}
+        self.stop_event = threading.Event()
+        self._thread = None
+
+    def add_job(self, name, func, schedule, jitter=0, lease_ttl=3600):
+        """Register a job. schedule may be a CronSchedule or a cron expression."""
+        if not isinstance(schedule, CronSchedule):
+            schedule = CronSchedule(schedule)
+        job = MaintenanceJob(name, func, schedule, jitter=jitter, lease_ttl=lease_ttl)
+        job.plan_next(datetime.now())
+        self.jobs[name] = job
+        logger.info(f"Scheduled maintenance job {name} ({schedule.expression}), next run {job.next_run}")
+        return job
+
+    def start(self):
+        """Start the scheduler thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="maintenance-scheduler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=30):
+        """Stop the scheduler; a running job is asked to stop via stop_event."""
+        self.stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run_job(self, name, slot=None):
+        """
+        Run one job now if its lease can be taken.
+
+        Args:
+            name (str): Job to run
+            slot (datetime): Scheduled local run time; the job is skipped if another
+                instance already ran it for this slot. None runs it unconditionally.
+
+        Returns:
+            bool: True if the job ran on this instance
+        """
+        job = self.jobs[name]
+        slot_utc = slot.astimezone(timezone.utc).replace(tzinfo=None) if slot is not None else None
+        if not self.leases.acquire(name, job.lease_ttl, slot=slot_utc):
+            job.skipped += 1
+            logger.info(f"Maintenance job {name} skipped; another instance holds the lease or already ran it")
+            return False
+
+        start = time.monotonic()
+        status = "ok"
+        try:
+            job.last_result = job.func()
+        except Exception as e:
+            status = "failed"
+            job.failures += 1
+            job.last_result = None
+            logger.error(f"Maintenance job {name} failed: {str(e)}")
+        duration = time.monotonic() - start
+        self.leases.release(name, status, duration)
+
+        job.runs += 1
+        job.total_duration += duration
+        job.last_duration = duration
+        job.last_run_at = datetime.now()
+        logger.info(f"Maintenance job {name} {status} in {duration:.1f}s (result: {job.last_result})")
+        return True
+
+    def stats(self):
+        """Return run metrics for every job."""
+        return {name: job.stats() for name, job in self.jobs.items()}
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            job = min(self.jobs.values(), key=lambda candidate: candidate.next_run, default=None)
+            if job is None:
+                self.stop_event.wait(60)
+                continue
+            delay = (job.next_run - datetime.now()).total_seconds()
+            # Wake up at least every minute so clock changes are picked up
+            if delay > 0:
+                self.stop_event.wait(min(delay, 60))
+                continue
+            self.run_job(job.name, slot=job.slot)
+            job.plan_next(datetime.now())
+
+
+def create_maintenance_scheduler(db_manager):
+    """
+    Build a scheduler running the retention purges for db_manager.
+
+    The chat_messages and chat_turn_metrics purges run on CHAT_PURGE_SCHEDULE
+    (default "30 3 * * *", 03:30 local time) with up to CHAT_MAINTENANCE_JITTER
+    seconds (default 600) of random delay, under a lease of
+    CHAT_MAINTENANCE_LEASE_TTL seconds (default 3600).
+    """
+    scheduler = MaintenanceScheduler(LeaseManager(db_manager.engine))
+    schedule = os.getenv("CHAT_PURGE_SCHEDULE", "30 3 * * *")
+    jitter = float(os.getenv("CHAT_MAINTENANCE_JITTER", "600"))
+    lease_ttl = float(os.getenv("CHAT_MAINTENANCE_LEASE_TTL", "3600"))
+    scheduler.add_job(
+        "purge_chat_messages",
+        partial(db_manager.cleanup_old_messages, stop_event=scheduler.stop_event),
+        schedule, jitter=jitter, lease_ttl=lease_ttl,
+    )
+    scheduler.add_job(
+        "purge_chat_turn_metrics",
+        partial(db_manager.cleanup_turn_metrics, stop_event=scheduler.stop_event),
+        schedule, jitter=jitter, lease_ttl=lease_ttl,
+    )
+    return scheduler
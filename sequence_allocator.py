@@ -0,0 +1,130 @@
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _Counter:
+    """Allocation state of one conversation."""
+
+    def __init__(self):
+        self.base = None
+        self.next_offset = 0
+        self.lock = threading.Lock()
+        # Held while querying the database, so allocate() never waits behind a seed
+        self.seed_lock = threading.Lock()
+
+
+class PendingSequence:
+    """
+    A reserved sequence number whose value is fixed the first time it is read.
+
+    allocate() returns these without touching the database. int() on one seeds
+    the conversation's counter if needed (a MAX(sequence) query), which happens
+    on whichever thread writes the message, i.e. off the chat turn's critical path.
+    """
+
+    __slots__ = ("_allocator", "_conversation_id", "_counter", "_offset", "_value")
+
+    def __init__(self, allocator, conversation_id, counter, offset):
+        self._allocator = allocator
+        self._conversation_id = conversation_id
+        self._counter = counter
+        self._offset = offset
+        self._value = None
+
+    def __int__(self):
+        if self._value is None:
+            self._value = self._allocator._resolve(self._conversation_id, self._counter, self._offset)
+        return self._value
+
+    __index__ = __int__
+
+    def __repr__(self):
+        value = self._value if self._value is not None else f"pending+{self._offset}"
+        return f"<PendingSequence({self._conversation_id}, {value})>"
+
+
+class SequenceAllocator:
+    """
+    Hand out gap-free, monotonically increasing message sequence numbers per conversation.
+
+    Numbers are reserved in memory, in call order, as offsets from a per-conversation
+    base. The base is seeded from seed_func (the next unused sequence, e.g.
+    MAX(sequence) + 1 from chat_messages) when the first reserved number is read,
+    so resumed conversations continue where they left off and allocate() never
+    waits on the database. A failed seed leaves the base unset and is retried on
+    the next read. Allocation is thread-safe, and each conversation has its own
+    lock, so concurrent conversations never wait on each other.
+
+    Counters are per process. When another process writes to the same conversation,
+    the unique (conversation_id, sequence) index rejects the clash and the writer
+    calls reseed() to move past it.
+    """
+
+    def __init__(self, seed_func=None):
+        """
+        Args:
+            seed_func (callable): Takes a conversation ID and returns its next unused sequence number
+        """
+        self.seed_func = seed_func
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def allocate(self, conversation_id, count=1):
+        """
+        Reserve count consecutive sequence numbers for a conversation.
+
+        Returns:
+            PendingSequence: The first reserved sequence number; int() gives its value
+        """
+        counter = self._counter(conversation_id)
+        with counter.lock:
+            offset = counter.next_offset
+            counter.next_offset += count
+        return PendingSequence(self, conversation_id, counter, offset)
+
+    def reseed(self, conversation_id, sequence):
+        """
+        Replace a sequence number that turned out to be taken already.
+
+        The conversation's base is moved past the database's MAX(sequence), so
+        sequence and every number reserved after it shift up together.
+
+        Returns:
+            int: The replacement for sequence
+        """
+        counter = self._counter(conversation_id)
+        with counter.seed_lock:
+            if counter.base is None:
+                # Not allocated here; the next read seeds past whatever sequence becomes
+                return self._seed(conversation_id)
+            offset = int(sequence) - counter.base
+            counter.base = max(self._seed(conversation_id), int(sequence) + 1) - offset
+            logger.info(f"Re-seeded sequence numbers of conversation {conversation_id} at {counter.base + offset}")
+            return counter.base + offset
+
+    def forget(self, conversation_id):
+        """Drop the in-memory counter for a conversation; the next allocation re-seeds it."""
+        with self._lock:
+            self._counters.pop(conversation_id, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._counters)
+
+    def _counter(self, conversation_id):
+        with self._lock:
+            counter = self._counters.get(conversation_id)
+            if counter is None:
+                counter = self._counters[conversation_id] = _Counter()
+            return counter
+
+    def _seed(self, conversation_id):
+        return self.seed_func(conversation_id) if self.seed_func is not None else 0
+
+    def _resolve(self, conversation_id, counter, offset):
+        with counter.seed_lock:
+            if counter.base is None:
+                counter.base = self._seed(conversation_id)
+            return counter.base + offset
@@ -0,0 +1,300 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ChatSession:
+    """Conversation state for one chat session."""
+
+    def __init__(self, session_id=None, conversation_history=None, summary="", last_active=None):
+        self.session_id = session_id or uuid.uuid4().hex
+        self.conversation_history = conversation_history if conversation_history is not None else []
+        self.summary = summary
+        self.last_active = last_active or time.time()
+        # Revision of the persisted copy this state was loaded from or saved as; not part of the state
+        self.version = 0
+
+    def touch(self):
+        """Mark the session as used now."""
+        self.last_active = time.time()
+
+    def to_dict(self):
+        """Return the session state as JSON-serializable data."""
+        return {
+            "session_id": self.session_id,
+            "conversation_history": self.conversation_history,
+            "summary": self.summary,
+            "last_active": self.last_active,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a session from to_dict() output."""
+        # Sequence numbers now come from the database; older snapshots still carry one
+        data = {key: value for key, value in data.items() if key != "message_sequence"}
+        return cls(**data)
+
+    def size_bytes(self):
+        """Approximate memory held by the session's text."""
+        return sum(len(message["content"]) for message in self.conversation_history) + len(self.summary) + 256
+
+    def __repr__(self):
+        return f"<ChatSession(id={self.session_id}, messages={len(self.conversation_history)})>"
+
+
+class InMemorySessionStore:
+    """
+    Process-local LRU session store.
+
+    Sessions are evicted least recently used first once max_sessions or max_bytes
+    is exceeded, and when they have been idle longer than idle_timeout seconds.
+    on_evict, if set, is called with the ID of every evicted or deleted session,
+    e.g. to drop per-conversation state held elsewhere.
+    """
+
+    def __init__(self, max_sessions=10000, max_bytes=64 * 1024 * 1024, idle_timeout=3600, on_evict=None):
+        """
+        Args:
+            max_sessions (int): Maximum sessions kept in memory
+            max_bytes (int): Upper bound on the approximate size of all sessions
+            idle_timeout (float): Seconds of inactivity before a session is evicted
+            on_evict (callable): Called with each evicted session ID, outside the store's lock
+        """
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_timeout = idle_timeout
+        self.on_evict = on_evict
+        self.evictions = 0
+        self._sessions = OrderedDict()
+        self._sizes = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def create(self):
+        """Create, store and return a new session."""
+        session = ChatSession()
+        self.save(session)
+        return session
+
+    def get(self, session_id):
+        """Return the session with this ID, or None if it is unknown or was evicted."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            expired = time.time() - session.last_active > self.idle_timeout
+            if expired:
+                self._remove(session_id)
+                self.evictions += 1
+            else:
+                session.touch()
+                self._sessions.move_to_end(session_id)
+        if expired:
+            self._notify([session_id])
+            return None
+        return session
+
+    def save(self, session):
+        """Store the current state of a session and evict others if over the limits."""
+        session.touch()
+        size = session.size_bytes()
+        with self._lock:
+            if session.session_id in self._sessions:
+                self._remove(session.session_id)
+            self._sessions[session.session_id] = session
+            self._sizes[session.session_id] = size
+            self._bytes += size
+            evicted = self._evict()
+        self._notify(evicted)
+
+    def delete(self, session_id):
+        """Remove a session."""
+        with self._lock:
+            if session_id not in self._sessions:
+                return
+            self._remove(session_id)
+        self._notify([session_id])
+
+    def evict_idle(self):
+        """Drop every session idle for longer than idle_timeout. Returns the number evicted."""
+        cutoff = time.time() - self.idle_timeout
+        with self._lock:
+            idle = [session_id for session_id, session in self._sessions.items() if session.last_active < cutoff]
+            for session_id in idle:
+                self._remove(session_id)
+            self.evictions += len(idle)
+        self._notify(idle)
+        return len(idle)
+
+    def _remove(self, session_id):
+        self._sessions.pop(session_id)
+        self._bytes -= self._sizes.pop(session_id)
+
+    def _evict(self):
+        cutoff = time.time() - self.idle_timeout
+        evicted = []
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            over_limit = len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes
+            if not over_limit and session.last_active >= cutoff:
+                break
+            self._remove(session_id)
+            self.evictions += 1
+            evicted.append(session_id)
+        return evicted
+
+    def _notify(self, session_ids):
+        if self.on_evict is None:
+            return
+        for session_id in session_ids:
+            try:
+                self.on_evict(session_id)
+            except Exception as e:
+                logger.error(f"Error in session eviction callback for {session_id}: {str(e)}")
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+
+class SQLiteSessionStore:
+    """
+    Persistent session store backed by a local SQLite file.
+
+    Every save is written through to SQLite, so sessions survive restarts and are
+    shared by all worker processes on the host. Active sessions are also kept in
+    an InMemorySessionStore; evicted sessions are rehydrated from SQLite lazily
+    the next time they are requested. Each save bumps the row's version, and a
+    cached session is only served while its version matches the row, so a
+    session last handled by another worker is reloaded instead of served stale.
+    When two workers save the same session concurrently, the last save wins.
+    """
+
+    def __init__(self, path, cache=None, max_age=7 * 86400):
+        """
+        Args:
+            path (str): SQLite database file
+            cache (InMemorySessionStore): In-memory tier; a default one is created if omitted
+            max_age (float): Seconds after which idle sessions are purged from disk
+        """
+        self.path = path
+        self.cache = cache if cache is not None else InMemorySessionStore()
+        self.max_age = max_age
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS chat_sessions (
+                    session_id TEXT PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    last_active REAL NOT NULL,
+                    version INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(chat_sessions)")]
+            if "version" not in columns:
+                conn.execute("ALTER TABLE chat_sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_chat_sessions_last_active ON chat_sessions (last_active)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def create(self):
+        """Create, store and return a new session."""
+        session = ChatSession()
+        self.save(session)
+        return session
+
+    def get(self, session_id):
+        """Return the session from memory if it is current, rehydrating it from disk otherwise."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT version FROM chat_sessions WHERE session_id = ?", (session_id,)).fetchone()
+        cached = self.cache.get(session_id)
+        if row is None:
+            # Deleted or purged by another worker
+            if cached is not None:
+                self.cache.delete(session_id)
+            return None
+        if cached is not None and cached.version == row[0]:
+            return cached
+
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT state, version FROM chat_sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        session = ChatSession.from_dict(json.loads(row[0]))
+        session.version = row[1]
+        logger.debug(f"Rehydrated session {session_id} at version {session.version}")
+        self.cache.save(session)
+        return session
+
+    def save(self, session):
+        """Write the session through to disk and keep it in memory."""
+        self.cache.save(session)
+        with self._connect() as conn:
+            conn.execute("""
+                INSERT INTO chat_sessions (session_id, state, last_active, version) VALUES (?, ?, ?, 1)
+                ON CONFLICT (session_id) DO UPDATE SET
+                    state = excluded.state, last_active = excluded.last_active, version = chat_sessions.version + 1
+            """, (session.session_id, json.dumps(session.to_dict()), session.last_active))
+            # Same transaction as the write, so this is the version just written
+            session.version = conn.execute(
+                "SELECT version FROM chat_sessions WHERE session_id = ?", (session.session_id,)).fetchone()[0]
+
+    def delete(self, session_id):
+        """Remove a session from memory and disk."""
+        self.cache.delete(session_id)
+        with self._connect() as conn:
+            conn.execute("DELETE FROM chat_sessions WHERE session_id = ?", (session_id,))
+
+    @property
+    def on_evict(self):
+        """Eviction callback of the in-memory tier; sessions stay on disk when evicted from memory."""
+        return self.cache.on_evict
+
+    @on_evict.setter
+    def on_evict(self, callback):
+        self.cache.on_evict = callback
+
+    def purge_expired(self):
+        """Delete sessions idle for longer than max_age from disk. Returns the number purged."""
+        with self._connect() as conn:
+            cursor = conn.execute("DELETE FROM chat_sessions WHERE last_active < ?", (time.time() - self.max_age,))
+        return cursor.rowcount
+
+    def __len__(self):
+        return len(self.cache)
+
+
+def create_session_store():
+    """
+    Build the session store selected by CHAT_SESSION_STORE ("memory" or "sqlite").
+
+    The in-memory tier is bounded by CHAT_SESSION_MAX, CHAT_SESSION_MAX_BYTES and
+    CHAT_SESSION_IDLE_TIMEOUT. The SQLite file is CHAT_SESSION_STORE_PATH, and sessions
+    idle for CHAT_SESSION_STORE_MAX_AGE seconds (default 7 days) are purged from it.
+    """
+    cache = InMemorySessionStore(
+        max_sessions=int(os.getenv("CHAT_SESSION_MAX", "10000")),
+        max_bytes=int(os.getenv("CHAT_SESSION_MAX_BYTES", str(64 * 1024 * 1024))),
+        idle_timeout=float(os.getenv("CHAT_SESSION_IDLE_TIMEOUT", "3600")),
+    )
+    backend = os.getenv("CHAT_SESSION_STORE", "memory").lower()
+    if backend == "memory":
+        return cache
+    if backend == "sqlite":
+        return SQLiteSessionStore(os.getenv("CHAT_SESSION_STORE_PATH", "sessions.db"), cache=cache,
+                                  max_age=float(os.getenv("CHAT_SESSION_STORE_MAX_AGE", str(7 * 86400))))
+    raise ValueError(f"Unknown CHAT_SESSION_STORE backend: {backend}")
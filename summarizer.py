@@ -0,0 +1,156 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import logging
+from chat_roles import ChatRole
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_INSTRUCTIONS = """You maintain a running summary of a conversation between a commercial loan customer and a loan pricing assistant.
+Merge the existing summary with the new messages into one concise summary.
+Always keep every concrete detail the customer gave: loan products, amounts, maturities, rates, dates and any open questions.
+Drop greetings and repeated explanations. Reply with the summary only."""
+
+
+class ConversationSummarizer:
+    """
+    Compress older conversation turns into a running summary in the background.
+
+    Once the history goes over threshold_tokens, everything except the newest
+    keep_recent_messages is summarized on a worker thread, merged with the
+    existing summary. The next apply() call swaps the summarized messages for the
+    summary, so prompt size per turn stays roughly constant. Summaries are
+    persisted as chat_messages rows with the summary role.
+    """
+
+    def __init__(self, openai_client, counter, db_manager=None, threshold_tokens=3000, keep_recent_messages=6,
+                 deployment=None, max_summary_tokens=400):
+        """
+        Args:
+            openai_client: Azure OpenAI client used for the summary requests
+            counter (TokenCounter): Token counter used to measure the history
+            db_manager (DatabaseManager): Where summaries are persisted; optional
+            threshold_tokens (int): History size that triggers summarization
+            keep_recent_messages (int): Newest messages that are never summarized
+            deployment (str): Model deployment; defaults to AZURE_OPENAI_DEPLOYMENT_NAME
+            max_summary_tokens (int): Upper bound on the summary length
+        """
+        self.openai_client = openai_client
+        self.counter = counter
+        self.db_manager = db_manager
+        self.threshold_tokens = threshold_tokens
+        self.keep_recent_messages = keep_recent_messages
+        self.deployment = deployment or os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME")
+        self.max_summary_tokens = max_summary_tokens
+        self.summary = ""
+        self._lock = threading.Lock()
+        self._future = None
+        # id() -> message being summarized; holding the message keeps its id() from being reused
+        self._pending = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-summary")
+
+    @classmethod
+    def from_env(cls, openai_client, counter, db_manager=None):
+        """
+        Build a summarizer from CHAT_SUMMARY_THRESHOLD_TOKENS and CHAT_SUMMARY_KEEP_MESSAGES.
+
+        Returns None when the threshold is 0.
+        """
+        threshold = int(os.getenv("CHAT_SUMMARY_THRESHOLD_TOKENS", "3000"))
+        if threshold <= 0:
+            return None
+        return cls(
+            openai_client,
+            counter,
+            db_manager=db_manager,
+            threshold_tokens=threshold,
+            keep_recent_messages=int(os.getenv("CHAT_SUMMARY_KEEP_MESSAGES", "6")),
+        )
+
+    def restore(self, summary):
+        """Resume from a previously persisted summary."""
+        with self._lock:
+            self.summary = summary or ""
+
+    def summary_message(self):
+        """Return the summary as a system message, or None if there is no summary yet."""
+        with self._lock:
+            summary = self.summary
+        if not summary:
+            return None
+        return {"role": "system", "content": f"Summary of the earlier conversation: {summary}"}
+
+    def apply(self, history):
+        """
+        Fold a finished background summary into the history.
+
+        Returns:
+            list: History without the messages that are now covered by the summary
+        """
+        with self._lock:
+            future = self._future
+            if future is None or not future.done():
+                return history
+            self._future = None
+            summarized = self._pending
+            self._pending = {}
+
+        try:
+            new_summary = future.result()
+        except Exception as e:
+            logger.error(f"Error summarizing conversation: {str(e)}")
+            return history
+
+        with self._lock:
+            self.summary = new_summary
+        # Messages are matched by identity, so trimming the history meanwhile is harmless
+        return [message for message in history if summarized.get(id(message)) is not message]
+
+    def maybe_summarize(self, history, conversation_id=None):
+        """
+        Start a background summary if the history is over the threshold.
+
+        Args:
+            history (list): Current conversation history
+            conversation_id (str): Conversation the summary is persisted under
+        """
+        with self._lock:
+            if self._future is not None:
+                return
+        if self.counter.count_messages(history) < self.threshold_tokens:
+            return
+
+        older = history[:-self.keep_recent_messages] if self.keep_recent_messages else list(history)
+        # Keep question/answer pairs together in the recent window
+        while older and older[-1]["role"] == "user":
+            older = older[:-1]
+        if not older:
+            return
+
+        with self._lock:
+            self._pending = {id(message): message for message in older}
+            self._future = self._executor.submit(self._summarize, self.summary, list(older), conversation_id)
+        logger.info(f"Summarizing {len(older)} older messages in the background")
+
+    def close(self):
+        """Wait for an in-flight summary and stop the worker."""
+        self._executor.shutdown(wait=True)
+
+    def _summarize(self, previous_summary, messages, conversation_id):
+        transcript = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+        prompt = f"Existing summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"
+        response = self.openai_client.chat.completions.create(
+            model=self.deployment,
+            messages=[
+                {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+                {"role": "user", "content": prompt},
+            ],
+            temperature=0.0,
+            max_tokens=self.max_summary_tokens,
+        )
+        summary = response.choices[0].message.content.strip()
+        if self.db_manager is not None:
+            self.db_manager.log_message(summary, ChatRole.SUMMARY, self.db_manager.sequences.allocate(conversation_id),
+                                        conversation_id=conversation_id)
+        logger.info(f"Conversation summary updated ({self.counter.count_text(summary)} tokens)")
+        return summary
@@ -0,0 +1,238 @@
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from a cache hit up to a slow completion
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Cumulative latency histogram per label value, rendered in Prometheus text format."""
+
+    def __init__(self, name, help_text, label, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, seconds):
+        """Record one observation."""
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series["counts"][index] += 1
+                    break
+            series["sum"] += seconds
+            series["count"] += 1
+
+    def render(self):
+        """Return the histogram in Prometheus text exposition format."""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_value, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series["counts"]):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{{{self.label}="{label_value}",le="{bound:g}"}} {cumulative}')
+                lines.append(f'{self.name}_bucket{{{self.label}="{label_value}",le="+Inf"}} {series["count"]}')
+                lines.append(f'{self.name}_sum{{{self.label}="{label_value}"}} {series["sum"]:.6f}')
+                lines.append(f'{self.name}_count{{{self.label}="{label_value}"}} {series["count"]}')
+        return "\n".join(lines)
+
+
+class TurnTrace:
+    """
+    Timing spans for one chat turn.
+
+    Every span carries the turn ID, so a slow turn can be taken apart afterwards
+    from the spans file. Spans may be recorded from worker threads (e.g. the
+    background message inserts).
+    """
+
+    def __init__(self, telemetry, conversation_id=None):
+        self.telemetry = telemetry
+        self.turn_id = uuid.uuid4().hex[:16]
+        self.conversation_id = conversation_id
+        self.timings = {}
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage, **attributes):
+        """Time the enclosed block as one stage of the turn."""
+        start = time.perf_counter()
+        started_at = time.time()
+        error = None
+        try:
+            yield attributes
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.record(stage, time.perf_counter() - start, started_at=started_at, error=error, **attributes)
+
+    def record(self, stage, seconds, started_at=None, error=None, **attributes):
+        """Record a stage that was timed elsewhere."""
+        with self._lock:
+            self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+        self.telemetry.record_span({
+            "turn_id": self.turn_id,
+            "conversation_id": self.conversation_id,
+            "stage": stage,
+            "start": round(started_at if started_at is not None else time.time() - seconds, 6),
+            "duration_ms": round(seconds * 1000, 3),
+            "error": error,
+            **attributes,
+        })
+
+    def finish(self):
+        """
+        Record the whole turn as the "turn" span and log its stage breakdown.
+
+        Returns:
+            dict: Seconds spent in each stage so far
+        """
+        self.record("turn", time.perf_counter() - self._start)
+        with self._lock:
+            timings = dict(self.timings)
+        logger.info(f"Turn {self.turn_id} timings (ms): " + ", ".join(
+            f"{stage}={seconds * 1000:.1f}" for stage, seconds in timings.items()))
+        return timings
+
+
+class Telemetry:
+    """
+    Per-stage latency histograms and turn spans for the chat pipeline.
+
+    Histograms are rewritten in Prometheus text format to metrics_path every
+    export_interval seconds (for node_exporter's textfile collector or a quick
+    look), and spans are appended to spans_path as JSON lines. Exports run on a
+    background thread; recording a span only takes a lock and appends to a buffer.
+    """
+
+    def __init__(self, metrics_path="logs/metrics.prom", spans_path="logs/spans.jsonl", export_interval=15.0,
+                 max_buffered_spans=10000):
+        """
+        Args:
+            metrics_path (str): Prometheus text file; None disables the file export
+            spans_path (str): JSON lines file for spans; None disables span export
+            export_interval (float): Seconds between exports
+            max_buffered_spans (int): Spans kept between exports; older ones are dropped
+        """
+        self.metrics_path = metrics_path
+        self.spans_path = spans_path
+        self.export_interval = export_interval
+        self.stage_duration = Histogram(
+            "chat_stage_duration_seconds", "Duration of chat pipeline stages.", "stage")
+        self.dropped_spans = 0
+        self._spans = deque()
+        self._max_buffered_spans = max_buffered_spans
+        self._errors = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_env(cls):
+        """Build telemetry from CHAT_METRICS_FILE, CHAT_SPANS_FILE and CHAT_METRICS_INTERVAL."""
+        return cls(
+            metrics_path=os.getenv("CHAT_METRICS_FILE", "logs/metrics.prom") or None,
+            spans_path=os.getenv("CHAT_SPANS_FILE", "logs/spans.jsonl") or None,
+            export_interval=float(os.getenv("CHAT_METRICS_INTERVAL", "15")),
+        )
+
+    def start_turn(self, conversation_id=None):
+        """Begin tracing a chat turn."""
+        return TurnTrace(self, conversation_id)
+
+    def record_span(self, span):
+        """Add a finished span to the histograms and the export buffer."""
+        self.stage_duration.observe(span["stage"], span["duration_ms"] / 1000)
+        with self._lock:
+            if span.get("error"):
+                self._errors[span["stage"]] = self._errors.get(span["stage"], 0) + 1
+            if self.spans_path is None:
+                return
+            if len(self._spans) >= self._max_buffered_spans:
+                self._spans.popleft()
+                self.dropped_spans += 1
+            self._spans.append(span)
+
+    def render_prometheus(self):
+        """Return all metrics in Prometheus text exposition format."""
+        lines = [self.stage_duration.render(),
+                 "# HELP chat_stage_errors_total Chat pipeline stages that raised an exception.",
+                 "# TYPE chat_stage_errors_total counter"]
+        with self._lock:
+            errors = sorted(self._errors.items())
+            dropped = self.dropped_spans
+        lines.extend(f'chat_stage_errors_total{{stage="{stage}"}} {count}' for stage, count in errors)
+        lines.append("# HELP chat_spans_dropped_total Spans dropped because the export buffer was full.")
+        lines.append("# TYPE chat_spans_dropped_total counter")
+        lines.append(f"chat_spans_dropped_total {dropped}")
+        return "\n".join(lines) + "\n"
+
+    def export(self):
+        """Write the metrics file and append buffered spans."""
+        with self._lock:
+            spans = list(self._spans)
+            self._spans.clear()
+        try:
+            if spans:
+                with open(self.spans_path, "a", encoding="utf-8") as f:
+                    f.writelines(json.dumps(span) + "\n" for span in spans)
+            if self.metrics_path is not None:
+                # Write then rename so scrapers never read a half-written file
+                temp_path = f"{self.metrics_path}.tmp"
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    f.write(self.render_prometheus())
+                os.replace(temp_path, self.metrics_path)
+        except OSError as e:
+            logger.error(f"Error exporting telemetry: {str(e)}")
+
+    def start(self):
+        """Start exporting periodically in the background."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="telemetry-export", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        """Stop the exporter and write out everything recorded so far."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.export()
+
+    def _run(self):
+        while not self._stop.wait(self.export_interval):
+            self.export()
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def get_telemetry():
+    """Return the process-wide Telemetry instance, creating and starting it on first use."""
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = Telemetry.from_env().start()
+                atexit.register(_default.close)
+    return _default
@@ -0,0 +1,97 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from chroma_client import ChromaDBClient
+from retrieval_cache import RetrievalCache
+
+
+class StubChromaHandler(BaseHTTPRequestHandler):
+    """ChromaDB service stand-in whose behaviour is set through server.state."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._send(200, [{"name": "loandocuments", "id": self.server.state["collection_id"]}])
+
+    def do_POST(self):
+        state = self.server.state
+        state["queries"] += 1
+        state["connections"].add(self.client_address)
+        if state["failures"] > 0:
+            state["failures"] -= 1
+            self._send(503, {"error": "unavailable"})
+            return
+        if state["delay"]:
+            state["release"].wait(state["delay"])
+        self._send(200, [{"content": f"document {state['queries']}"}])
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubChromaHandler)
+    server.daemon_threads = True
+    server.state = {"collection_id": "v1", "queries": 0, "connections": set(), "failures": 0, "delay": 0,
+                    "release": threading.Event()}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("CHROMA_SERVICE_HOST", "http://127.0.0.1")
+    monkeypatch.setenv("CHROMA_SERVICE_PORT", str(server.server_address[1]))
+    yield server
+    server.state["release"].set()
+    server.shutdown()
+    server.server_close()
+
+
+def test_recreated_collection_clears_the_cache(server, monkeypatch):
+    monkeypatch.setenv("CHROMA_CACHE_CHECK_INTERVAL", "3600")
+    client = ChromaDBClient(cache=RetrievalCache())
+    assert client.connect()
+
+    assert client.search("loan rates") == ["document 1"]
+    assert client.search("loan rates") == ["document 1"]
+
+    server.state["collection_id"] = "v2"
+    assert client.check_collection()
+    assert client.search("loan rates") == ["document 2"]
+    client.close()
+
+
+def test_queries_reuse_one_connection(server):
+    client = ChromaDBClient()
+
+    for _ in range(5):
+        assert client.search("loan rates") != []
+
+    assert server.state["queries"] == 5
+    assert len(server.state["connections"]) == 1
+    client.close()
+
+
+def test_unavailable_service_is_retried(server):
+    server.state["failures"] = 2
+    client = ChromaDBClient(max_retries=3, backoff_factor=0)
+
+    assert client.search("loan rates") == ["document 3"]
+    assert server.state["queries"] == 3
+    client.close()
+
+
+def test_search_returns_nothing_after_read_timeout(server):
+    server.state["delay"] = 5
+    client = ChromaDBClient(read_timeout=0.2, max_retries=0)
+
+    assert client.search("loan rates") == []
+    client.close()
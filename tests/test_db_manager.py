@@ -0,0 +1,18 @@
+from chat_roles import ChatRole
+from db_manager import DatabaseManager
+
+
+def test_in_memory_sqlite_is_accepted():
+    db_manager = DatabaseManager("sqlite://", "test")
+    db_manager.migrate()
+
+    assert db_manager.log_message("hello", ChatRole.USER, db_manager.sequences.allocate("c"), conversation_id="c")
+    assert db_manager.get_message_count() == 1
+    db_manager.close()
+
+
+def test_pool_settings_apply_to_queue_pools(tmp_path):
+    db_manager = DatabaseManager(f"sqlite:///{tmp_path / 'chat.db'}", "test", pool_size=3, max_overflow=2)
+
+    assert db_manager.engine.pool.size() == 3
+    db_manager.close()
@@ -0,0 +1,21 @@
+from message_writer import WriteBehindWriter
+
+
+def test_failed_batch_is_retried_row_by_row():
+    written = []
+
+    def flush(rows):
+        if any(row == "bad" for row in rows):
+            return False
+        written.extend(rows)
+        return True
+
+    writer = WriteBehindWriter(flush, flush_size=4, flush_interval=60)
+    for row in ("a", "bad", "b", "c"):
+        writer.submit(row)
+    writer.close()
+
+    assert written == ["a", "b", "c"]
+    assert writer.stats["flushed"] == 3
+    assert writer.stats["failed"] == 1
+    assert writer.stats["split_batches"] == 1
@@ -0,0 +1,131 @@
+import threading
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from chat_roles import ChatRole
+from db_manager import DatabaseManager
+
+CONVERSATION_ID = "concurrent-conversation"
+
+
+@pytest.fixture
+def db_manager(tmp_path):
+    manager = DatabaseManager(f"sqlite:///{tmp_path / 'chat.db'}", "test")
+    manager.migrate()
+    yield manager
+    manager.close()
+
+
+def sequences(db_manager, conversation_id=CONVERSATION_ID):
+    return [message.sequence for message in db_manager.get_transcript(conversation_id)]
+
+
+def run_threads(count, target):
+    start = threading.Barrier(count)
+    errors = []
+
+    def run(index):
+        start.wait()
+        try:
+            target(index)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+
+def test_concurrent_turns_get_unique_gap_free_sequences(db_manager):
+    turns_per_thread = 10
+
+    def turn(index):
+        for turn_number in range(turns_per_thread):
+            for role in (ChatRole.USER, ChatRole.ASSISTANT):
+                sequence = db_manager.sequences.allocate(CONVERSATION_ID)
+                assert db_manager.log_message(f"{index}-{turn_number}", role, sequence,
+                                              conversation_id=CONVERSATION_ID)
+
+    run_threads(8, turn)
+
+    assert sequences(db_manager) == list(range(8 * turns_per_thread * 2))
+
+
+def test_resumed_conversation_continues_after_stored_maximum(db_manager, tmp_path):
+    for _ in range(3):
+        db_manager.log_message("earlier", ChatRole.USER, db_manager.sequences.allocate(CONVERSATION_ID),
+                               conversation_id=CONVERSATION_ID)
+
+    # A new process starts with empty counters and seeds from MAX(sequence)
+    resumed = DatabaseManager(str(db_manager.engine.url), "test")
+    run_threads(4, lambda index: resumed.log_message(
+        "resumed", ChatRole.USER, resumed.sequences.allocate(CONVERSATION_ID), conversation_id=CONVERSATION_ID))
+    resumed.close()
+
+    assert sequences(db_manager) == list(range(7))
+
+
+def test_unique_index_rejects_duplicate_sequence(db_manager):
+    row = {"application_name": "test", "chat_role": "user", "sequence": 0, "message_content": "hello",
+           "conversation_id": CONVERSATION_ID}
+    insert = text("""
+        INSERT INTO chat_messages (application_name, chat_role, sequence, message_content, conversation_id)
+        VALUES (:application_name, :chat_role, :sequence, :message_content, :conversation_id)
+    """)
+    with db_manager.engine.begin() as conn:
+        conn.execute(insert, row)
+    with pytest.raises(IntegrityError):
+        with db_manager.engine.begin() as conn:
+            conn.execute(insert, row)
+
+
+def test_clashing_writers_are_resequenced_instead_of_dropped(db_manager):
+    # Two processes serving the same conversation each seed their own counter
+    other = DatabaseManager(str(db_manager.engine.url), "test")
+    pending = [db_manager.sequences.allocate(CONVERSATION_ID) for _ in range(3)]
+    int(pending[0])
+    for _ in range(2):
+        assert other.log_message("other", ChatRole.USER, other.sequences.allocate(CONVERSATION_ID),
+                                 conversation_id=CONVERSATION_ID)
+    other.close()
+
+    for sequence in pending:
+        assert db_manager.log_message("mine", ChatRole.USER, sequence, conversation_id=CONVERSATION_ID)
+
+    assert sequences(db_manager) == list(range(5))
+
+
+def test_partitioned_layout_resequences_clashing_writers(tmp_path):
+    url = f"sqlite:///{tmp_path / 'partitioned.db'}"
+    first = DatabaseManager(url, "test", storage_layout="partitioned")
+    first.migrate()
+    second = DatabaseManager(url, "test", storage_layout="partitioned")
+
+    # Both processes seed their counters before either has written
+    pending = [first.sequences.allocate(CONVERSATION_ID) for _ in range(3)]
+    int(pending[0])
+    others = [second.sequences.allocate(CONVERSATION_ID) for _ in range(3)]
+    int(others[0])
+    for sequence in others:
+        assert second.log_message("other", ChatRole.USER, sequence, conversation_id=CONVERSATION_ID)
+    for sequence in pending:
+        assert first.log_message("mine", ChatRole.USER, sequence, conversation_id=CONVERSATION_ID)
+    second.close()
+
+    assert sequences(first) == list(range(6))
+    first.close()
+
+
+def test_allocation_does_not_touch_the_database(tmp_path):
+    unreachable = DatabaseManager(f"sqlite:///{tmp_path / 'missing' / 'chat.db'}", "test")
+
+    sequence = unreachable.sequences.allocate(CONVERSATION_ID)
+
+    # The failure surfaces when the row is written, as a lost row rather than an exception
+    assert unreachable.log_message("hello", ChatRole.USER, sequence, conversation_id=CONVERSATION_ID) is False
+    unreachable.close()
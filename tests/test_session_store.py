@@ -0,0 +1,17 @@
+from session_store import SQLiteSessionStore
+
+
+def test_session_saved_by_another_worker_is_reloaded(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    first = SQLiteSessionStore(path)
+    second = SQLiteSessionStore(path)
+    session_id = first.create().session_id
+
+    session = second.get(session_id)
+    session.conversation_history.append({"role": "user", "content": "handled by the second worker"})
+    second.save(session)
+
+    assert first.get(session_id).conversation_history == session.conversation_history
+
+    second.delete(session_id)
+    assert first.get(session_id) is None
@@ -0,0 +1,128 @@
+import os
+import threading
+from collections import OrderedDict
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Per-message framing overhead used by the chat completions format
+TOKENS_PER_MESSAGE = 4
+# Every reply is primed with <|start|>assistant<|message|>
+TOKENS_PER_REPLY = 3
+
+
+class TokenCounter:
+    """
+    Count chat message tokens with tiktoken and cache the count for each message.
+
+    Without tiktoken installed, counts fall back to roughly four characters per token.
+    The tokenizer is loaded on the first count, which keeps it off the startup path.
+    """
+
+    def __init__(self, encoding_name="cl100k_base", cache_size=4096):
+        self.encoding_name = encoding_name
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._encoding = None
+        self._encoding_loaded = False
+        self._encoding_lock = threading.Lock()
+
+    def _get_encoding(self):
+        if self._encoding_loaded:
+            return self._encoding
+        with self._encoding_lock:
+            if not self._encoding_loaded:
+                try:
+                    import tiktoken
+                    self._encoding = tiktoken.get_encoding(self.encoding_name)
+                except ImportError:
+                    logger.warning("tiktoken is not installed, estimating token counts")
+                except Exception as e:
+                    logger.warning(f"Could not load tokenizer {self.encoding_name}, estimating token counts: {str(e)}")
+                self._encoding_loaded = True
+        return self._encoding
+
+    def count_text(self, text):
+        """Return the number of tokens in a piece of text."""
+        encoding = self._get_encoding()
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+        return (len(text) + 3) // 4
+
+    def count_message(self, message):
+        """Return the tokens a single chat message contributes to a request."""
+        key = (message["role"], message["content"])
+        with self._lock:
+            count = self._cache.get(key)
+            if count is not None:
+                self._cache.move_to_end(key)
+                return count
+
+        count = TOKENS_PER_MESSAGE + self.count_text(message["role"]) + self.count_text(message["content"])
+        with self._lock:
+            self._cache[key] = count
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return count
+
+    def count_messages(self, messages):
+        """Return the prompt tokens for a full message list."""
+        return sum(self.count_message(message) for message in messages) + TOKENS_PER_REPLY
+
+
+class TokenBudget:
+    """Fit the system prompt, context and conversation history into an input token budget."""
+
+    def __init__(self, max_input_tokens=6000, counter=None):
+        """
+        Args:
+            max_input_tokens (int): Maximum prompt tokens per request
+            counter (TokenCounter): Token counter; a new one is created if omitted
+        """
+        self.max_input_tokens = max_input_tokens
+        self.counter = counter or TokenCounter()
+
+    @classmethod
+    def from_env(cls):
+        """Build a budget from CHAT_INPUT_TOKEN_BUDGET and CHAT_TOKENIZER_ENCODING."""
+        return cls(
+            max_input_tokens=int(os.getenv("CHAT_INPUT_TOKEN_BUDGET", "6000")),
+            counter=TokenCounter(os.getenv("CHAT_TOKENIZER_ENCODING", "cl100k_base")),
+        )
+
+    def fit_history(self, fixed_messages, history):
+        """
+        Drop the oldest history until it fits next to the fixed messages.
+
+        Args:
+            fixed_messages (list): Messages that are always sent (system prompt, context, user input)
+            history (list): Prior user/assistant messages, oldest first
+
+        Returns:
+            list: The newest part of history that fits in the remaining budget
+        """
+        remaining = self.max_input_tokens - self.counter.count_messages(fixed_messages)
+        return self._newest_within(history, remaining)
+
+    def trim_history(self, history):
+        """Bound stored history to what could ever be sent under this budget."""
+        return self._newest_within(history, self.max_input_tokens)
+
+    def _newest_within(self, history, available):
+        kept = 0
+        used = 0
+        for message in reversed(history):
+            tokens = self.counter.count_message(message)
+            if used + tokens > available:
+                break
+            used += tokens
+            kept += 1
+
+        trimmed = history[len(history) - kept:] if kept else []
+        # Never start the window with an assistant reply whose question was dropped
+        while trimmed and trimmed[0]["role"] == "assistant":
+            trimmed = trimmed[1:]
+        if len(trimmed) < len(history):
+            logger.debug(f"Trimmed history from {len(history)} to {len(trimmed)} messages")
+        return trimmed